@@ -1,16 +1,19 @@
+import asyncio
 import datetime
 import json
+import logging
+import time
 import traceback
-from typing import Dict, List
+from typing import Dict, List, Optional
 from urllib import request
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.wsgi import WSGIMiddleware
 from pydantic import BaseModel
 from fastapi.responses import HTMLResponse, PlainTextResponse
 from plotly.utils import PlotlyJSONEncoder
-from fastapi.responses import JSONResponse
-from chatbot import process_chat_query
+from fastapi.responses import JSONResponse, StreamingResponse
+from chatbot import process_chat_query, stream_chat_query
 from pathlib import Path
 import shutil
 import pandas as pd
@@ -18,12 +21,23 @@ import numpy as np
 import os
 
 from dashboard import get_individual_chart_data
-from chatbot_manufacturing import process_manufacturing_chat
+from chatbot_manufacturing import process_manufacturing_chat, stream_manufacturing_chat
 from ocr_api import process_pdf_bytes
 from new_kb import generate_report
+import llm_client
+from columnar_cache import build_columnar, parse_source, write_columnar
+from catalog_store import get_store
+from config import CATALOG_BOM_CSV, CATALOG_PO_CSV, CATALOG_VENDOR_CSV
+from response_cache import cache_stats, file_version
+from figure_cache import figure_cache_stats
+from coalesce import coalesce, content_key, coalesce_stats
+from tracing import render_metrics, recent_traces, record_ttft
+from sessions import get_session_store, new_session_id, DEFAULT_SESSION, SESSION_HEADER, SESSION_COOKIE
 # from db import run_dash
 from db import app_d
 
+log = logging.getLogger("app")
+
 app = FastAPI()
 app.mount("/xforia-coast/dashboard", WSGIMiddleware(app_d.server))
 origins = [ 
@@ -43,67 +57,168 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("shutdown")
+async def close_llm_client():
+    await llm_client.aclose()
+
 UPLOAD_FOLDER = Path("./uploads")
 UPLOAD_FOLDER.mkdir(exist_ok=True)
 file_path = ""
- 
-LATEST_RESPONSE = {"response": ""}
-MANUFACTURING_CONTEXT_FILE = None
+
+# Active dataset, context report, history and latest response live in the per-session store
+# (see sessions.py), so concurrent users and multiple workers do not share them.
+sessions = get_session_store()
+
+
+def get_session_id(http_request: Request) -> str:
+    """Session of the request: `X-Session-Id` header, `coast_session` cookie, or the shared default session."""
+    return http_request.headers.get(SESSION_HEADER) or http_request.cookies.get(SESSION_COOKIE) or DEFAULT_SESSION
+
+
+@app.post("/session")
+async def create_session():
+    """Creates a new session id; send it back in the `X-Session-Id` header."""
+    return {"session_id": new_session_id()}
 
 # run_dash(debug=True,port=8051)
 
 @app.post("/upload_excel/")
 async def upload_excel(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
     organization_name: str = Form(...),
-    owner_name: str = Form(...)
+    owner_name: str = Form(...),
+    session_id: str = Depends(get_session_id),
     ):
     file_path = UPLOAD_FOLDER / file.filename
     with open(file_path, "wb") as f:
         shutil.copyfileobj(file.file, f)
 
-    global EXCEL_FILE 
-    EXCEL_FILE = file_path
+    sessions.update(session_id, excel_file=str(file_path))
 
     # Convert Excel -> CSV (for chatbot) 
-    df = pd.read_excel(file_path)
+    df = parse_source(file_path)
     csv_path = file_path.with_suffix(".csv")
     df.to_csv(csv_path, index=False)
-    return {"status": "success", "file_path": str(file_path)}
+
+    # Columnar sidecars so readers memory-map instead of re-parsing the workbook.
+    # Each sidecar holds what parsing its own source gives (read_table's fallback), so the
+    # CSV's is built from the CSV text, not from the workbook frame (dates, mixed columns differ).
+    background_tasks.add_task(write_columnar, df, file_path)
+    background_tasks.add_task(build_columnar, csv_path)
+    return {"status": "success", "file_path": str(file_path), "session_id": session_id}
 
 class ChatRequest(BaseModel):
     query: str
     # conversation_history will be a list of dictionaries,
     # e.g., [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello!"}]
-    conversation_history: List[Dict[str, str]] = [] # Default to empty list if not provided
+    # When omitted, the history stored in the session from its last exchange is used
+    # (only for an explicit session; anonymous requests share the default session and start empty).
+    conversation_history: Optional[List[Dict[str, str]]] = None
+    use_cache: bool = True  # False bypasses the response cache for this request
+
+
+def _request_history(request: ChatRequest, state: dict, chat: str, session_id: str) -> List[Dict[str, str]]:
+    """
+    History sent with the request, or the one stored in the session for `chat` ("demo" / "manufacturing").
+
+    The stored history is only used when the client named its session (header or cookie): anonymous
+    clients all fall into DEFAULT_SESSION, and must not get each other's conversations.
+    """
+    if request.conversation_history is not None:
+        return list(request.conversation_history)
+    if session_id == DEFAULT_SESSION:
+        return []
+    return list(state[f"{chat}_history"])
+
+
+def _summary_session(session_id: str) -> str | None:
+    """Session key of the history summary cache (None for anonymous requests, which share DEFAULT_SESSION)."""
+    return None if session_id == DEFAULT_SESSION else session_id
 
 
 @app.post("/chat/demo")
-async def chat(request:ChatRequest):
-    global LATEST_RESPONSE
+async def chat(request:ChatRequest, session_id: str = Depends(get_session_id)):
+    state = sessions.get(session_id)
 
-    # Load the most recent uploaded CSV
-    files = [f for f in os.listdir(UPLOAD_FOLDER) if f.endswith(".csv")]
-    if not files:
+    # Use the dataset uploaded in this session
+    excel_file = state["excel_file"]
+    if not excel_file:
         return {"error": "No patient data uploaded yet."}
     #file_path = os.path.join(UPLOAD_FOLDER, files[-1])
 
-    current_conversation_history = list(request.conversation_history) 
+    current_conversation_history = _request_history(request, state, "demo", session_id)
     current_conversation_history.append({"role": "user", "content": request.query})
-    print(EXCEL_FILE)
+    log.info(f"Demo chat over {excel_file}")
     # Get chatbot response, passing the full conversation history from the request
-    response = process_chat_query(request.query, EXCEL_FILE, current_conversation_history)
+    response = await process_chat_query(request.query, excel_file, current_conversation_history, use_cache=request.use_cache,
+                                        session_id=_summary_session(session_id))
 
-    #LATEST_RESPONSE["response"] = response 
     current_conversation_history.append({"role": "assistant", "content": response})
-    LATEST_RESPONSE["response"] = response
-    
-    return LATEST_RESPONSE
+    latest_response = {"response": response}
+    sessions.update(session_id, latest_response=latest_response, demo_history=current_conversation_history)
+
+    return latest_response
+
+
+def _sse(payload: dict, event: str = None) -> str:
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(payload)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def _stream_chat(tokens, conversation_history: List[Dict[str, str]], started: float, session_id: str, chat: str):
+    """
+    Forwards response tokens as server-sent events (`data: {"token": ...}`) and,
+    once the stream ends, records the assembled response and updated history
+    and sends them in a final `done` event. Time-to-first-token is tracked here.
+    """
+    parts, ttft_ms = [], None
+    async for token in tokens:
+        if ttft_ms is None:
+            ttft_ms = (time.perf_counter() - started) * 1000
+            record_ttft(chat, ttft_ms / 1000)
+        parts.append(token)
+        yield _sse({"token": token})
+
+    response = "".join(parts).strip()
+    conversation_history.append({"role": "assistant", "content": response})
+    sessions.update(
+        session_id,
+        latest_response={"response": response, "conversation_history": conversation_history, "ttft_ms": ttft_ms},
+        **{f"{chat}_history": conversation_history},
+    )
+    yield _sse({
+        "response": response,
+        "conversation_history": conversation_history,
+        "ttft_ms": ttft_ms,
+        "total_ms": (time.perf_counter() - started) * 1000,
+    }, event="done")
+
+
+@app.post("/chat/demo/stream")
+async def chat_stream(request: ChatRequest, session_id: str = Depends(get_session_id)):
+    """Streaming variant of /chat/demo (text/event-stream)."""
+    started = time.perf_counter()
+    state = sessions.get(session_id)
+    excel_file = state["excel_file"]
+    if not excel_file:
+        return {"error": "No patient data uploaded yet."}
+
+    current_conversation_history = _request_history(request, state, "demo", session_id)
+    current_conversation_history.append({"role": "user", "content": request.query})
+    tokens = stream_chat_query(request.query, excel_file, current_conversation_history, use_cache=request.use_cache,
+                               session_id=_summary_session(session_id))
+    return StreamingResponse(
+        _stream_chat(tokens, current_conversation_history, started, session_id, "demo"),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/chat")
-async def get_chat():
-    return LATEST_RESPONSE
+async def get_chat(session_id: str = Depends(get_session_id)):
+    return sessions.get(session_id)["latest_response"]
 
 def make_json_safe(obj):
     if isinstance(obj, np.ndarray):
@@ -135,7 +250,8 @@ async def get_dashboard_charts():
 
 @app.post("/upload_cad_pdf/")
 async def upload_cad_pdf(
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    session_id: str = Depends(get_session_id),
 ):
     # Ensure the file has a .pdf extension
     if not file.filename.endswith('.pdf'):
@@ -150,8 +266,11 @@ async def upload_cad_pdf(
     file_bytes = file_path.read_bytes()
 
     # Process the PDF file and extract information
+    # (OCR runs off the event loop; identical uploads in flight at the same time share one run)
     try:
-        pdf_data_dict = process_pdf_bytes(file.filename, file_bytes)
+        pdf_data_dict = await coalesce(
+            "ocr", content_key(file_bytes), lambda: asyncio.to_thread(process_pdf_bytes, file.filename, file_bytes)
+        )
         # Try to get Part No from the extracted data
         part_no = pdf_data_dict['fields'].get('Part No', '')
         
@@ -162,43 +281,103 @@ async def upload_cad_pdf(
             timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
             llm_context_file = os.path.join(UPLOAD_FOLDER, f"llm_context_{timestamp}.txt")
         
-        # Generate the report for the LLM
-        report_text = generate_report(
-            descriptor_dict=pdf_data_dict['fields'],
-            bom_csv=os.path.join(UPLOAD_FOLDER, "CAD_Parts_BOM_complete.csv"),
-            po_csv=os.path.join(UPLOAD_FOLDER, "CAD_Parts_purchase_orders.csv"),
-            vendor_csv=os.path.join(UPLOAD_FOLDER, "CAD_Parts_vendor_database.csv"),
-            out_path=llm_context_file
+        # Generate the report for the LLM (matching runs in the embedded catalog store)
+        # (the same catalog files as the manufacturing chat's vendor scoring, see config.py)
+        bom_csv, po_csv, vendor_csv = CATALOG_BOM_CSV, CATALOG_PO_CSV, CATALOG_VENDOR_CSV
+        report_key = content_key(
+            pdf_data_dict['fields'], llm_context_file, [file_version(p) for p in (bom_csv, po_csv, vendor_csv)]
         )
+
+        def build_report():
+            return generate_report(
+                descriptor_dict=pdf_data_dict['fields'],
+                bom_csv=bom_csv,
+                po_csv=po_csv,
+                vendor_csv=vendor_csv,
+                out_path=llm_context_file,
+                store=get_store(bom_csv, po_csv, vendor_csv)
+            )
+        report_text = await coalesce("report", report_key, lambda: asyncio.to_thread(build_report))
         
-        global MANUFACTURING_CONTEXT_FILE
-        MANUFACTURING_CONTEXT_FILE = llm_context_file
+        sessions.update(session_id, manufacturing_context_file=llm_context_file)
 
-        return {"status": "success", "filename": file.filename, "extracted_data": pdf_data_dict}
+        return {"status": "success", "filename": file.filename, "extracted_data": pdf_data_dict, "session_id": session_id}
     except Exception as e:
         return {"status": "error", "message": f"Error processing PDF: {e}"}
 
 
 @app.post("/chat/manufacturing")
-async def chat_manufacturing(request: ChatRequest):
+async def chat_manufacturing(request: ChatRequest, session_id: str = Depends(get_session_id)):
     """Handles chatbot queries for the manufacturing project"""
-    global LATEST_RESPONSE
-
     try:
-        if not MANUFACTURING_CONTEXT_FILE or not os.path.exists(MANUFACTURING_CONTEXT_FILE):
+        state = sessions.get(session_id)
+        context_file = state["manufacturing_context_file"]
+        if not context_file or not os.path.exists(context_file):
             raise HTTPException(status_code=404, detail="No manufacturing data has been processed yet. Please upload a file first.")
         
         # Pass both the query and the conversation history to the LLM function
-        response_text = process_manufacturing_chat(request.query, MANUFACTURING_CONTEXT_FILE, request.conversation_history)
+        conversation_history = _request_history(request, state, "manufacturing", session_id)
+        chat_stats = {}
+        response_text = await process_manufacturing_chat(request.query, context_file, list(conversation_history), stats=chat_stats,
+                                                   use_cache=request.use_cache, session_id=_summary_session(session_id))
 
         # Update conversation history with the new user and assistant messages
-        request.conversation_history.append({"role": "user", "content": request.query})
-        request.conversation_history.append({"role": "assistant", "content": response_text})
+        conversation_history.append({"role": "user", "content": request.query})
+        conversation_history.append({"role": "assistant", "content": response_text})
 
-        # Store the updated history and response
-        LATEST_RESPONSE["response"] = response_text
-        LATEST_RESPONSE["conversation_history"] = request.conversation_history
-        return LATEST_RESPONSE
+        # Store the updated history and response in the session
+        latest_response = {
+            "response": response_text,
+            "conversation_history": conversation_history,
+            "prompt_tokens": chat_stats.get("prompt_tokens"),
+            "cache_hit": chat_stats.get("cache_hit", False),
+        }
+        sessions.update(session_id, latest_response=latest_response, manufacturing_history=conversation_history)
+        return latest_response
     except Exception as e:
         traceback.print_exc()
         return JSONResponse(status_code=500, content={"status": "error", "message": f"Error during manufacturing chat: {e}"})
+
+
+@app.post("/chat/manufacturing/stream")
+async def chat_manufacturing_stream(request: ChatRequest, session_id: str = Depends(get_session_id)):
+    """Streaming variant of /chat/manufacturing (text/event-stream)."""
+    started = time.perf_counter()
+    state = sessions.get(session_id)
+    context_file = state["manufacturing_context_file"]
+    if not context_file or not os.path.exists(context_file):
+        raise HTTPException(status_code=404, detail="No manufacturing data has been processed yet. Please upload a file first.")
+
+    conversation_history = _request_history(request, state, "manufacturing", session_id)
+    tokens = stream_manufacturing_chat(request.query, context_file, list(conversation_history),
+                                       use_cache=request.use_cache, session_id=_summary_session(session_id))
+    history = conversation_history + [{"role": "user", "content": request.query}]
+    return StreamingResponse(
+        _stream_chat(tokens, history, started, session_id, "manufacturing"),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Hit / miss counts and hit rates of the chat response caches and the dashboard figure cache."""
+    return {**cache_stats(), "figures": figure_cache_stats()}
+
+
+@app.get("/coalesce/stats")
+async def get_coalesce_stats():
+    """OCR runs, report generations and LLM calls currently in flight, with the number of callers sharing each."""
+    return coalesce_stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Chat latency (per request and per stage), time to first token, token usage and cache lookups, in Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/traces")
+async def get_recent_traces():
+    """Stage timings, token usage and cache lookups of the most recent chat requests."""
+    return recent_traces()
@@ -0,0 +1,644 @@
+/*
+ * Clientside filtering for the Supply Chain Hub (db.py with
+ * config.DASHBOARD_CLIENTSIDE_FILTERING = True).
+ *
+ * The server ships the catalog once per page load as the `catalog-snapshot`
+ * store (SupplyChainModel.snapshot in supply_chain.py): columnar tables whose
+ * string columns are dictionary-encoded ({values, codes}), the PID join keys
+ * and the plotly template. Every dropdown change is then resolved here, the
+ * same way filter_engine.py resolves it on the server, and the KPIs, the
+ * vendor table and the figures are built from the selected rows.
+ *
+ * Large selections are rolled up before they are plotted, with the same
+ * thresholds as po_rollups.py (snapshot.limits): the map shows one marker
+ * per state and PO status above DASHBOARD_MAP_DETAIL_ROWS POs, and the
+ * timeline one point per time bucket and PO status above
+ * DASHBOARD_TIMELINE_MAX_POINTS POs in view, refined as the user zooms.
+ */
+window.dash_clientside = window.dash_clientside || {};
+
+(function () {
+    var SIZE_MAX = 20; // plotly express default marker size_max
+    var BLUE_SHADES = ["#005ce6", "#3385ff", "#66b2ff", "#99ccff", "#cce5ff"];
+    var BAR_METRICS = ["Orders", "DPPM", "Quality %", "Avg Days", "On-Time %"];
+    var SELECTION_CACHE_SIZE = 64;
+    var BUCKETS = [["D", 1.0], ["W", 7.0], ["M", 30.44], ["Q", 91.31], ["Y", 365.25]]; // as po_rollups.BUCKETS
+    var BUCKET_NAMES = {D: "daily", W: "weekly", M: "monthly", Q: "quarterly", Y: "yearly"};
+    var DAY_MS = 86400000;
+
+    // ------------------------------------------------------------ snapshot access
+    function column(table, name) {
+        var col = table.columns[name];
+        if (col === undefined) {
+            return function () { return null; };
+        }
+        if (Array.isArray(col)) {
+            return function (i) { return col[i]; };
+        }
+        return function (i) {
+            var code = col.codes[i];
+            return code < 0 ? null : col.values[code];
+        };
+    }
+
+    function freeze(values) {
+        if (!values || values.length === 0) {
+            return [];
+        }
+        if (!Array.isArray(values)) {
+            values = [values];
+        }
+        return Array.from(new Set(values)).sort();
+    }
+
+    function unique(values) {
+        return Array.from(new Set(values.filter(function (v) { return v !== null && v !== undefined; })));
+    }
+
+    function lookup(map, keys) {
+        var out = [];
+        keys.forEach(function (k) { (map[k] || []).forEach(function (v) { out.push(v); }); });
+        return unique(out);
+    }
+
+    function rowsWhere(table, test) {
+        var out = [];
+        for (var i = 0; i < table.rows; i++) {
+            if (test(i)) {
+                out.push(i);
+            }
+        }
+        return out;
+    }
+
+    function bomNames(snapshot, parts) {
+        if (!parts || parts.length === 0) {
+            return snapshot.bom_part_names.slice();
+        }
+        var pids = new Set(lookup(snapshot.pids_by_part, parts));
+        var pid = column(snapshot.bom, "Part ID (PID)");
+        var name = column(snapshot.bom, "Part Name");
+        return unique(rowsWhere(snapshot.bom, function (i) { return pids.has(pid(i)); }).map(name));
+    }
+
+    // ------------------------------------------------------------ selections
+    var cache = new Map();
+
+    function resolve(snapshot, months, parts, boms, vendors) {
+        var vendorName = column(snapshot.vendors, "Vendor Name");
+        var vendorPart = column(snapshot.vendors, "Part Name");
+        var poMonth = column(snapshot.po, "Month");
+        var poVendor = column(snapshot.po, "Vendor");
+        var poPart = column(snapshot.po, "Part ID");
+        var bomPid = column(snapshot.bom, "Part ID (PID)");
+        var bomName = column(snapshot.bom, "Part Name");
+
+        parts = boms.length ? lookup(snapshot.parts_by_bom, boms) : parts;
+        var monthSet = new Set(months), partSet = new Set(parts), bomSet = new Set(boms), vendorSet = new Set(vendors);
+
+        // Vendor rows: vendors with POs in the months, then the part and vendor filters
+        var inMonths = months.length ? function (i) { return monthSet.has(poMonth(i)); } : function () { return true; };
+        var poVendors = new Set(rowsWhere(snapshot.po, inMonths).map(poVendor));
+        var vendorRows = rowsWhere(snapshot.vendors, function (i) {
+            return poVendors.has(vendorName(i))
+                && (!parts.length || partSet.has(vendorPart(i)))
+                && (!vendors.length || vendorSet.has(vendorName(i)));
+        });
+
+        // PO rows: months, vendors and the PIDs of the selected parts / BOMs
+        var pids = parts.length ? lookup(snapshot.pids_by_part, parts) : null;
+        if (boms.length) {
+            var bomPids = lookup(snapshot.pids_by_bom, boms);
+            pids = pids === null ? bomPids : pids.filter(function (p) { return bomPids.indexOf(p) >= 0; });
+        }
+        var pidSet = new Set(pids || []);
+        var poRows = rowsWhere(snapshot.po, function (i) {
+            return inMonths(i)
+                && (!vendors.length || vendorSet.has(poVendor(i)))
+                && (pids === null || pidSet.has(poPart(i)));
+        });
+
+        // BOM rows: PIDs of the selected parts, then the selected BOM names
+        var partPids = new Set(lookup(snapshot.pids_by_part, parts));
+        var bomRows = rowsWhere(snapshot.bom, function (i) {
+            return (!parts.length || partPids.has(bomPid(i))) && (!boms.length || bomSet.has(bomName(i)));
+        });
+
+        var kpiParts, kpiBom;
+        if (boms.length) {
+            kpiParts = parts.length;
+            kpiBom = boms.length;
+        } else if (parts.length) {
+            kpiParts = parts.length;
+            kpiBom = bomNames(snapshot, parts).length;
+        } else {
+            kpiParts = unique(vendorRows.map(vendorPart)).length;
+            kpiBom = unique(bomRows.map(bomName)).length;
+        }
+        var orders = column(snapshot.vendors, "Orders");
+        return {
+            vendorRows: vendorRows,
+            poRows: poRows,
+            bomRows: bomRows,
+            kpis: {
+                vendors: unique(vendorRows.map(vendorName)).length,
+                parts: kpiParts,
+                bom: kpiBom,
+                orders: vendorRows.reduce(function (sum, i) { return sum + (orders(i) || 0); }, 0)
+            }
+        };
+    }
+
+    function select(snapshot, months, parts, boms, vendors) {
+        var key = JSON.stringify([snapshot.version, freeze(months), freeze(parts), freeze(boms), freeze(vendors)]);
+        var selection = cache.get(key);
+        if (selection === undefined) {
+            selection = resolve(snapshot, freeze(months), freeze(parts), freeze(boms), freeze(vendors));
+            if (cache.size >= SELECTION_CACHE_SIZE) {
+                cache.delete(cache.keys().next().value);
+            }
+        } else {
+            cache.delete(key);
+        }
+        cache.set(key, selection);
+        return selection;
+    }
+
+    // ------------------------------------------------------------ figure helpers
+    function groupBy(rows, key) {
+        var groups = new Map(); // in order of first appearance, as plotly express colors
+        rows.forEach(function (i) {
+            var k = key(i);
+            if (k === null) {
+                return;
+            }
+            if (!groups.has(k)) {
+                groups.set(k, []);
+            }
+            groups.get(k).push(i);
+        });
+        return groups;
+    }
+
+    function mean(rows, values) {
+        var sum = 0, n = 0;
+        rows.forEach(function (i) {
+            var v = values(i);
+            if (v !== null) {
+                sum += v;
+                n += 1;
+            }
+        });
+        return n ? sum / n : null;
+    }
+
+    function sizeref(rows, values) {
+        var max = 0;
+        rows.forEach(function (i) { max = Math.max(max, values(i) || 0); });
+        return max / (SIZE_MAX * SIZE_MAX);
+    }
+
+    function colorway(snapshot, i) {
+        var colors = snapshot.template.layout.colorway;
+        return colors[i % colors.length];
+    }
+
+    function figure(snapshot, data, layout) {
+        layout.template = snapshot.template;
+        return {data: data, layout: layout};
+    }
+
+    function byDescending(values) {
+        return function (a, b) { return values(b) - values(a); };
+    }
+
+    // ------------------------------------------------------------ PO rollups (as po_rollups.py)
+    function rollup(snapshot, rows, keys) {
+        // POs, Amount ($), Avg Amount ($), Qty Ordered and Vendors per combination of keys, sorted by the keys
+        var t = snapshot.po;
+        var amount = column(t, "Amount ($)"), qty = column(t, "Qty Ordered"), vendor = column(t, "Vendor");
+        var groups = new Map();
+        rows.forEach(function (i) {
+            var values = keys.map(function (k) { return k(i); });
+            if (values.indexOf(null) >= 0) {
+                return;
+            }
+            var id = JSON.stringify(values);
+            var g = groups.get(id);
+            if (g === undefined) {
+                g = {keys: values, pos: 0, amount: 0, amounts: 0, qty: 0, vendors: new Set()};
+                groups.set(id, g);
+            }
+            var a = amount(i), q = qty(i) === null ? NaN : Number(qty(i));
+            g.pos += 1;
+            if (a !== null) {
+                g.amount += a;
+                g.amounts += 1;
+            }
+            if (!isNaN(q)) {
+                g.qty += q;
+            }
+            if (vendor(i) !== null) {
+                g.vendors.add(vendor(i));
+            }
+        });
+        return Array.from(groups.values()).sort(function (a, b) {
+            for (var k = 0; k < a.keys.length; k++) {
+                if (a.keys[k] !== b.keys[k]) {
+                    return a.keys[k] < b.keys[k] ? -1 : 1;
+                }
+            }
+            return 0;
+        }).map(function (g) {
+            return {keys: g.keys, pos: g.pos, amount: g.amount, avg: g.amounts ? g.amount / g.amounts : null,
+                    qty: g.qty, vendors: g.vendors.size};
+        });
+    }
+
+    function day(date) {
+        return Date.parse(String(date).slice(0, 10) + "T00:00:00Z");
+    }
+
+    function iso(ms) {
+        return new Date(ms).toISOString().slice(0, 10);
+    }
+
+    function bucketStart(date, period) {
+        // Start of the pandas period containing `date` ("W" weeks start on Monday)
+        var d = new Date(day(date)), y = d.getUTCFullYear(), m = d.getUTCMonth();
+        if (period === "W") {
+            return iso(d.getTime() - ((d.getUTCDay() + 6) % 7) * DAY_MS);
+        }
+        if (period === "M") {
+            return iso(Date.UTC(y, m, 1));
+        }
+        if (period === "Q") {
+            return iso(Date.UTC(y, m - m % 3, 1));
+        }
+        if (period === "Y") {
+            return iso(Date.UTC(y, 0, 1));
+        }
+        return iso(d.getTime());
+    }
+
+    function visibleRange(relayout) {
+        // As po_rollups.timeline_range: (start, end) of a zoomed timeline, null for the full range
+        if (!relayout) {
+            return null;
+        }
+        var start = relayout["xaxis.range[0]"], end = relayout["xaxis.range[1]"];
+        if (start === undefined && Array.isArray(relayout["xaxis.range"])) {
+            start = relayout["xaxis.range"][0];
+            end = relayout["xaxis.range"][1];
+        }
+        return start === undefined || end === undefined ? null : [day(start), day(end)];
+    }
+
+    function timelineRows(snapshot, rows, relayout) {
+        // As po_rollups.timeline_rollup: {rows} to plot per PO, or {groups, period} per time bucket
+        var limit = snapshot.limits.timeline_max_points;
+        var date = column(snapshot.po, "Date");
+        if (rows.length <= limit) {
+            return {rows: rows};
+        }
+        var range = visibleRange(relayout), start, end;
+        if (range === null) {
+            start = Infinity;
+            end = -Infinity;
+            rows.forEach(function (i) {
+                if (date(i) !== null) {
+                    start = Math.min(start, day(date(i)));
+                    end = Math.max(end, day(date(i)));
+                }
+            });
+        } else {
+            start = range[0];
+            end = range[1];
+            var width = end - start;
+            rows = rows.filter(function (i) {
+                var d = date(i);
+                return d !== null && day(d) >= start - width && day(d) <= end + width;
+            });
+            if (rows.length <= limit) {
+                return {rows: rows};
+            }
+        }
+        var span = isFinite(start) && isFinite(end) ? Math.max((end - start) / DAY_MS, 1) : 1;
+        var period = BUCKETS[BUCKETS.length - 1][0];
+        for (var b = 0; b < BUCKETS.length; b++) {
+            if (span / BUCKETS[b][1] <= limit) {
+                period = BUCKETS[b][0];
+                break;
+            }
+        }
+        var bucket = function (i) { return date(i) === null ? null : bucketStart(date(i), period); };
+        return {groups: rollup(snapshot, rows, [bucket, column(snapshot.po, "PO Status")]), period: period};
+    }
+
+    function statusTraces(snapshot, groups, trace) {
+        // One trace per PO status (the last key of the rollup), in order of first appearance
+        var byStatus = new Map();
+        groups.forEach(function (g) {
+            var status = g.keys[g.keys.length - 1];
+            if (!byStatus.has(status)) {
+                byStatus.set(status, []);
+            }
+            byStatus.get(status).push(g);
+        });
+        var data = [];
+        byStatus.forEach(function (gs, status) { data.push(trace(gs, status, colorway(snapshot, data.length))); });
+        return data;
+    }
+
+    function stateMap(snapshot, groups) {
+        var max = 0;
+        groups.forEach(function (g) { max = Math.max(max, g.amount); });
+        var data = statusTraces(snapshot, groups, function (gs, status, color) {
+            return {
+                type: "scattergeo", geo: "geo", mode: "markers", name: status, legendgroup: status, showlegend: true,
+                locationmode: "USA-states", locations: gs.map(function (g) { return g.keys[0]; }),
+                hovertext: gs.map(function (g) { return g.keys[0]; }),
+                customdata: gs.map(function (g) { return [g.pos, g.amount, g.avg, g.qty, g.vendors, status]; }),
+                marker: {color: color, size: gs.map(function (g) { return g.amount; }), sizemode: "area",
+                         sizeref: max / (SIZE_MAX * SIZE_MAX), symbol: "circle"},
+                hovertemplate: "<b>%{hovertext}</b><br><br>PO Status=%{customdata[5]}<br>Amount ($)=%{customdata[1]:,.2f}" +
+                    "<br>State=%{location}<br>POs=%{customdata[0]}<br>Avg Amount ($)=%{customdata[2]:,.2f}" +
+                    "<br>Qty Ordered=%{customdata[3]}<br>Vendors=%{customdata[4]}<extra></extra>"
+            };
+        });
+        return figure(snapshot, data, {
+            title: {text: "<b>Geographic Distribution of Purchase Orders</b>"},
+            geo: {domain: {x: [0, 1], y: [0, 1]}, center: {}, scope: "usa"},
+            legend: {title: {text: "PO Status"}, tracegroupgap: 0, itemsizing: "constant"}
+        });
+    }
+
+    function bucketTimeline(snapshot, groups, period) {
+        var data = statusTraces(snapshot, groups, function (gs, status, color) {
+            return {
+                type: "scatter", mode: "lines+markers", name: status, legendgroup: status, showlegend: true,
+                x: gs.map(function (g) { return g.keys[0]; }), y: gs.map(function (g) { return g.amount; }),
+                customdata: gs.map(function (g) { return [g.pos, g.avg, g.qty, g.vendors, status]; }),
+                line: {color: color, dash: "solid"}, marker: {symbol: "circle"},
+                hovertemplate: "PO Status=%{customdata[4]}<br>Date=%{x}<br>Amount ($)=%{y}<br>POs=%{customdata[0]}" +
+                    "<br>Avg Amount ($)=%{customdata[1]:,.2f}<br>Qty Ordered=%{customdata[2]}" +
+                    "<br>Vendors=%{customdata[3]}<extra></extra>"
+            };
+        });
+        return figure(snapshot, data, {
+            title: {text: "<b>Purchase Order over Time by Status</b> (" + BUCKET_NAMES[period] + " totals)"},
+            xaxis: {title: {text: "Date"}},
+            yaxis: {title: {text: "Amount ($)"}},
+            legend: {title: {text: "PO Status"}, tracegroupgap: 0},
+            uirevision: "timeline" // keep the user's zoom when the buckets change
+        });
+    }
+
+    // ------------------------------------------------------------ callbacks
+    window.dash_clientside.coast = {
+        bomOptions: function (parts, snapshot) {
+            return bomNames(snapshot, freeze(parts)).map(function (b) { return {label: b, value: b}; });
+        },
+
+        kpis: function (months, parts, boms, vendors, snapshot) {
+            var kpis = select(snapshot, months, parts, boms, vendors).kpis;
+            return [kpis.vendors, kpis.parts, kpis.bom, kpis.orders];
+        },
+
+        vendorTable: function (months, parts, boms, vendors, snapshot) {
+            if (!vendors || vendors.length === 0) {
+                return [];
+            }
+            var table = snapshot.vendors;
+            var names = Object.keys(table.columns);
+            var columns = names.map(function (c) { return column(table, c); });
+            return select(snapshot, months, parts, boms, vendors).vendorRows.map(function (i) {
+                var record = {};
+                names.forEach(function (c, j) { record[c] = columns[j](i); });
+                return record;
+            });
+        },
+
+        scatter: function (months, parts, boms, vendors, snapshot) {
+            var t = snapshot.vendors;
+            var rows = select(snapshot, months, parts, boms, vendors).vendorRows;
+            var x = column(t, "On-Time %"), y = column(t, "DPPM"), size = column(t, "Orders"), name = column(t, "Part Name");
+            var ref = sizeref(rows, size);
+            var data = [];
+            groupBy(rows, column(t, "Rating")).forEach(function (group, rating) {
+                data.push({
+                    type: "scatter", mode: "markers", name: rating, legendgroup: rating, showlegend: true,
+                    x: group.map(x), y: group.map(y), hovertext: group.map(name),
+                    marker: {color: colorway(snapshot, data.length), size: group.map(size), sizemode: "area", sizeref: ref, symbol: "circle"},
+                    hovertemplate: "<b>%{hovertext}</b><br><br>Rating=" + rating +
+                        "<br>On-Time %=%{x}<br>DPPM=%{y}<br>Orders=%{marker.size}<extra></extra>"
+                });
+            });
+            return figure(snapshot, data, {
+                title: {text: "<b>On-Time Delivery vs Defective Parts</b>"},
+                xaxis: {title: {text: "On-Time %"}},
+                yaxis: {title: {text: "DPPM"}},
+                legend: {title: {text: "Rating"}, tracegroupgap: 0, itemsizing: "constant"}
+            });
+        },
+
+        heatmap: function (months, parts, boms, vendors, snapshot) {
+            var t = snapshot.vendors;
+            var rows = select(snapshot, months, parts, boms, vendors).vendorRows;
+            var metrics = ["Orders", "Avg Days", "DPPM"];
+            var groups = groupBy(rows, column(t, "Part Name"));
+            var names = Array.from(groups.keys()).sort();
+            var z = metrics.map(function (m) {
+                var values = column(t, m);
+                return names.map(function (p) { return mean(groups.get(p), values); });
+            });
+            return figure(snapshot, [{
+                type: "heatmap", x: names, y: metrics, z: z, coloraxis: "coloraxis", texttemplate: "%{z}",
+                hovertemplate: "Part Name: %{x}<br>y: %{y}<br>color: %{z}<extra></extra>"
+            }], {
+                title: {text: "<b>Orders, Lead Time, and DPPM by Parts</b>"},
+                xaxis: {title: {text: "Parts"}, tickangle: -45, showticklabels: false},
+                yaxis: {autorange: "reversed"},
+                coloraxis: {colorscale: "Viridis"}
+            });
+        },
+
+        vendorBar: function (months, parts, boms, vendors, snapshot) {
+            var t = snapshot.vendors;
+            var rows = select(snapshot, months, parts, boms, vendors).vendorRows;
+            var groups = groupBy(rows, column(t, "Vendor Name"));
+            var grouped = Array.from(groups.keys()).sort().map(function (v) {
+                var g = groups.get(v), row = {"Vendor Name": v};
+                BAR_METRICS.forEach(function (m) {
+                    var values = column(t, m);
+                    row[m] = m === "Orders" ? g.reduce(function (s, i) { return s + (values(i) || 0); }, 0) : mean(g, values);
+                });
+                return row;
+            });
+            if (grouped.length > 1) {
+                grouped = grouped.slice().sort(byDescending(function (r) { return r.Orders; })).slice(0, 10);
+            }
+            function order(metric, descending) {
+                return grouped.slice().sort(function (a, b) {
+                    return descending ? b[metric] - a[metric] : a[metric] - b[metric];
+                }).map(function (r) { return r["Vendor Name"]; });
+            }
+            function sortButton(label, metric, descending) {
+                return {label: label, method: "relayout",
+                        args: [{"xaxis.categoryorder": "array", "xaxis.categoryarray": order(metric, descending)}]};
+            }
+            var x = grouped.map(function (r) { return r["Vendor Name"]; });
+            return figure(snapshot, !grouped.length ? [] : BAR_METRICS.map(function (m, j) {
+                return {
+                    type: "bar", name: m, legendgroup: m, showlegend: true, orientation: "v", textposition: "auto",
+                    x: x, y: grouped.map(function (r) { return r[m]; }),
+                    marker: {color: BLUE_SHADES[j % BLUE_SHADES.length], pattern: {shape: ""}},
+                    hovertemplate: "variable=" + m + "<br>Vendor Name=%{x}<br>value=%{y}<extra></extra>"
+                };
+            }), {
+                title: {text: "<b>Top Vendors by Features </b>"},
+                barmode: "stack",
+                xaxis: {title: {text: "Vendors"}, showticklabels: false},
+                yaxis: {title: {text: "Metrics"}},
+                legend: {title: {text: "Metrics"}, tracegroupgap: 0},
+                updatemenus: [{
+                    buttons: [
+                        sortButton("Sort by Orders", "Orders", true),
+                        sortButton("Sort by Quality %", "Quality %", true),
+                        sortButton("Sort by DPPM", "DPPM", false),
+                        sortButton("Sort by Avg Days", "Avg Days", false),
+                        sortButton("Sort by On-Time %", "On-Time %", true)
+                    ],
+                    direction: "down", showactive: true, x: 1.15, y: 1.2
+                }]
+            });
+        },
+
+        map: function (months, parts, boms, vendors, snapshot) {
+            var t = snapshot.po;
+            var rows = select(snapshot, months, parts, boms, vendors).poRows;
+            if (rows.length > snapshot.limits.map_detail_rows) {
+                return stateMap(snapshot, rollup(snapshot, rows, [column(t, "State"), column(t, "PO Status")]));
+            }
+            var amount = column(t, "Amount ($)"), state = column(t, "State"), location = column(t, "Location");
+            var hover = ["Qty Ordered", "Vendor", "Materials Supported", "Amount ($)", "PO Status"].map(function (c) { return column(t, c); });
+            var ref = sizeref(rows, amount);
+            var data = [];
+            groupBy(rows, column(t, "PO Status")).forEach(function (group, status) {
+                data.push({
+                    type: "scattergeo", geo: "geo", mode: "markers", name: status, legendgroup: status, showlegend: true,
+                    locationmode: "USA-states", locations: group.map(state), hovertext: group.map(location),
+                    customdata: group.map(function (i) { return hover.map(function (c) { return c(i); }); }),
+                    marker: {color: colorway(snapshot, data.length), size: group.map(amount), sizemode: "area", sizeref: ref, symbol: "circle"},
+                    hovertemplate: "<b>%{hovertext}</b><br><br>PO Status=%{customdata[4]}<br>Amount ($)=%{customdata[3]}" +
+                        "<br>State=%{location}<br>Qty Ordered=%{customdata[0]}<br>Vendor=%{customdata[1]}" +
+                        "<br>Materials Supported=%{customdata[2]}<extra></extra>"
+                });
+            });
+            return figure(snapshot, data, {
+                title: {text: "<b>Geographic Distribution of Purchase Orders</b>"},
+                geo: {domain: {x: [0, 1], y: [0, 1]}, center: {}, scope: "usa"},
+                legend: {title: {text: "PO Status"}, tracegroupgap: 0, itemsizing: "constant"}
+            });
+        },
+
+        timeline: function (months, parts, boms, vendors, relayout, snapshot) {
+            var t = snapshot.po;
+            var date = column(t, "Date"), amount = column(t, "Amount ($)");
+            var selected = select(snapshot, months, parts, boms, vendors).poRows;
+            var triggered = window.dash_clientside.callback_context.triggered || [];
+            var zoomed = triggered.length && triggered.every(function (x) { return x.prop_id === "timeline-graph.relayoutData"; });
+            if (zoomed && selected.length <= snapshot.limits.timeline_max_points) {
+                return window.dash_clientside.no_update; // every PO is plotted already
+            }
+            var view = timelineRows(snapshot, selected, relayout);
+            if (view.groups) {
+                return bucketTimeline(snapshot, view.groups, view.period);
+            }
+            var rows = view.rows.slice().sort(function (a, b) {
+                var da = date(a), db = date(b); // YYYY-MM-DD strings, missing dates last
+                return da === db ? 0 : da === null ? 1 : db === null ? -1 : da < db ? -1 : 1;
+            });
+            var hover = ["Vendor", "Qty Ordered", "Materials Supported", "PO Status"].map(function (c) { return column(t, c); });
+            var data = [];
+            groupBy(rows, column(t, "PO Status")).forEach(function (group, status) {
+                data.push({
+                    type: "scatter", mode: "lines+markers", name: status, legendgroup: status, showlegend: true,
+                    x: group.map(date), y: group.map(amount),
+                    customdata: group.map(function (i) { return hover.map(function (c) { return c(i); }); }),
+                    line: {color: colorway(snapshot, data.length), dash: "solid"}, marker: {symbol: "circle"},
+                    hovertemplate: "PO Status=%{customdata[3]}<br>Date=%{x}<br>Amount ($)=%{y}<br>Vendor=%{customdata[0]}" +
+                        "<br>Qty Ordered=%{customdata[1]}<br>Materials Supported=%{customdata[2]}<extra></extra>"
+                });
+            });
+            return figure(snapshot, data, {
+                title: {text: "<b>Purchase Order over Time by Status</b>"},
+                xaxis: {title: {text: "Date"}},
+                yaxis: {title: {text: "Amount ($)"}},
+                legend: {title: {text: "PO Status"}, tracegroupgap: 0},
+                uirevision: "timeline"
+            });
+        },
+
+        treemap: function (parts, boms, snapshot) {
+            var t = snapshot.bom;
+            var rows = select(snapshot, null, parts, boms, null).bomRows;
+            var name = column(t, "Part Name"), description = column(t, "Description");
+            var quantity = column(t, "Quantity"), critical = column(t, "Critical");
+            var custom = ["Description", "Quantity", "Unit", "Category", "Specification", "Lead Time", "Material",
+                          "Dimensions (mm)", "Finish", "Critical"].map(function (c) { return column(t, c); });
+
+            // Leaves (part / description) and their parts, sized by quantity and colored by Critical;
+            // like plotly express, a node sums the numbers of its rows and shows "(?)" where their text differs
+            var colors = new Map();
+            function color(value) {
+                if (!colors.has(value)) {
+                    colors.set(value, colorway(snapshot, colors.size));
+                }
+                return colors.get(value);
+            }
+            var nodes = new Map();
+            function merge(a, b) {
+                if (typeof a === "number" && typeof b === "number") {
+                    return a + b;
+                }
+                return a === b ? a : "(?)";
+            }
+            function node(id, label, parent, i) {
+                var row = custom.map(function (c) { return c(i); });
+                var n = nodes.get(id);
+                if (n === undefined) {
+                    nodes.set(id, {label: label, parent: parent, value: quantity(i) || 0, critical: critical(i), customdata: row});
+                    return;
+                }
+                n.value += quantity(i) || 0;
+                n.critical = merge(n.critical, critical(i));
+                n.customdata = n.customdata.map(function (v, j) { return merge(v, row[j]); });
+            }
+            rows.forEach(function (i) {
+                if (name(i) === null || description(i) === null) {
+                    return;
+                }
+                node(name(i) + "/" + description(i), description(i), name(i), i);
+                node(name(i), name(i), "", i);
+            });
+            var ids = Array.from(nodes.keys());
+            return figure(snapshot, [{
+                type: "treemap", name: "", branchvalues: "total", domain: {x: [0, 1], y: [0, 1]},
+                ids: ids,
+                labels: ids.map(function (id) { return nodes.get(id).label; }),
+                parents: ids.map(function (id) { return nodes.get(id).parent; }),
+                values: ids.map(function (id) { return nodes.get(id).value; }),
+                customdata: ids.map(function (id) { return nodes.get(id).customdata; }),
+                marker: {colors: ids.map(function (id) { return color(nodes.get(id).critical); })},
+                hovertemplate: "<b>%{label}</b><br>Description: %{customdata[0]}<br>Quantity: %{customdata[1]} %{customdata[2]}" +
+                    "<br>Category: %{customdata[3]}<br>Specification: %{customdata[4]}<br>Lead Time: %{customdata[5]}" +
+                    "<br>Material: %{customdata[6]}<br>Dimensions: %{customdata[7]}<br>Finish: %{customdata[8]}<extra></extra>",
+                hoverlabel: {bgcolor: "black", font: {size: 12, color: "white"}}
+            }], {
+                title: {text: "<b>Bill of Materials Hierarchy </b>"},
+                legend: {tracegroupgap: 0}
+            });
+        }
+    };
+})();
@@ -0,0 +1,313 @@
+"""
+Embedded SQLite store for the CAD parts catalog (BOM, purchase orders, vendors).
+
+The three CSVs are loaded once per version into a local SQLite file with
+indexes on part ID, vendor and PO date, and exposed through a small query
+API. `new_kb.generate_report` and the Supply Chain Hub callbacks use it so
+joins and filters run in the engine instead of through repeated pandas
+copies of the same frames.
+
+Every table keeps the original CSV columns verbatim (as text, exactly as
+`new_kb` reads them) plus a few underscore-prefixed typed/normalized
+columns used for filtering:
+
+    bom              _pid, _part_name
+    purchase_orders  _pid, _vendor, _date (ISO), _month (YYYY-MM), _amount, _state, _status
+    vendors          _pid, _vendor, _part_name
+
+`match_keys` holds the normalized part-number / part-name / dimension keys
+of every row so descriptor matching is an indexed lookup.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from config import CATALOG_DB_FILE
+from new_kb import COL_NUM, COL_NAME, COL_DIM, _norm, _pick_cols, _explode_dim_cell, _load_csv
+
+log = logging.getLogger("catalog_store")
+
+BOM = "bom"
+PURCHASE_ORDERS = "purchase_orders"
+VENDORS = "vendors"
+
+# Report labels used by new_kb -> store table
+REPORT_TABLES = {"BOM": BOM, "PURCHASE_ORDERS": PURCHASE_ORDERS, "VENDOR_DATABASE": VENDORS}
+
+_INDEXES = [
+    f"CREATE INDEX ix_bom_pid ON {BOM}(_pid)",
+    f"CREATE INDEX ix_bom_part_name ON {BOM}(_part_name)",
+    f"CREATE INDEX ix_po_pid ON {PURCHASE_ORDERS}(_pid)",
+    f"CREATE INDEX ix_po_vendor ON {PURCHASE_ORDERS}(_vendor)",
+    f"CREATE INDEX ix_po_date ON {PURCHASE_ORDERS}(_date)",
+    f"CREATE INDEX ix_po_month ON {PURCHASE_ORDERS}(_month)",
+    f"CREATE INDEX ix_vendors_pid ON {VENDORS}(_pid)",
+    f"CREATE INDEX ix_vendors_vendor ON {VENDORS}(_vendor)",
+    f"CREATE INDEX ix_vendors_part_name ON {VENDORS}(_part_name)",
+    "CREATE INDEX ix_match_keys ON match_keys(kind, value, tbl)",
+]
+
+
+def _q(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _col(df: pd.DataFrame, *names: str) -> pd.Series:
+    for n in names:
+        if n in df.columns:
+            return df[n]
+    return pd.Series([""] * len(df), index=df.index, dtype=object)
+
+
+def _source_signature(paths) -> str:
+    """Identity and version of the source files from their stat data only, so any spelling of a path gives the same signature."""
+    parts = []
+    for p in paths:
+        st = os.stat(p)
+        parts.append(f"{st.st_dev}:{st.st_ino}:{st.st_mtime_ns}:{st.st_size}")
+    return "|".join(parts)
+
+
+def _typed_columns(table: str, df: pd.DataFrame) -> pd.DataFrame:
+    typed = pd.DataFrame(index=df.index)
+    if table == BOM:
+        typed["_pid"] = _col(df, "Part ID (PID)")
+        typed["_part_name"] = _col(df, "Part Name")
+    elif table == PURCHASE_ORDERS:
+        dates = pd.to_datetime(_col(df, "Date"), errors="coerce")
+        typed["_pid"] = _col(df, "Part ID")
+        typed["_vendor"] = _col(df, "Vendor")
+        typed["_date"] = dates.dt.strftime("%Y-%m-%d")
+        typed["_month"] = dates.dt.strftime("%Y-%m")
+        typed["_amount"] = pd.to_numeric(
+            _col(df, "Amount ($)").astype(str).str.replace(r"[\$,]", "", regex=True), errors="coerce"
+        )
+        typed["_state"] = _col(df, "Location").astype(str).str.split(",").str[1].str.strip()
+        typed["_status"] = _col(df, "PO Status")
+    else:
+        typed["_pid"] = _col(df, "PID")
+        typed["_vendor"] = _col(df, "Vendor Name")
+        typed["_part_name"] = _col(df, "Part Name")
+    return typed
+
+
+def _match_key_rows(table: str, df: pd.DataFrame):
+    # Same column picking and normalization as new_kb._match_df / _any_exact_in_cols,
+    # evaluated once per row at load time instead of on every report.
+    rows = []
+    for kind, candidates in (("num", COL_NUM), ("name", COL_NAME)):
+        for c in _pick_cols(df, set(candidates)):
+            for row_id, v in zip(df.index, df[c].astype(str).map(_norm)):
+                rows.append((table, int(row_id), kind, c, v))
+    for c in _pick_cols(df, set(COL_DIM)):
+        for row_id, cell in zip(df.index, df[c].astype(str)):
+            for canon in set(_explode_dim_cell(cell)):
+                rows.append((table, int(row_id), "dim", c, canon))
+    return rows
+
+
+class CatalogStore:
+    """Thread-safe handle on a built catalog database."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.columns = {
+            t: [r[1] for r in self._conn.execute(f"PRAGMA table_info({t})") if not r[1].startswith("_") and r[1] != "row_id"]
+            for t in (BOM, PURCHASE_ORDERS, VENDORS)
+        }
+
+    # ------------------------------------------------------------ build
+    @staticmethod
+    def build(db_path: str, bom_csv, po_csv, vendor_csv, signature: str = "") -> None:
+        """(Re)builds the database file at `db_path` from the three CSVs."""
+        tmp = f"{db_path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        conn = sqlite3.connect(tmp)
+        try:
+            keys = []
+            for table, path in ((BOM, bom_csv), (PURCHASE_ORDERS, po_csv), (VENDORS, vendor_csv)):
+                df = _load_csv(path, log)
+                df.columns = df.columns.str.strip()
+                df.index = pd.RangeIndex(len(df))
+                typed = _typed_columns(table, df)
+                cols = ["row_id INTEGER PRIMARY KEY"] + [f"{_q(c)} TEXT" for c in df.columns]
+                cols += [f"{c} {'REAL' if c == '_amount' else 'TEXT'}" for c in typed.columns]
+                conn.execute(f"CREATE TABLE {table} ({', '.join(cols)})")
+                full = pd.concat([df, typed], axis=1)
+                placeholders = ", ".join("?" * (len(full.columns) + 1))
+                conn.executemany(
+                    f"INSERT INTO {table} VALUES ({placeholders})",
+                    ((i, *(None if pd.isna(v) else v for v in row)) for i, row in enumerate(full.itertuples(index=False))),
+                )
+                keys.extend(_match_key_rows(table, df))
+            conn.execute("CREATE TABLE match_keys (tbl TEXT, row_id INTEGER, kind TEXT, col TEXT, value TEXT)")
+            conn.executemany("INSERT INTO match_keys VALUES (?, ?, ?, ?, ?)", keys)
+            for ddl in _INDEXES:
+                conn.execute(ddl)
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("INSERT INTO meta VALUES ('signature', ?)", (signature,))
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp, db_path)
+        log.info(f"Built catalog store {db_path}")
+
+    @staticmethod
+    def stored_signature(db_path: str) -> str | None:
+        if not os.path.exists(db_path):
+            return None
+        try:
+            conn = sqlite3.connect(db_path)
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    # ------------------------------------------------------------ helpers
+    def _frame(self, sql: str, params=()) -> pd.DataFrame:
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=list(params))
+
+    def _values(self, sql: str, params=()) -> list:
+        with self._lock:
+            return [r[0] for r in self._conn.execute(sql, list(params))]
+
+    def _select(self, table: str) -> str:
+        return ", ".join(_q(c) for c in self.columns[table])
+
+    @staticmethod
+    def _in(column: str, values) -> tuple[str, list]:
+        values = list(values)
+        return f"{column} IN ({', '.join('?' * len(values))})", values
+
+    # ------------------------------------------------------------ report matching
+    def match_rows(self, label: str, part_number=None, part_name=None, dim_canon=None) -> pd.DataFrame:
+        """Rows of the report table `label` matching any of the descriptor fields (see new_kb._match_df)."""
+        table = REPORT_TABLES[label]
+        clauses, params = [], []
+        for kind, value in (("num", part_number and _norm(part_number)), ("name", part_name and _norm(part_name)), ("dim", dim_canon)):
+            if value:
+                clauses.append("(kind = ? AND value = ?)")
+                params += [kind, value]
+        if not clauses:
+            return pd.DataFrame(columns=self.columns[table])
+        return self._frame(
+            f"SELECT {self._select(table)} FROM {table} WHERE row_id IN "
+            f"(SELECT row_id FROM match_keys WHERE tbl = ? AND ({' OR '.join(clauses)})) ORDER BY row_id",
+            [table, *params],
+        )
+
+    def count_exact(self, label: str, value, kind: str) -> int:
+        """Number of (row, column) cells in `label` equal to `value` (see new_kb._any_exact_in_cols)."""
+        if not value:
+            return 0
+        return self._values(
+            "SELECT COUNT(*) FROM match_keys WHERE kind = ? AND value = ? AND tbl = ?",
+            (kind, value, REPORT_TABLES[label]),
+        )[0]
+
+    # ------------------------------------------------------------ catalog queries
+    def table(self, table: str) -> pd.DataFrame:
+        """Full table with its original columns."""
+        return self._frame(f"SELECT {self._select(table)} FROM {table} ORDER BY row_id")
+
+    def pids_for_part_names(self, part_names) -> list[str]:
+        """Vendor-database PIDs of the given part names."""
+        cond, params = self._in("_part_name", part_names)
+        return self._values(f"SELECT DISTINCT _pid FROM {VENDORS} WHERE {cond}", params)
+
+    def pids_for_bom_names(self, bom_names) -> list[str]:
+        """BOM PIDs of the given BOM part names."""
+        cond, params = self._in("_part_name", bom_names)
+        return self._values(f"SELECT DISTINCT _pid FROM {BOM} WHERE {cond}", params)
+
+    def part_names_for_bom_names(self, bom_names) -> list[str]:
+        """Vendor-database part names linked (by PID) to the given BOM part names."""
+        cond, params = self._in("b._part_name", bom_names)
+        return self._values(
+            f"SELECT DISTINCT v._part_name FROM {BOM} b JOIN {VENDORS} v ON v._pid = b._pid WHERE {cond}", params
+        )
+
+    def bom_names(self, part_names=None) -> list[str]:
+        """BOM part names, optionally restricted to the PIDs of the given vendor-database part names."""
+        if not part_names:
+            return self._values(f"SELECT _part_name FROM {BOM} GROUP BY _part_name ORDER BY MIN(row_id)")
+        cond, params = self._in("v._part_name", part_names)
+        return self._values(
+            f"SELECT b._part_name FROM {BOM} b WHERE b._pid IN (SELECT v._pid FROM {VENDORS} v WHERE {cond}) "
+            f"GROUP BY b._part_name ORDER BY MIN(b.row_id)",
+            params,
+        )
+
+    def bom_rows(self, pid: str) -> pd.DataFrame:
+        return self._frame(f"SELECT {self._select(BOM)} FROM {BOM} WHERE _pid = ? ORDER BY row_id", (pid,))
+
+    def vendors_for_part(self, pid: str) -> pd.DataFrame:
+        return self._frame(f"SELECT {self._select(VENDORS)} FROM {VENDORS} WHERE _pid = ? ORDER BY row_id", (pid,))
+
+    def purchase_orders(self, months=None, vendors=None, pids=None) -> pd.DataFrame:
+        """
+        Purchase orders filtered in the engine. A filter left as None is not
+        applied; an empty list matches nothing.
+
+        Returns the original columns with `Amount ($)` as a float, `Date` as an
+        ISO date string and an extra `State` column parsed from `Location`.
+        """
+        cols = [c for c in self.columns[PURCHASE_ORDERS] if c not in ("Amount ($)", "Date")]
+        select = ", ".join([_q(c) for c in cols] + ['_date AS "Date"', '_amount AS "Amount ($)"', '_state AS "State"'])
+        where, params = [], []
+        for column, values in (("_month", months), ("_vendor", vendors), ("_pid", pids)):
+            if values is not None:
+                cond, vals = self._in(column, values)
+                where.append(cond)
+                params += vals
+        sql = f"SELECT {select} FROM {PURCHASE_ORDERS}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        df = self._frame(sql + " ORDER BY row_id", params)
+        return df[self.columns[PURCHASE_ORDERS] + ["State"]]
+
+    def po_vendors(self, months=None) -> list[str]:
+        """Distinct vendors with purchase orders in the given months (all months when empty)."""
+        if not months:
+            return self._values(f"SELECT DISTINCT _vendor FROM {PURCHASE_ORDERS}")
+        cond, params = self._in("_month", months)
+        return self._values(f"SELECT DISTINCT _vendor FROM {PURCHASE_ORDERS} WHERE {cond}", params)
+
+    def po_months(self) -> list[str]:
+        return self._values(
+            f"SELECT _month FROM {PURCHASE_ORDERS} WHERE _month IS NOT NULL GROUP BY _month ORDER BY MIN(row_id)"
+        )
+
+
+_stores: dict = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(bom_csv, po_csv, vendor_csv, db_path: str = CATALOG_DB_FILE) -> CatalogStore:
+    """
+    Returns the store for the given CSVs, rebuilding it only when a source file changed.
+
+    The database file is shared by every worker on the box: a worker that
+    finds a file whose recorded signature matches the sources opens it as is.
+    """
+    signature = _source_signature((bom_csv, po_csv, vendor_csv))
+    with _stores_lock:
+        cached = _stores.get(db_path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        if CatalogStore.stored_signature(db_path) != signature:
+            CatalogStore.build(db_path, bom_csv, po_csv, vendor_csv, signature)
+        store = CatalogStore(db_path)
+        _stores[db_path] = (signature, store)
+        return store
@@ -1,14 +1,25 @@
 #from typing import Dict, List
+import asyncio
+import logging
 import os
 import openai
 import pandas as pd
 #import torch
-from transformers import AutoModelForTableQuestionAnswering, AutoTokenizer, pipeline
 #import subprocess
 #import json
-from openai import OpenAI
 #import ollama
 from dotenv import load_dotenv 
+from dataset_cache import get_dataset
+from llm_client import chat_completion, stream_chat_completion
+from history_manager import fit_history
+from response_cache import get_cache, make_key, file_version
+from table_qa import get_table_qa, TableQABusyError
+from table_retrieval import get_table_index
+from entity_index import get_entity_index
+from query_router import AGGREGATE, classify, build_plan, run_plan, get_table_profile
+from tracing import trace, span
+
+log = logging.getLogger("chatbot")
 
 load_dotenv()
 
@@ -17,86 +28,110 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY not found in environment variables.")
 
-# Initialize the OpenAI client with the environment variable
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Completions go through the shared async client in llm_client.py
+
+# Part of the response cache key: bump when the contextualization or answer prompts below change.
+PROMPT_VERSION = 3
 
+# TAPAS is loaded on first use and shared across requests (model and variant are set in config.py, see table_qa.py)
+
+def _answer_messages(conversation_history: list[dict], tapas_info_for_llm: str) -> list[dict]:
+    """Messages for the final, conversational answer from the extracted data."""
+    # Construct Messages for OpenAI API
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You are a concise medical assistant."
+                "If TAPAS has returned patient data, use it to answer the question."
+                "If no data is returned, say politely: 'I could not find any matching patient in the data.'"
+                "Do not fabricate any dates, names, or details. "
+                "Always keep responses crisp and factual."
+            )
+        }
+    ]
 
+    # Add past conversation turns to the messages
+    messages.extend(conversation_history)
 
-# Load model once
-model_name = "google/tapas-large-finetuned-wtq"
-#model_name = "google/tapas-base-finetuned-wtq"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForTableQuestionAnswering.from_pretrained(model_name)
+    # Add the TAPAS result as a user-like message, informing the LLM.
+    messages.append({"role": "user", "content": f"[Precise Data Extractor Info]: {tapas_info_for_llm}"})
+    messages.append({"role": "user", "content": f"Please generate a polite, concise, and conversational response based on all the above information."})
+    return messages
 
-tapas_qa_pipeline = pipeline(
-    "table-question-answering",
-    model=model,
-    tokenizer=tokenizer,
-    device=-1,  # Ensure it runs on CPU, as requested.
-)
 
-def process_chat_query(query: str, file_path: str, conversation_history: list[dict]=None) -> str:
+async def _prepare_answer_messages(query: str, file_path: str, conversation_history: list[dict],
+                                   session_id: str = None) -> tuple[list[dict] | None, str | None]:
     """
-    Processes a user query using TAPAS for data extraction and a small LLM for conversational formatting,
-    considering conversation history.
+    Runs the data-extraction half of the pipeline (patient matching, query
+    contextualization, TAPAS) and builds the messages for the final answer.
 
-    Args:
-        query (str): The current user's query.
-        csv_path (str): Path to the CSV file.
-        conversation_history (list[dict], optional): A list of dictionaries representing past turns.
-                                                  Defaults to None (empty list).
     Returns:
-        str: The conversational response generated by the hybrid system.
+        tuple: (messages, None) when the LLM should write the answer, or
+        (None, reply) when the pipeline already has the final reply (errors,
+        ambiguous names).
     """
 
     if conversation_history is None:
         conversation_history = [] 
+    # Keep the history within its token budget (older turns are folded into a running summary).
+    with span("history"):
+        conversation_history = await fit_history(conversation_history, session_id=f"{session_id}:demo" if session_id else None)
 
 
     try:
         #df = pd.read_csv(csv_path)
 
-        # IMPORTANT: Convert all DataFrame columns to string type for TAPAS compatibility.
+        # Parsed once per file version and shared with the dashboard (see dataset_cache.py).
+        # TAPAS gets the dataset's string view (all columns converted to str).
         try:
             file_path_str= str(file_path)
-            if file_path_str.endswith((".xlsx", ".xls")):
-                df = pd.read_excel(file_path_str)
-            else:
-                df = pd.read_csv(file_path_str)
-            print(df.head())
+            with span("dataset"):
+                dataset = await asyncio.to_thread(get_dataset, file_path_str)
+            df = dataset.df
         except Exception as e:
-            return f"Error reading file: {e}"
+            return None, f"Error reading file: {e}"
         
-        df_str = df.astype(str)
-
-        patient_names = df['Patient Name'].unique().tolist()
-        query_lower = query.lower()
+        # Row/column index of the string view, built once per file version
+        table_index = get_table_index(dataset)
 
-        matched_patients = [name for name in patient_names if name.lower() in query_lower]
+        # Patient names mentioned in the query, found in one pass with the dataset's entity index
+        with span("entity_lookup"):
+            patients = get_entity_index(dataset, 'Patient Name')
+            matched_patients, first_name_mentions = patients.find(query)
 
         patient_query_attempted = False
 
         # Handle first-name-only queries
         if not matched_patients:
-            first_names = [name.split()[0] for name in patient_names]
-            for fn in first_names:
-                if fn.lower() in query_lower:
-                    patient_query_attempted = True # First name query attempted
-                    fn_matches = df[df['Patient Name'].str.startswith(fn)]
-                    if len(fn_matches) == 1:
-                        matched_patients = [fn_matches.iloc[0]['Patient Name']]
-                    elif len(fn_matches) > 1:
-                        return "There are multiple patients with that first name. Please provide the full name."
+            for fn in first_name_mentions:
+                patient_query_attempted = True # First name query attempted
+                fn_matches = patients.names_with_first_name(fn)
+                if len(fn_matches) == 1:
+                    matched_patients = [fn_matches[0]]
+                elif len(fn_matches) > 1:
+                    return None, "There are multiple patients with that first name. Please provide the full name."
     
 
         if matched_patients:
-            # Patient-specific
-            tapas_query = f"retrieve entire row for patient {matched_patients[0]}"
+            # Patient-specific: the whole row comes straight from the index (no contextualization or TAPAS needed)
+            tapas_info_for_llm = f"The patient record for {matched_patients[0]} is:\n{patients.row_text(matched_patients[0])}"
+            log.info(f"Direct lookup for patient {matched_patients[0]}")
+            return _answer_messages(conversation_history, tapas_info_for_llm), None
         elif patient_query_attempted:
             # Tried matching a first name but couldn't find a single match
-            return "I could not find any matching patient in the data."
+            return None, "I could not find any matching patient in the data."
         else:
-            # Table-level query (general stats)
+            # Table-level query (general stats). Aggregates run as an exact pandas plan over the whole table;
+            # when no safe plan can be built, the query goes through contextualization + TAPAS.
+            if classify(query) == AGGREGATE:
+                with span("aggregate"):
+                    profile = get_table_profile(dataset)
+                    plan = build_plan(query, profile)
+                    result = run_plan(plan, profile) if plan is not None else None
+                if plan is not None:
+                    log.info(f"Aggregate plan: {plan}")
+                    return _answer_messages(conversation_history, f"The exact result computed from the patient data is: {result}"), None
             tapas_query = query
 
         contextualization_messages = [
@@ -122,23 +157,48 @@ def process_chat_query(query: str, file_path: str, conversation_history: list[di
         # Add the current query
         contextualization_messages.append({"role": "user", "content": tapas_query})
 
-        try:
-            contextualized_completion = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=contextualization_messages,
-                temperature=0.0,
-                max_tokens=200,
-            )
-            contextualized_query = contextualized_completion.choices[0].message.content.strip()
-            print(f"Contextualized Query for TAPAS: {contextualized_query}") # For debugging
-        except Exception as e:
-            print(f"Error during query contextualization: {e}. Using original query.")
-            contextualized_query = query
+        with span("contextualize"):
+            try:
+                contextualized_completion = await chat_completion(
+                    contextualization_messages,
+                    model="gpt-4o-mini",
+                    temperature=0.0,
+                    max_tokens=200,
+                )
+                contextualized_query = contextualized_completion.choices[0].message.content.strip()
+                log.info(f"Contextualized query for TAPAS: {contextualized_query}")
+            except Exception as e:
+                log.warning(f"Error during query contextualization: {e}. Using original query.")
+                contextualized_query = query
 
 
 
         # Use TAPAS to get a precise answer from the table
-        tapas_result = tapas_qa_pipeline(table=df_str, query=contextualized_query)
+        # (CPU-bound, so it runs on the engine's inference threads to keep the event loop free)
+        # Only the rows and columns relevant to the question are passed, as far as needed to fit TAPAS's input.
+        table_qa = get_table_qa()
+        with span("table_retrieval"):
+            table_slice = await asyncio.to_thread(
+                table_index.select, contextualized_query, lambda t: table_qa.fits(t, contextualized_query)
+            )
+        if table_slice is None:
+            # Needs every row, but the table does not fit: answer exactly when a plan can be built,
+            # otherwise pass the full table (TAPAS truncates it)
+            with span("aggregate"):
+                profile = get_table_profile(dataset)
+                plan = build_plan(contextualized_query, profile)
+                result = run_plan(plan, profile) if plan is not None else None
+            if plan is not None:
+                log.info(f"Aggregate plan: {plan}")
+                return _answer_messages(conversation_history, f"The exact result computed from the patient data is: {result}"), None
+            log.warning(f"Table does not fit TAPAS's input for a table-level question; passing all {len(df)} rows")
+            table_slice = dataset.string_view
+        log.info(f"TAPAS table slice: {table_slice.shape[0]} of {len(df)} rows, {table_slice.shape[1]} of {df.shape[1]} columns")
+        try:
+            with span("tapas"):
+                tapas_result = await table_qa.answer(table_slice, contextualized_query)
+        except TableQABusyError:
+            return None, "The data extractor is busy with other questions right now. Please try again in a moment."
         tapas_raw_answer = tapas_result['answer']
         
         # Prepare the TAPAS answer for the OpenAI LLM
@@ -148,55 +208,111 @@ def process_chat_query(query: str, file_path: str, conversation_history: list[di
         else:
             tapas_info_for_llm = f"The precise information extracted from the patient data for the current query is: \"{tapas_raw_answer}\"."
         
-        print(tapas_info_for_llm)
+        log.info(tapas_info_for_llm)
 
-        # Construct Messages for OpenAI API
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are a concise medical assistant."
-                    "If TAPAS has returned patient data, use it to answer the question."
-                    "If no data is returned, say politely: 'I could not find any matching patient in the data.'"
-                    "Do not fabricate any dates, names, or details. "
-                    "Always keep responses crisp and factual."
-                )
-            }
-        ]
-        
-        # Add past conversation turns to the messages
-        messages.extend(conversation_history)
+        return _answer_messages(conversation_history, tapas_info_for_llm), None
+
+    except FileNotFoundError:
+        return None, f"Error: The CSV file was not found at the specified path: '{file_path_str}'. Please check the file path."
+    except pd.errors.EmptyDataError:
+        return None, f"Error: The CSV file at '{file_path_str}' is empty. Please ensure it contains data."
+    except Exception as e:
+        # Catch other potential errors during file reading or DataFrame conversion
+        return None, f"An unexpected error occurred during data processing: {e}. Please review the CSV file format or the query."
 
-        # Add the TAPAS result as a user-like message, informing the LLM.
-        messages.append({"role": "user", "content": f"[Precise Data Extractor Info]: {tapas_info_for_llm}"})
-        messages.append({"role": "user", "content": f"Please generate a polite, concise, and conversational response based on all the above information."})
 
+def _response_cache_key(query: str, file_path: str, conversation_history: list[dict]) -> str | None:
+    """Response cache key of a query against the current version of the data file (None: do not cache)."""
+    try:
+        return make_key(query, file_version(str(file_path)), PROMPT_VERSION, conversation_history)
+    except OSError:
+        return None
+
+
+def _openai_error_message(e: Exception) -> str:
+    if isinstance(e, openai.APIConnectionError):
+        return f"Error: Could not connect to OpenAI API. Please check your internet connection and API key. Details: {e}"
+    if isinstance(e, openai.RateLimitError):
+        return f"Error: OpenAI API rate limit exceeded. Please wait a moment and try again. Details: {e}"
+    if isinstance(e, openai.APIStatusError):
+        return f"Error from OpenAI API with status {e.status_code}: {e.response}. Check your API key or model availability."
+    return f"An unexpected error occurred while interacting with OpenAI API: {e}. Please try again."
+
+
+async def process_chat_query(query: str, file_path: str, conversation_history: list[dict]=None, use_cache: bool = True,
+                             session_id: str = None) -> str:
+    """
+    Processes a user query using TAPAS for data extraction and a small LLM for conversational formatting,
+    considering conversation history.
+
+    Args:
+        query (str): The current user's query.
+        file_path (str): Path to the uploaded Excel / CSV file.
+        conversation_history (list[dict], optional): A list of dictionaries representing past turns.
+                                                  Defaults to None (empty list).
+        use_cache (bool): Set to False to bypass the response cache.
+        session_id (str, optional): Session of the conversation; its history summary is cached per session
+                                    (see history_manager.py). None keys it by the conversation's first turn.
+    Returns:
+        str: The conversational response generated by the hybrid system.
+    """
+    with trace("demo"):
+        cache = get_cache("demo") if use_cache else None
+        cache_key = _response_cache_key(query, file_path, conversation_history) if cache is not None else None
+        if cache_key:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        messages, reply = await _prepare_answer_messages(query, file_path, conversation_history, session_id)
+        if reply is not None:
+            return reply
 
         try:
             # Make the API call to OpenAI
-            chat_completion = client.chat.completions.create(
-                model="gpt-4o-mini", 
-                messages=messages,
-                temperature=0.0, # Controls randomness: 0.0 (deterministic) to 1.0 (very creative)
-                max_tokens=500, # Limit response length
-            )
-            response = chat_completion.choices[0].message.content.strip()
+            with span("completion"):
+                completion = await chat_completion(
+                    messages,
+                    model="gpt-4o-mini",
+                    temperature=0.0, # Controls randomness: 0.0 (deterministic) to 1.0 (very creative)
+                    max_tokens=500, # Limit response length
+                )
+            response = completion.choices[0].message.content.strip()
+            if cache_key:
+                cache.set(cache_key, response)
             return response
-
-        except openai.APIConnectionError as e:
-            return f"Error: Could not connect to OpenAI API. Please check your internet connection and API key. Details: {e}"
-        except openai.RateLimitError as e:
-            return f"Error: OpenAI API rate limit exceeded. Please wait a moment and try again. Details: {e}"
-        except openai.APIStatusError as e:
-            return f"Error from OpenAI API with status {e.status_code}: {e.response}. Check your API key or model availability."
         except Exception as e:
-            return f"An unexpected error occurred while interacting with OpenAI API: {e}. Please try again."
+            return _openai_error_message(e)
 
-    except FileNotFoundError:
-        return f"Error: The CSV file was not found at the specified path: '{file_path_str}'. Please check the file path."
-    except pd.errors.EmptyDataError:
-        return f"Error: The CSV file at '{file_path_str}' is empty. Please ensure it contains data."
-    except Exception as e:
-        # Catch other potential errors during file reading or DataFrame conversion
-        return f"An unexpected error occurred during data processing: {e}. Please review the CSV file format or the query."
 
+async def stream_chat_query(query: str, file_path: str, conversation_history: list[dict]=None, use_cache: bool = True,
+                            session_id: str = None):
+    """
+    Streaming variant of `process_chat_query`: yields the response text as
+    the LLM produces it (a single chunk when the pipeline answers locally).
+    """
+    with trace("demo"):
+        cache = get_cache("demo") if use_cache else None
+        cache_key = _response_cache_key(query, file_path, conversation_history) if cache is not None else None
+        if cache_key:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        messages, reply = await _prepare_answer_messages(query, file_path, conversation_history, session_id)
+        if reply is not None:
+            yield reply
+            return
+
+        parts = []
+        try:
+            with span("completion"):
+                async for token in stream_chat_completion(messages, model="gpt-4o-mini", temperature=0.0, max_tokens=500):
+                    parts.append(token)
+                    yield token
+        except Exception as e:
+            yield _openai_error_message(e)
+            return
+        if cache_key:
+            cache.set(cache_key, "".join(parts).strip())
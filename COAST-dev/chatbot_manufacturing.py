@@ -1,7 +1,17 @@
+import logging
 import os 
-from openai import OpenAI
 from dotenv import load_dotenv
-from config import PROMPT_TEMPLATE_FILE
+from llm_client import chat_completion, stream_chat_completion
+from config import PROMPT_TEMPLATE_FILE, CONTEXT_TOKEN_BUDGET, RETRIEVAL_TOP_K, CATALOG_BOM_CSV, CATALOG_PO_CSV, CATALOG_VENDOR_CSV
+from retrieval import retrieve_context
+from prompt_builder import read_cached, build_manufacturing_messages
+from catalog_store import get_store
+from vendor_scoring import is_vendor_query, resolve_part_id, rank_part_vendors, format_scores
+from history_manager import fit_history
+from response_cache import get_cache, make_key
+from tracing import trace, span
+
+log = logging.getLogger("chatbot_manufacturing")
 
 load_dotenv()
 
@@ -10,72 +20,149 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY not found in environment variables.")
 
-# Initialize the OpenAI client with the environment variable
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Completions go through the shared async client in llm_client.py
 
 #LLM_TEXT_FILE = r"/Users/harishreekarthik/Downloads/Xforia_COAST/demo/CAD_knowledge_all.txt"
 
-def process_manufacturing_chat(user_query: str, context_file: str, conversation_history: list[dict] = None) -> str: 
+async def _prepare_manufacturing_messages(user_query: str, context_file: str, conversation_history: list[dict], stats: dict = None,
+                                          use_cache: bool = True, session_id: str = None):
     """
-    Retrieves the combined data from the prepared text file and uses it
-    to ground an LLM's response, including a vendor scoring system.
+    Builds the grounded messages for a manufacturing query.
 
-    Args:
-        user_query (str): The user's question or command.
-
-    Returns: 
-        str: A conversational response from the LLM.
+    Returns:
+        tuple: (messages, None, cache_key), or (None, reply, None) when
+        `reply` is the message to send back instead (a cached answer, or the
+        context or template cannot be read). `cache_key` is None when the
+        response should not be cached.
     """
 
     if conversation_history is None: 
         conversation_history = []
     
-    # 1. Read the prepared text file for LLM grounding.
-    try:
-        with open(context_file, 'r') as f:
-            grounding_data = f.read()
-    except FileNotFoundError:
-        return "Please upload an AutoCAD DXF file first to provide context for the chatbot."
-    except Exception as e:
-        return f"An error occurred while reading the context data: {e}"
+    # 1. Retrieve the sections of the prepared text file relevant to this query for LLM grounding.
+    #    Recent user turns are included so follow-ups ("what about the second vendor?") keep their part.
+    recent_user_turns = [m["content"] for m in conversation_history if m.get("role") == "user"][-2:]
+    retrieval_query = " ".join(recent_user_turns + [user_query])
+    with span("retrieval"):
+        try:
+            grounding_data = retrieve_context(context_file, retrieval_query, CONTEXT_TOKEN_BUDGET, RETRIEVAL_TOP_K)
+        except FileNotFoundError:
+            return None, "Please upload an AutoCAD DXF file first to provide context for the chatbot.", None
+        except Exception as e:
+            return None, f"An error occurred while reading the context data: {e}", None
 
     # 2. Define the scoring system and instructions for the LLM.
     try:
-        with open(PROMPT_TEMPLATE_FILE, 'r') as f:
-            unbiased_selection_system = f.read()
+        unbiased_selection_system = read_cached(PROMPT_TEMPLATE_FILE)
     except FileNotFoundError:
-        return f"LLM prompt template file not found at {PROMPT_TEMPLATE_FILE}."
+        return None, f"LLM prompt template file not found at {PROMPT_TEMPLATE_FILE}.", None
     except Exception as e:
-        return f"An error occurred while reading the prompt template: {e}"
-
-    # 3. Construct the full prompt for the LLM.
-    llm_prompt = f"""
-    {unbiased_selection_system}
-
-    ## Provided Context Data:
-    {grounding_data}
-
-    ## User Query:
-    {user_query}
-
-    Based on your understanding, please respond to the user's query. If a vendor recommendation is requested, follow the specified output format. Otherwise, provide a concise and factual answer.
+        return None, f"An error occurred while reading the prompt template: {e}", None
+
+    # 3. For vendor-selection queries, rank the part's vendors locally so the LLM only writes them up.
+    #    The score table then replaces the retrieved grounding in the prompt (see prompt_builder.py).
+    vendor_scores = None
+    with span("vendor_scoring"):
+        if is_vendor_query(user_query):
+            pid = resolve_part_id(user_query, *reversed(recent_user_turns), grounding_data)
+            if pid:
+                try:
+                    store = get_store(CATALOG_BOM_CSV, CATALOG_PO_CSV, CATALOG_VENDOR_CSV)
+                    ranking = rank_part_vendors(store, pid)
+                    if ranking is not None:
+                        vendor_scores = format_scores(pid, ranking)
+                except Exception as e:
+                    log.warning(f"Vendor scoring unavailable, leaving it to the LLM: {e}")
+
+    # 4. Answer repeated questions (same grounding, template and conversation state) from the response cache.
+    cache = get_cache("manufacturing") if use_cache else None
+    cache_key = None
+    if cache is not None:
+        cache_key = make_key(user_query, [grounding_data, vendor_scores], unbiased_selection_system, conversation_history)
+        cached = cache.get(cache_key)
+        if stats is not None:
+            stats["cache_hit"] = cached is not None
+        if cached is not None:
+            return None, cached, None
+
+    # 5. Construct the prompt: stable template first, then grounding, history and the query once.
+    #    The history is kept within its token budget (older turns are folded into a running summary).
+    with span("history"):
+        conversation_history = await fit_history(conversation_history, session_id=f"{session_id}:manufacturing" if session_id else None)
+    messages_input, prompt_tokens = build_manufacturing_messages(
+        unbiased_selection_system, grounding_data, conversation_history, user_query, vendor_scores
+    )
+    log.info(f"Manufacturing chat prompt tokens: {prompt_tokens}")
+    if stats is not None:
+        stats["prompt_tokens"] = prompt_tokens
+
+    return messages_input, None, cache_key
+
+
+async def process_manufacturing_chat(user_query: str, context_file: str, conversation_history: list[dict] = None, stats: dict = None,
+                                     use_cache: bool = True, session_id: str = None) -> str:
     """
+    Retrieves the combined data from the prepared text file and uses it
+    to ground an LLM's response, including a vendor scoring system.
 
-    messages_input = [
-            {"role": "system", "content": llm_prompt},
-            *conversation_history,
-            {"role": "user", "content": user_query},
-        ]
+    Args:
+        user_query (str): The user's question or command.
+        context_file (str): Path to the grounding text file.
+        conversation_history (list[dict], optional): Past turns of the conversation.
+        stats (dict, optional): Filled with request statistics (`prompt_tokens`, `cache_hit`).
+        use_cache (bool): Set to False to bypass the response cache.
+        session_id (str, optional): Session of the conversation; its history summary is cached per
+            session (see history_manager.py). None keys it by the conversation's first turn.
 
-    try:
-        chat_completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages= messages_input,
-            temperature=0.5,
-            #max_tokens=500
+    Returns: 
+        str: A conversational response from the LLM.
+    """
+    with trace("manufacturing"):
+        messages_input, reply, cache_key = await _prepare_manufacturing_messages(
+            user_query, context_file, conversation_history, stats, use_cache, session_id
         )
-        response = chat_completion.choices[0].message.content.strip()
-        return response
-
-    except Exception as e:
-        return f"An unexpected error occurred while interacting with the LLM API: {e}. Please try again."
+        if reply is not None:
+            return reply
+
+        try:
+            with span("completion"):
+                completion = await chat_completion(
+                    messages_input,
+                    model="gpt-4o-mini",
+                    temperature=0.5,
+                    #max_tokens=500
+                )
+            response = completion.choices[0].message.content.strip()
+            if cache_key:
+                get_cache("manufacturing").set(cache_key, response)
+            return response
+
+        except Exception as e:
+            return f"An unexpected error occurred while interacting with the LLM API: {e}. Please try again."
+
+
+async def stream_manufacturing_chat(user_query: str, context_file: str, conversation_history: list[dict] = None, stats: dict = None,
+                                    use_cache: bool = True, session_id: str = None):
+    """
+    Streaming variant of `process_manufacturing_chat`: yields the response
+    text as the LLM produces it.
+    """
+    with trace("manufacturing"):
+        messages_input, reply, cache_key = await _prepare_manufacturing_messages(
+            user_query, context_file, conversation_history, stats, use_cache, session_id
+        )
+        if reply is not None:
+            yield reply
+            return
+
+        parts = []
+        try:
+            with span("completion"):
+                async for token in stream_chat_completion(messages_input, model="gpt-4o-mini", temperature=0.5):
+                    parts.append(token)
+                    yield token
+        except Exception as e:
+            yield f"An unexpected error occurred while interacting with the LLM API: {e}. Please try again."
+            return
+        if cache_key:
+            get_cache("manufacturing").set(cache_key, "".join(parts).strip())
@@ -0,0 +1,186 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+
+When the same work is requested again while it is still running (a team
+opening the same drawing, the same manufacturing question sent twice),
+the later calls wait for the running one and share its result instead of
+starting their own:
+
+    result = await coalesce("ocr", content_key(pdf_bytes), lambda: asyncio.to_thread(ocr, ...))
+
+    async for token in coalesce_stream("llm_stream", key, lambda: stream(...)):
+        ...
+
+The shared work runs as its own task, so a caller that goes away (client
+disconnect) does not cancel it for the others; it is cancelled only once
+every caller has gone. Streams are replayed from the first chunk to callers
+that join late. A key is forgotten as soon as its work finishes - repeated
+requests after that are the response caches' job.
+
+Per coalescer, `coast_coalesce_calls_total{coalescer, role}` counts leaders
+(calls that ran the work) and waiters (calls that shared it), and
+`coast_coalesce_waiters{coalescer}` summarizes the waiters per flight (see
+tracing.py). Coalescing is disabled by config.COALESCE_ENABLED = False.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+
+from config import COALESCE_ENABLED
+from tracing import inc, observe
+
+log = logging.getLogger("coalesce")
+
+
+def content_key(*parts) -> str:
+    """Hex digest of `parts` (JSON-serializable values; bytes are hashed as-is)."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            h.update(bytes(part))
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.task: asyncio.Task | None = None
+        self.callers = 1  # callers still waiting for the result
+        self.waiters = 0  # callers that joined after the first
+        self.chunks: list = []  # streamed so far (streams only)
+        self.changed = asyncio.Event()
+
+    def notify(self) -> None:
+        event, self.changed = self.changed, asyncio.Event()
+        event.set()
+
+
+class Coalescer:
+    """In-flight calls of one kind of work, by key (per event loop)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: dict = {}  # key -> _Flight
+
+    def _join(self, key: str) -> _Flight | None:
+        flight = self._flights.get(key)
+        if flight is None or flight.task.done() or flight.task.get_loop() is not asyncio.get_running_loop():
+            return None
+        flight.callers += 1
+        flight.waiters += 1
+        inc("coast_coalesce_calls_total", coalescer=self.name, role="waiter")
+        log.info(f"{self.name}: joined in-flight call ({flight.waiters} waiting)")
+        return flight
+
+    def _start(self, key: str, work) -> _Flight:
+        flight = _Flight()
+        flight.task = asyncio.create_task(work(flight))
+        self._flights[key] = flight
+        inc("coast_coalesce_calls_total", coalescer=self.name, role="leader")
+        flight.task.add_done_callback(lambda task: self._finish(key, flight))
+        return flight
+
+    def _finish(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        observe("coast_coalesce_waiters", flight.waiters, coalescer=self.name)
+        if not flight.task.cancelled():
+            flight.task.exception()  # retrieved here so an unawaited failure is not logged as lost
+
+    def _leave(self, flight: _Flight) -> None:
+        flight.callers -= 1
+        if flight.callers == 0 and not flight.task.done():
+            flight.task.cancel()  # nobody is left to receive the result
+
+    async def run(self, key: str, fn):
+        """
+        Result of `await fn()`, shared with concurrent calls of the same key.
+
+        Args:
+            key (str): Content key of the work (see `content_key`).
+            fn: Zero-argument callable returning an awaitable.
+
+        Raises:
+            Exception: Whatever the shared call raised, in every caller.
+        """
+        flight = self._join(key)
+        if flight is None:
+            async def work(_):
+                return await fn()
+            flight = self._start(key, work)
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            self._leave(flight)
+            raise
+
+    async def stream(self, key: str, factory):
+        """
+        Yields the chunks of `factory()` (an async iterator), shared with
+        concurrent calls of the same key; late callers get every chunk from
+        the first one.
+        """
+        flight = self._join(key)
+        if flight is None:
+            async def work(flight):
+                try:
+                    async for chunk in factory():
+                        flight.chunks.append(chunk)
+                        flight.notify()
+                finally:
+                    flight.notify()
+            flight = self._start(key, work)
+
+        pos = 0
+        try:
+            while True:
+                changed = flight.changed
+                while pos < len(flight.chunks):
+                    yield flight.chunks[pos]
+                    pos += 1
+                if flight.task.done():
+                    if pos < len(flight.chunks):
+                        continue
+                    flight.task.result()  # re-raises the shared stream's error
+                    return
+                await changed.wait()
+        finally:
+            self._leave(flight)
+
+    def in_flight(self) -> dict:
+        return {"calls": len(self._flights), "waiters": sum(f.waiters for f in self._flights.values())}
+
+
+_coalescers: dict[str, Coalescer] = {}
+
+
+def get_coalescer(name: str) -> Coalescer:
+    if name not in _coalescers:
+        _coalescers[name] = Coalescer(name)
+    return _coalescers[name]
+
+
+async def coalesce(name: str, key: str, fn):
+    """`await fn()`, shared with identical in-flight calls of coalescer `name`."""
+    if not COALESCE_ENABLED:
+        return await fn()
+    return await get_coalescer(name).run(key, fn)
+
+
+async def coalesce_stream(name: str, key: str, factory):
+    """`async for` over `factory()`, shared with identical in-flight streams of coalescer `name`."""
+    if not COALESCE_ENABLED:
+        async for chunk in factory():
+            yield chunk
+        return
+    async for chunk in get_coalescer(name).stream(key, factory):
+        yield chunk
+
+
+def coalesce_stats() -> dict:
+    """Calls currently in flight and their waiters, per coalescer."""
+    return {name: c.in_flight() for name, c in _coalescers.items()}
@@ -0,0 +1,132 @@
+"""
+Columnar sidecar files for uploaded tables.
+
+Every uploaded spreadsheet / CSV is converted once into an uncompressed
+Arrow IPC (Feather v2) file stored next to the upload, e.g.
+
+    uploads/Xforia_Coast_Demo_15.xlsx
+    uploads/Xforia_Coast_Demo_15.xlsx.arrow
+
+Readers go through `read_table`, which memory-maps the sidecar when it is
+present and at least as new as the source, and only falls back to parsing
+the original Excel / CSV text when it is missing, stale or unreadable.
+"""
+
+import logging
+import os
+import pathlib
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow is optional; readers fall back to the source file
+    pa = None
+    feather = None
+
+log = logging.getLogger("columnar_cache")
+
+COLUMNAR_SUFFIX = ".arrow"
+EXCEL_SUFFIXES = (".xlsx", ".xls")
+
+
+def columnar_path(source) -> pathlib.Path:
+    """Sidecar path for `source` (the full original name is kept so x.xlsx and x.csv never collide)."""
+    p = pathlib.Path(source)
+    return p.with_name(p.name + COLUMNAR_SUFFIX)
+
+
+def is_fresh(source) -> bool:
+    """True when the sidecar exists and is not older than the source file."""
+    src, col = pathlib.Path(source), columnar_path(source)
+    try:
+        return col.stat().st_mtime >= src.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def parse_source(source, **read_kwargs) -> pd.DataFrame:
+    """Parses the original Excel / CSV file (the slow path)."""
+    source_str = str(source)
+    if source_str.endswith(EXCEL_SUFFIXES):
+        return pd.read_excel(source_str, **read_kwargs)
+    return pd.read_csv(source_str, **read_kwargs)
+
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    # Arrow needs one type per column; Excel often yields object columns
+    # mixing numbers and text, which are stored as text instead.
+    mixed = [
+        c for c in df.columns
+        if df[c].dtype == object and pd.api.types.infer_dtype(df[c], skipna=True).startswith("mixed")
+    ]
+    if not mixed:
+        return df
+    df = df.copy()
+    for c in mixed:
+        df[c] = df[c].where(df[c].isna(), df[c].astype(str))
+    return df
+
+
+def write_columnar(df: pd.DataFrame, source) -> pathlib.Path | None:
+    """
+    Writes `df` as the columnar sidecar of `source`.
+
+    The file is written uncompressed (so it can be memory-mapped without a
+    decode step) to a temporary name and atomically renamed into place, so a
+    concurrent reader never sees a half-written file.
+
+    Returns:
+        The sidecar path, or None when pyarrow is unavailable or the frame
+        could not be converted.
+    """
+    if feather is None:
+        return None
+    target = columnar_path(source)
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    try:
+        table = pa.Table.from_pandas(_arrow_safe(df), preserve_index=False)
+        feather.write_feather(table, str(tmp), compression="uncompressed")
+        os.replace(tmp, target)
+    except Exception as e:
+        log.warning(f"Could not write columnar cache for {source}: {e}")
+        tmp.unlink(missing_ok=True)
+        return None
+    log.info(f"Wrote columnar cache {target} ({len(df)} rows)")
+    return target
+
+
+def build_columnar(source) -> pathlib.Path | None:
+    """Parses `source` once and writes its sidecar. Meant to run as a background task."""
+    try:
+        df = parse_source(source)
+    except Exception as e:
+        log.warning(f"Could not parse {source} for columnar cache: {e}")
+        return None
+    return write_columnar(df, source)
+
+
+def read_table(source, build: bool = False) -> pd.DataFrame:
+    """
+    Loads the table behind `source`, memory-mapping its columnar sidecar when fresh.
+
+    Args:
+        source (str | Path): Path to the original Excel / CSV upload.
+        build (bool): When the sidecar is missing or stale, write it after the
+            fallback parse so the next reader gets the fast path.
+
+    Returns:
+        pd.DataFrame: The parsed table.
+    """
+    if feather is not None and is_fresh(source):
+        try:
+            table = feather.read_table(str(columnar_path(source)), memory_map=True)
+            return table.to_pandas()
+        except Exception as e:
+            log.warning(f"Columnar cache for {source} unreadable, falling back: {e}")
+
+    df = parse_source(source)
+    if build:
+        write_columnar(df, source)
+    return df
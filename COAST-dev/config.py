@@ -1 +1,83 @@
-PROMPT_TEMPLATE_FILE = r"/Users/harishreekarthik/Downloads/Xforia_COAST/demo/prompt_template_file.txt"
\ No newline at end of file
+PROMPT_TEMPLATE_FILE = r"/Users/harishreekarthik/Downloads/Xforia_COAST/demo/prompt_template_file.txt"
+
+# Embedded SQLite store for the BOM / purchase order / vendor catalog (see catalog_store.py)
+CATALOG_DB_FILE = "uploads/catalog.sqlite3"
+CATALOG_BOM_CSV = "uploads/CAD_Parts_BOM_Complete.csv"
+CATALOG_PO_CSV = "uploads/CAD_Parts_Purchase_Orders.csv"
+CATALOG_VENDOR_CSV = "uploads/CAD_Parts_Vendor_Database.csv"
+
+# Unified per-part knowledge file (see knowledge_builder.py)
+KNOWLEDGE_FILE = "CAD_knowledge_all.txt"
+
+# Manufacturing chat grounding: token budget and chunk count for retrieval (see retrieval.py)
+CONTEXT_TOKEN_BUDGET = 3000
+RETRIEVAL_TOP_K = 8
+
+# Shared async LLM client (see llm_client.py). LLM_BASE_URL=None uses the OpenAI API;
+# point it at a local mock server (e.g. http://127.0.0.1:8081/v1) for testing.
+LLM_BASE_URL = None
+LLM_MAX_CONCURRENCY = 8
+LLM_MAX_CONNECTIONS = 20
+LLM_TIMEOUT_SECONDS = 60
+LLM_MAX_RETRIES = 4
+LLM_BACKOFF_BASE_SECONDS = 0.5
+LLM_BACKOFF_MAX_SECONDS = 20
+
+# Conversation history sent to the LLM (see history_manager.py)
+HISTORY_TOKEN_BUDGET = 1500
+HISTORY_SUMMARY_MAX_TOKENS = 300
+HISTORY_MAX_SESSIONS = 1024
+
+# Chat response cache (see response_cache.py). Entries live in memory and in a local SQLite file.
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_DB_FILE = "uploads/response_cache.sqlite3"
+RESPONSE_CACHE_MAX_ENTRIES = 5000
+RESPONSE_CACHE_MEMORY_ENTRIES = 500
+RESPONSE_CACHE_TTL_SECONDS = 24 * 3600
+
+# Per-session API state (see sessions.py). "sqlite" shares sessions across uvicorn workers; "memory" is single-process.
+SESSION_BACKEND = "sqlite"
+SESSION_DB_FILE = "uploads/sessions.sqlite3"
+SESSION_TTL_SECONDS = 7 * 24 * 3600
+SESSION_MAX_IN_MEMORY = 10000
+
+# Table QA (TAPAS) for the demo chat (see table_qa.py). "int8" = dynamically quantized CPU model, "fp32" = original weights.
+# google/tapas-base-finetuned-wtq is a faster, smaller alternative model.
+TABLE_QA_MODEL = "google/tapas-large-finetuned-wtq"
+TABLE_QA_VARIANT = "int8"
+TABLE_QA_CACHE_DIR = "models"
+TABLE_QA_WORKERS = 1
+TABLE_QA_MAX_PENDING = 8
+TABLE_QA_TORCH_THREADS = None  # None keeps torch's default
+TABLE_QA_MAX_ROWS = 16  # rows passed to TAPAS for row-specific questions (see table_retrieval.py)
+TABLE_QA_MAX_TOKENS = 512  # TAPAS input limit (question + tokenized table); larger tables are cut down or truncated
+
+# Parsed uploaded datasets shared by the demo chatbot and dashboard (see dataset_cache.py)
+DATASET_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Chat pipeline metrics (see tracing.py): quantiles cover the last METRICS_WINDOW observations of each series
+METRICS_WINDOW = 1024
+TRACE_HISTORY = 100  # finished request traces kept for GET /metrics/traces
+
+# Supply Chain Hub: resolved dropdown selections (rows + KPIs) kept per catalog version (see filter_engine.py)
+DASHBOARD_FILTER_CACHE_SIZE = 256
+
+# Supply Chain Hub figures per catalog version and selection (see figure_cache.py), shared by all workers
+FIGURE_CACHE_ENABLED = True
+FIGURE_CACHE_DB_FILE = "uploads/figure_cache.sqlite3"
+FIGURE_CACHE_MAX_ENTRIES = 2000
+FIGURE_CACHE_MEMORY_ENTRIES = 500
+FIGURE_CACHE_MEMORY_BYTES = 64 * 1024 * 1024  # characters of figure JSON kept in memory per worker
+FIGURE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+# Supply Chain Hub filtering in the browser: the catalog is shipped once per page load as a compact
+# snapshot and the dropdown callbacks run clientside (see assets/supply_chain_filters.js)
+DASHBOARD_CLIENTSIDE_FILTERING = False
+
+# Supply Chain Hub map / timeline level of detail (see po_rollups.py): larger selections are plotted
+# per state and per time bucket instead of one point per purchase order
+DASHBOARD_MAP_DETAIL_ROWS = 2000
+DASHBOARD_TIMELINE_MAX_POINTS = 500
+
+# Identical in-flight OCR runs, report generations and LLM calls share one computation (see coalesce.py)
+COALESCE_ENABLED = True
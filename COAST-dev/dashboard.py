@@ -1,9 +1,10 @@
 import pandas as pd
 import plotly.express as px
 import numpy as np
+from dataset_cache import get_dataset
 
 def get_individual_chart_data(file_path: str):
-    df = pd.read_excel(file_path)
+    df = get_dataset(file_path).df
     charts_data = []
 
     def create_and_append(fig):
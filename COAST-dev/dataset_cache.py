@@ -0,0 +1,147 @@
+"""
+Process-wide cache of parsed datasets (uploaded patient workbooks / CSVs).
+
+`get_dataset(path)` returns a `Dataset` with the typed DataFrame (read via
+columnar_cache.read_table), keyed by path + mtime + size, so the chatbot
+and the dashboard share one parsed copy per file version. A dataset also
+carries what is derived from it:
+
+    string_view           df.astype(str), as TAPAS expects
+    derived(name, build)  per-dataset indexes (table_index, entity_index,
+                          query_router profiles), built once per version
+
+Entries are evicted least recently used once their total size passes
+DATASET_CACHE_MAX_BYTES. Loading is single-flight: concurrent requests for
+the same file version wait for one parse instead of each parsing it.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from columnar_cache import read_table
+from config import DATASET_CACHE_MAX_BYTES
+from tracing import record_cache
+
+log = logging.getLogger("dataset_cache")
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class Dataset:
+    """One parsed version of a dataset file and the artifacts derived from it."""
+
+    def __init__(self, path: str, version: tuple, df: pd.DataFrame):
+        self.path = path
+        self.version = version
+        self.df = df
+        self.nbytes = _frame_bytes(df)
+        self._derived: dict = {}
+        self._lock = threading.RLock()  # builders may use other artifacts (e.g. string_view)
+
+    def derived(self, name: str, build):
+        """Artifact `name` of this dataset, built with `build()` on first use."""
+        value = self._derived.get(name)
+        if value is None:
+            with self._lock:
+                value = self._derived.get(name)
+                if value is None:
+                    value = self._derived[name] = build()
+                    if isinstance(value, pd.DataFrame):
+                        self.nbytes += _frame_bytes(value)
+        return value
+
+    @property
+    def string_view(self) -> pd.DataFrame:
+        return self.derived("string_view", lambda: self.df.astype(str))
+
+
+def file_version(path: str) -> tuple:
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+class DatasetCache:
+    """LRU of `Dataset`s bounded by memory, with single-flight loading."""
+
+    def __init__(self, max_bytes: int = DATASET_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()  # version -> Dataset
+        self._loading: dict = {}  # version -> lock held while that version is parsed
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, path) -> Dataset:
+        """
+        Dataset of the file at `path`, parsed at most once per file version.
+
+        Raises:
+            FileNotFoundError: When `path` does not exist.
+        """
+        path = str(path)
+        version = file_version(path)
+        with self._lock:
+            dataset = self._entries.get(version)
+            if dataset is not None:
+                self._entries.move_to_end(version)
+                self.hits += 1
+                record_cache("dataset", True)
+                return dataset
+            load_lock = self._loading.setdefault(version, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                dataset = self._entries.get(version)
+                if dataset is not None:  # loaded by a concurrent request while we waited
+                    self._entries.move_to_end(version)
+                    self.hits += 1
+                    record_cache("dataset", True)
+                    return dataset
+            try:
+                dataset = Dataset(path, version, read_table(path))
+            except Exception:
+                with self._lock:
+                    self._loading.pop(version, None)
+                raise
+            with self._lock:
+                self._loading.pop(version, None)
+                self.misses += 1
+                record_cache("dataset", False)
+                for old in [v for v in self._entries if v[0] == version[0]]:
+                    del self._entries[old]  # older versions of the same file
+                self._entries[version] = dataset
+                self._evict()
+            log.info(f"Loaded {path}: {dataset.df.shape[0]} rows, {dataset.nbytes / 1e6:.1f} MB")
+            return dataset
+
+    def _evict(self) -> None:
+        total = sum(d.nbytes for d in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, dataset = self._entries.popitem(last=False)
+            total -= dataset.nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "datasets": len(self._entries),
+                "bytes": sum(d.nbytes for d in self._entries.values()),
+            }
+
+
+_cache = DatasetCache()
+
+
+def get_dataset(path) -> Dataset:
+    """The process-wide cached `Dataset` of `path`."""
+    return _cache.get(path)
+
+
+def dataset_cache_stats() -> dict:
+    return _cache.stats()
@@ -2,21 +2,23 @@ import pandas as pd
 import dash
 from dash import dcc, html, dash_table
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output
+from dash.dependencies import ClientsideFunction, Input, Output
+from dash.exceptions import PreventUpdate
 import plotly.express as px
 from dash import html
+from supply_chain import get_supply_chain_model
+from figure_cache import cached_figure
+from po_rollups import BUCKET_NAMES, state_rollup, timeline_range, timeline_rollup
+from config import DASHBOARD_CLIENTSIDE_FILTERING, DASHBOARD_TIMELINE_MAX_POINTS
 
 '''
 vendor_df = pd.read_csv("data/CAD_Parts_Vendor_Database.csv")
 po_df = pd.read_csv("data/CAD_Parts_Purchase_Orders.csv")
 bom_df = pd.read_csv("data/CAD_Parts_BOM_Complete.csv")
 '''
-vendor_df = pd.read_csv("uploads/CAD_Parts_Vendor_Database.csv")
-po_df = pd.read_csv("uploads/CAD_Parts_Purchase_Orders.csv")
-bom_df = pd.read_csv("uploads/CAD_Parts_BOM_Complete.csv")
-
-po_df['State'] = po_df['Location'].str.split(',').str[1].str.strip()
-po_df['Date'] = pd.to_datetime(po_df['Date'])
+# Typed tables and PID join keys, parsed once per version of the catalog CSVs (see supply_chain.py).
+# Callbacks call get_supply_chain_model() again so they pick up a new version of the files.
+model = get_supply_chain_model()
 
 app_d = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP],
                 requests_pathname_prefix="/xforia-coast/dashboard/"
@@ -158,7 +160,7 @@ app_d.layout = dbc.Container([
         dbc.Col(
             dcc.Dropdown(
                 id="month-dropdown",
-                options=[{"label": m, "value": m} for m in po_df['Date'].astype(str).str[:7].unique()],
+                options=[{"label": m, "value": m} for m in model.months],
                 placeholder="Select Month",
                 multi=True
             ), width=3
@@ -166,7 +168,7 @@ app_d.layout = dbc.Container([
         dbc.Col(
             dcc.Dropdown(
                 id="part-dropdown",
-                options=[{"label": p, "value": p} for p in vendor_df['Part Name'].unique()],
+                options=[{"label": p, "value": p} for p in model.part_names],
                 placeholder="Select Part",
                 multi=True
             ), width=3
@@ -174,7 +176,7 @@ app_d.layout = dbc.Container([
         dbc.Col(
             dcc.Dropdown(
                 id="bom-dropdown",
-                options=[{"label": b, "value": b} for b in bom_df['Part Name'].unique()],
+                options=[{"label": b, "value": b} for b in model.bom_part_names],
                 placeholder="Select BOM",
                 multi=True
             ), width=3
@@ -182,7 +184,7 @@ app_d.layout = dbc.Container([
         dbc.Col(
             dcc.Dropdown(
                 id="vendor-dropdown",
-                options=[{"label": v, "value": v} for v in vendor_df['Vendor Name'].unique()],
+                options=[{"label": v, "value": v} for v in model.vendor_names],
                 placeholder="Select Vendor",
                 multi=True
             ), width=3
@@ -249,59 +251,58 @@ app_d.layout = dbc.Container([
 
 ],  fluid=True, style={"marginTop": "120px"}) 
 
+# Clientside filtering: every page load carries the catalog snapshot the browser filters
+if DASHBOARD_CLIENTSIDE_FILTERING:
+    dashboard_layout = app_d.layout
+
+    def serve_layout():
+        return html.Div([dcc.Store(id='catalog-snapshot', data=get_supply_chain_model().snapshot()), dashboard_layout])
+
+    app_d.layout = serve_layout
+
+
+def server_callback(*args, **kwargs):
+    """app_d.callback, unless the dashboard filters clientside (the callbacks at the bottom replace it)."""
+    if DASHBOARD_CLIENTSIDE_FILTERING:
+        return lambda callback: callback
+    return app_d.callback(*args, **kwargs)
+
 # n
-@app_d.callback(
+@server_callback(
         Output('bom-dropdown','options'),
         Input('part-dropdown','value')
 )
 
 def update_bom_options(selected_parts):
-    if not selected_parts:
-        return [{'label':b,'value':b} for b in bom_df['Part Name'].unique()]
-    selected_pids=vendor_df[vendor_df["Part Name"].isin(selected_parts)]['PID'].unique()
-    filtered_bom=bom_df[bom_df['Part ID (PID)'].isin(selected_pids)]
-    return [{'label':b,'value':b} for b in filtered_bom['Part Name'].unique()]
+    return [{'label':b,'value':b} for b in get_supply_chain_model().bom_names(selected_parts)]
 #n
 
 
-@app_d.callback(
-    Output('scatter-graph', 'figure'),
-    Output('heatmap-graph', 'figure'),
-    Output('pairplot-graph', 'figure'),
-    Output('map-graph', 'figure'),
-    Output('timeline-graph', 'figure'),
-    Output('treemap-graph', 'figure'),
-    Output('kpi-vendors', 'children'),
-    Output('kpi-parts', 'children'),
-    Output('kpi-bom', 'children'),
-    Output('kpi-orders', 'children'),
-    Output('vendor-details-table', 'data'),
-    Output('vendor-table-container', 'style'),
+# Every callback below selects from the same memoized selection (filter_engine.py),
+# so the rows and KPIs of a selection are resolved once however many outputs use them.
+SELECTION_INPUTS = [
     Input('month-dropdown', 'value'),
     Input('part-dropdown', 'value'),
     Input('bom-dropdown', 'value'),
     Input('vendor-dropdown', 'value'),
-    Input('toggle-table-btn', 'n_clicks')
-)
-def update_dashboard(selected_months, selected_parts, selected_boms, selected_vendors, n_clicks):
-    #n
-    if selected_boms:
-        related_pids = bom_df[bom_df['Part Name'].isin(selected_boms)]['Part ID (PID)'].unique()
-        related_parts = vendor_df[vendor_df['PID'].isin(related_pids)]['Part Name'].unique()
-        selected_parts = related_parts
-    #n
-    filtered_po = po_df.copy()
-    if selected_months:
-        filtered_po = filtered_po[filtered_po['Date'].astype(str).str[:7].isin(selected_months)]
-
-    filtered_vendor = vendor_df.copy()
-    if selected_parts:
-        filtered_vendor = filtered_vendor[filtered_vendor['Part Name'].isin(selected_parts)]
-    if selected_vendors:
-        filtered_vendor = filtered_vendor[filtered_vendor['Vendor Name'].isin(selected_vendors)]
-
-    vendors_in_month = filtered_po['Vendor'].unique()
-    filtered_vendor = filtered_vendor[filtered_vendor['Vendor Name'].isin(vendors_in_month)]
+]
+
+
+def get_selection(selected_months=None, selected_parts=None, selected_boms=None, selected_vendors=None):
+    return get_supply_chain_model().filters.select(selected_months, selected_parts, selected_boms, selected_vendors)
+
+
+def dataset_version() -> str:
+    return get_supply_chain_model().version
+
+
+# Figures are cached per dataset version and selection (see figure_cache.py)
+
+
+@server_callback(Output('scatter-graph', 'figure'), *SELECTION_INPUTS)
+@cached_figure("scatter", dataset_version)
+def update_scatter(selected_months, selected_parts, selected_boms, selected_vendors):
+    filtered_vendor = get_selection(selected_months, selected_parts, selected_boms, selected_vendors).vendors
 
     scatter_fig = px.scatter(
         filtered_vendor,
@@ -312,8 +313,15 @@ def update_dashboard(selected_months, selected_parts, selected_boms, selected_ve
         hover_name="Part Name",
         title="<b>On-Time Delivery vs Defective Parts</b>"
     )
+    return scatter_fig
+
+
+@server_callback(Output('heatmap-graph', 'figure'), *SELECTION_INPUTS)
+@cached_figure("heatmap", dataset_version)
+def update_heatmap(selected_months, selected_parts, selected_boms, selected_vendors):
+    filtered_vendor = get_selection(selected_months, selected_parts, selected_boms, selected_vendors).vendors
 
-    heatmap_df = filtered_vendor.groupby('Part Name')[['Orders','Avg Days','DPPM']].mean()
+    heatmap_df = filtered_vendor.groupby('Part Name', observed=True)[['Orders','Avg Days','DPPM']].mean()
     heatmap_fig = px.imshow(
         heatmap_df.T,
         text_auto=True,
@@ -323,6 +331,13 @@ def update_dashboard(selected_months, selected_parts, selected_boms, selected_ve
     )
     # heatmap_fig.update_xaxes(tickangle=-45, showticklabels=False)
     heatmap_fig.update_xaxes(title_text="Parts", tickangle=-45, showticklabels=False)
+    return heatmap_fig
+
+
+@server_callback(Output('pairplot-graph', 'figure'), *SELECTION_INPUTS)
+@cached_figure("vendor_bar", dataset_version)
+def update_vendor_bar(selected_months, selected_parts, selected_boms, selected_vendors):
+    selection = get_selection(selected_months, selected_parts, selected_boms, selected_vendors)
 
     # Pair Plot
     # pairplot_fig = px.scatter_matrix(
@@ -334,13 +349,8 @@ def update_dashboard(selected_months, selected_parts, selected_boms, selected_ve
     # )
 
     
-    vendor_grouped = filtered_vendor.groupby("Vendor Name").agg({
-        "Orders": "sum",
-        "DPPM": "mean",
-        "Quality %": "mean",
-        "Avg Days": "mean",
-        "On-Time %": "mean"
-    }).reset_index()
+    # Orders total and metric means per vendor, from the rollup cube cells of the selection (see rollup_cube.py)
+    vendor_grouped = selection.model.cube.vendor_summary(selection.vendor_cells)
 
     if len(vendor_grouped) > 1:
         vendor_grouped = vendor_grouped.sort_values("Orders", ascending=False).head(10)
@@ -410,24 +420,37 @@ def update_dashboard(selected_months, selected_parts, selected_boms, selected_ve
         yaxis_title="Metrics",
         legend_title="Metrics"
     )
+    return vendor_bar_fig
+
+
+@server_callback(Output('map-graph', 'figure'), *SELECTION_INPUTS)
+@cached_figure("map", dataset_version)
+def update_map(selected_months, selected_parts, selected_boms, selected_vendors):
+    selection = get_selection(selected_months, selected_parts, selected_boms, selected_vendors)
+
+    # Large selections: one marker per state and PO status (see po_rollups.py)
+    states = state_rollup(selection)
+    if states is not None:
+        return px.scatter_geo(
+            states,
+            locations="State",
+            locationmode="USA-states",
+            scope="usa",
+            color="PO Status",
+            size="Amount ($)",
+            hover_name="State",
+            hover_data={
+                "POs": True,
+                "Amount ($)": ":,.2f",
+                "Avg Amount ($)": ":,.2f",
+                "Qty Ordered": True,
+                "Vendors": True,
+                "PO Status": True
+            },
+            title="<b>Geographic Distribution of Purchase Orders</b>"
+        )
 
-    po_df["Amount ($)"] = po_df["Amount ($)"].replace(r'[\$,]', '', regex=True).astype(float)
-
-    po_df.columns = po_df.columns.str.strip()
-    filtered_po = po_df.copy()
-    if selected_months:
-        filtered_po = filtered_po[filtered_po['Date'].astype(str).str[:7].isin(selected_months)]
-    if selected_vendors:
-        filtered_po = filtered_po[filtered_po['Vendor'].isin(selected_vendors)]
-    if selected_parts:
-        selected_pids = vendor_df[vendor_df['Part Name'].isin(selected_parts)]['PID'].unique()
-        filtered_po = filtered_po[filtered_po['Part ID'].isin(selected_pids)]
-    if selected_boms:
-        selected_pids = bom_df[bom_df['Part Name'].isin(selected_boms)]['Part ID (PID)'].unique()
-        filtered_po = filtered_po[filtered_po['Part ID'].isin(selected_pids)]
-
-
-
+    filtered_po = selection.po
     map_fig = px.scatter_geo(
     filtered_po,
     locations="State",
@@ -445,9 +468,50 @@ def update_dashboard(selected_months, selected_parts, selected_boms, selected_ve
     },
     title="<b>Geographic Distribution of Purchase Orders</b>"
 )
+    return map_fig
+
+
+# Zooming the timeline refines its time buckets (see po_rollups.py)
+@server_callback(
+    Output('timeline-graph', 'figure'),
+    *SELECTION_INPUTS,
+    Input('timeline-graph', 'relayoutData'),
+)
+def update_timeline(selected_months, selected_parts, selected_boms, selected_vendors, relayout=None):
+    selection = get_selection(selected_months, selected_parts, selected_boms, selected_vendors)
+    date_range = timeline_range(selection, relayout)
+    if relayout and len(selection.po_rows) <= DASHBOARD_TIMELINE_MAX_POINTS and dash.ctx.triggered_id == 'timeline-graph':
+        raise PreventUpdate  # every PO is plotted already, zooming needs no new data
+    start, end = date_range or (None, None)
+    return timeline_figure(selected_months, selected_parts, selected_boms, selected_vendors, start, end)
+
+
+@cached_figure("timeline", dataset_version)
+def timeline_figure(selected_months, selected_parts, selected_boms, selected_vendors, start=None, end=None):
+    selection = get_selection(selected_months, selected_parts, selected_boms, selected_vendors)
+    timeline_po, period = timeline_rollup(selection, (start, end) if start and end else None)
+
+    if period is not None:
+        timeline_fig = px.line(
+            timeline_po,
+            x='Date',
+            y='Amount ($)',
+            color='PO Status',
+            markers=True,
+            title=f"<b>Purchase Order over Time by Status</b> ({BUCKET_NAMES[period]} totals)",
+            hover_data={
+            "POs": True,
+            "Avg Amount ($)": ":,.2f",
+            "Qty Ordered": True,
+            "Vendors": True,
+            "PO Status": True
+        }
+        )
+        timeline_fig.update_layout(uirevision="timeline")  # keep the user's zoom when the buckets change
+        return timeline_fig
 
     timeline_fig = px.line(
-        filtered_po.sort_values('Date'),
+        timeline_po,
         x='Date',
         y='Amount ($)',
         color='PO Status',
@@ -461,24 +525,24 @@ def update_dashboard(selected_months, selected_parts, selected_boms, selected_ve
         "PO Status": True
     }
     )
-     
+    timeline_fig.update_layout(uirevision="timeline")
+    return timeline_fig
+
+
+# The BOM rows only depend on the part and BOM selections
+@server_callback(
+    Output('treemap-graph', 'figure'),
+    Input('part-dropdown', 'value'),
+    Input('bom-dropdown', 'value'),
+)
+@cached_figure("treemap", dataset_version)
+def update_treemap(selected_parts, selected_boms):
     # filtered_bom = bom_df.copy()
     # if selected_boms:
     #     filtered_bom = filtered_bom[filtered_bom['Part Name'].isin(selected_boms)]
     # if selected_parts:
     #     filtered_bom = filtered_bom[filtered_bom['Part Name'].isin(selected_parts)]
-    filtered_bom = bom_df.copy()
-    if selected_parts:
-        selected_pids=vendor_df[vendor_df['Part Name'].isin(selected_parts)]['PID'].unique()
-        filtered_bom=filtered_bom[filtered_bom['Part ID (PID)'].isin(selected_pids)]
-
-    if selected_boms:
-        filtered_bom=filtered_bom[filtered_bom['Part Name'].isin(selected_boms)]
-
-        related_pids=filtered_bom['Part ID (PID)'].unique()
-        related_parts=vendor_df[vendor_df['PID'].isin(related_pids)]['Part Name'].unique()
-        selected_parts=related_parts
-
+    filtered_bom = get_selection(None, selected_parts, selected_boms, None).bom
 
     treemap_fig = px.treemap(
         filtered_bom,
@@ -504,7 +568,17 @@ def update_dashboard(selected_months, selected_parts, selected_boms, selected_ve
         font_color="white"    
     )
     )
+    return treemap_fig
+
 
+@server_callback(
+    Output('kpi-vendors', 'children'),
+    Output('kpi-parts', 'children'),
+    Output('kpi-bom', 'children'),
+    Output('kpi-orders', 'children'),
+    *SELECTION_INPUTS
+)
+def update_kpis(selected_months, selected_parts, selected_boms, selected_vendors):
     # kpi_vendors = filtered_vendor['Vendor Name'].nunique()
     # kpi_parts = filtered_vendor['Part Name'].nunique()
     # kpi_bom = filtered_bom['Part Name'].nunique()
@@ -519,38 +593,61 @@ def update_dashboard(selected_months, selected_parts, selected_boms, selected_ve
     # kpi_parts = len(selected_parts) if selected_parts else filtered_vendor['Part Name'].nunique()
     # kpi_bom = len(selected_boms) if selected_boms else filtered_bom['Part Name'].nunique()
 
-    # Number of vendors after filtering
-    kpi_vendors = filtered_vendor['Vendor Name'].nunique()
-
-    # Number of parts corresponding to selected BOMs or selected parts
-    if selected_boms:
-        # Parts that are in the selected BOMs
-        bom_pids = bom_df[bom_df['Part Name'].isin(selected_boms)]['Part ID (PID)'].unique()
-        parts_in_boms = vendor_df[vendor_df['PID'].isin(bom_pids)]['Part Name'].unique()
-        kpi_parts = len(parts_in_boms)
-        kpi_bom = len(selected_boms)
-    elif selected_parts:
-        kpi_parts = len(selected_parts)
-        kpi_bom = bom_df[bom_df['Part ID (PID)'].isin(vendor_df[vendor_df['Part Name'].isin(selected_parts)]['PID'].unique())]['Part Name'].nunique()
-    else:
-        kpi_parts = filtered_vendor['Part Name'].nunique()
-        kpi_bom = filtered_bom['Part Name'].nunique()
+    # Vendors, parts (of the selected BOMs or parts), BOMs and total orders of the selection
+    kpis = get_selection(selected_months, selected_parts, selected_boms, selected_vendors).kpis
+    return kpis["vendors"], kpis["parts"], kpis["bom"], kpis["orders"]
 
-    # Total orders for filtered vendors
-    kpi_orders = filtered_vendor['Orders'].sum()
 
+@server_callback(Output('vendor-details-table', 'data'), *SELECTION_INPUTS)
+def update_vendor_table(selected_months, selected_parts, selected_boms, selected_vendors):
+    if not selected_vendors:
+        return []
+    return get_selection(selected_months, selected_parts, selected_boms, selected_vendors).vendors.to_dict('records')
 
 
+# Showing / hiding the vendor table runs in the browser
+app_d.clientside_callback(
+    """
+    function(n_clicks) {
+        return {"display": (n_clicks || 0) % 2 === 1 ? "block" : "none"};
+    }
+    """,
+    Output('vendor-table-container', 'style'),
+    Input('toggle-table-btn', 'n_clicks'),
+)
 
+# Clientside filtering: the same outputs, computed in the browser from the catalog snapshot
+if DASHBOARD_CLIENTSIDE_FILTERING:
+    CATALOG_SNAPSHOT = Input('catalog-snapshot', 'data')
+    app_d.clientside_callback(
+        ClientsideFunction('coast', 'bomOptions'),
+        Output('bom-dropdown', 'options'), Input('part-dropdown', 'value'), CATALOG_SNAPSHOT,
+    )
+    for function, graph in (('scatter', 'scatter-graph'), ('heatmap', 'heatmap-graph'), ('vendorBar', 'pairplot-graph'),
+                            ('map', 'map-graph')):
+        app_d.clientside_callback(
+            ClientsideFunction('coast', function), Output(graph, 'figure'), *SELECTION_INPUTS, CATALOG_SNAPSHOT,
+        )
+    # Large selections are rolled up in the browser too; zooming refines the timeline's buckets
+    app_d.clientside_callback(
+        ClientsideFunction('coast', 'timeline'),
+        Output('timeline-graph', 'figure'), *SELECTION_INPUTS, Input('timeline-graph', 'relayoutData'), CATALOG_SNAPSHOT,
+    )
+    app_d.clientside_callback(
+        ClientsideFunction('coast', 'treemap'),
+        Output('treemap-graph', 'figure'), Input('part-dropdown', 'value'), Input('bom-dropdown', 'value'), CATALOG_SNAPSHOT,
+    )
+    app_d.clientside_callback(
+        ClientsideFunction('coast', 'kpis'),
+        Output('kpi-vendors', 'children'), Output('kpi-parts', 'children'),
+        Output('kpi-bom', 'children'), Output('kpi-orders', 'children'),
+        *SELECTION_INPUTS, CATALOG_SNAPSHOT,
+    )
+    app_d.clientside_callback(
+        ClientsideFunction('coast', 'vendorTable'),
+        Output('vendor-details-table', 'data'), *SELECTION_INPUTS, CATALOG_SNAPSHOT,
+    )
 
-    if selected_vendors:
-        table_data = filtered_vendor.to_dict('records')
-    else:
-        table_data = []
-
-    table_style = {"display": "block"} if n_clicks % 2 == 1 else {"display": "none"}
-
-    return scatter_fig, heatmap_fig, vendor_bar_fig, map_fig, timeline_fig, treemap_fig, kpi_vendors, kpi_parts, kpi_bom, kpi_orders, table_data, table_style
 
 def run_dash(debug=True, port=8000):
     app_d.run(debug=debug, port=port)
\ No newline at end of file
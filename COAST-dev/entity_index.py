@@ -0,0 +1,124 @@
+"""
+Entity index over the name column of a dataset (e.g. `Patient Name`).
+
+Built once per dataset version, it holds
+
+    exact map       lower-cased full name -> row positions
+    first-name map  lower-cased first name -> full names
+
+and an Aho-Corasick automaton over all full and first names, so every
+name mentioned in a query is found in a single pass over the query
+(whole words only) instead of one substring test per name.
+
+The demo chatbot turns every query about one patient into a whole-row
+request ("retrieve entire row for patient X"); those are answered straight
+from the index with `row_text`, without query contextualization or TAPAS.
+"""
+
+from collections import deque
+
+import pandas as pd
+
+class AhoCorasick:
+    """Multi-pattern matcher: finds all occurrences of a set of strings in one pass over the text."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for pattern in patterns:
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].append(pattern)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def find(self, text: str):
+        """Yields (start, end, pattern) for every occurrence in `text`."""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            for pattern in self.out[node]:
+                yield i + 1 - len(pattern), i + 1, pattern
+
+
+def _is_word(text: str, start: int, end: int) -> bool:
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
+class EntityIndex:
+    """Exact and first-name maps of one name column, with one-pass mention lookup."""
+
+    def __init__(self, df: pd.DataFrame, column: str):
+        self.df = df
+        self.column = column
+        self.rows: dict[str, list[int]] = {}
+        self.names: dict[str, str] = {}
+        self.first_names: dict[str, list[str]] = {}
+        for pos, name in enumerate(df[column].astype(str)):
+            name = name.strip()
+            key = name.lower()
+            if not key or key == "nan":
+                continue
+            if key not in self.rows:
+                self.rows[key] = []
+                self.names[key] = name
+                self.first_names.setdefault(key.split()[0], []).append(name)
+            self.rows[key].append(pos)
+        self.matcher = AhoCorasick(set(self.rows) | set(self.first_names))
+
+    def find(self, query: str) -> tuple[list[str], list[str]]:
+        """
+        Names mentioned in `query` (whole words, case-insensitive).
+
+        Returns:
+            tuple[list[str], list[str]]: Full names found, and the first names
+            found outside of those full names, each in order of appearance.
+        """
+        text = query.lower()
+        full, first, covered = [], [], []
+        matches = [m for m in self.matcher.find(text) if _is_word(text, m[0], m[1])]
+        for start, end, pattern in matches:
+            if pattern in self.rows and self.names[pattern] not in full:
+                full.append(self.names[pattern])
+                covered.append((start, end))
+        for start, end, pattern in matches:
+            if pattern in self.first_names and pattern not in first and pattern not in self.rows:
+                if not any(s <= start and end <= e for s, e in covered):
+                    first.append(pattern)
+        return full, first
+
+    def names_with_first_name(self, first_name: str) -> list[str]:
+        return self.first_names.get(first_name.lower(), [])
+
+    def row_text(self, name: str) -> str:
+        """The record(s) of `name` as `Column: value` lines."""
+        records = self.df.iloc[self.rows[name.lower()]]
+        return "\n\n".join(
+            "\n".join(f"{col}: {value}" for col, value in row.items())
+            for _, row in records.iterrows()
+        )
+
+
+def get_entity_index(dataset, column: str) -> EntityIndex:
+    """Entity index of `column` in a dataset_cache.Dataset, built once per dataset version."""
+    return dataset.derived(f"entity_index:{column}", lambda: EntityIndex(dataset.df, column))
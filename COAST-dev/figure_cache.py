@@ -0,0 +1,83 @@
+"""
+Figure cache for the Supply Chain Hub (db.py).
+
+Identical filter selections are common across users ("all months, nothing
+selected" on every first load), so each figure callback is wrapped with
+`cached_figure`:
+
+    @app_d.callback(Output('scatter-graph', 'figure'), *SELECTION_INPUTS)
+    @cached_figure("scatter", dataset_version)
+    def update_scatter(selected_months, selected_parts, ...):
+        ...
+
+The key is the figure name, the dataset version and the normalized
+selection (each dropdown value as a sorted tuple), so a change to the
+catalog files is never served a stale figure. The figure is serialized to
+JSON once, when it is built, and cached as text in a response_cache
+`ResponseCache` ("figures" table of FIGURE_CACHE_DB_FILE): an in-memory
+LRU bounded by entries and size in front of a SQLite table shared by all
+workers. Disabled by config.FIGURE_CACHE_ENABLED = False.
+"""
+
+import functools
+import json
+import threading
+
+from coalesce import content_key
+from config import (
+    FIGURE_CACHE_ENABLED, FIGURE_CACHE_DB_FILE, FIGURE_CACHE_MAX_ENTRIES, FIGURE_CACHE_MEMORY_ENTRIES,
+    FIGURE_CACHE_MEMORY_BYTES, FIGURE_CACHE_TTL_SECONDS,
+)
+from filter_engine import freeze
+from response_cache import ResponseCache
+
+_cache: ResponseCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_figure_cache() -> ResponseCache | None:
+    """The process-wide figure cache, or None when figure caching is disabled."""
+    global _cache
+    if not FIGURE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                "figures", db_path=FIGURE_CACHE_DB_FILE, max_entries=FIGURE_CACHE_MAX_ENTRIES,
+                ttl_seconds=FIGURE_CACHE_TTL_SECONDS, memory_entries=FIGURE_CACHE_MEMORY_ENTRIES,
+                memory_bytes=FIGURE_CACHE_MEMORY_BYTES,
+            )
+        return _cache
+
+
+def cached_figure(name: str, version):
+    """
+    Caches the figure returned by a Dash callback per dataset version and selection.
+
+    Args:
+        name (str): Figure name (part of the key).
+        version: Zero-argument callable returning the current dataset version.
+
+    The callback's arguments are the dropdown values; a cached figure is
+    returned as its parsed JSON dict, which Dash accepts like a Figure.
+    """
+    def decorate(build):
+        @functools.wraps(build)
+        def wrapper(*selection):
+            cache = get_figure_cache()
+            if cache is None:
+                return build(*selection)
+            key = content_key(name, version(), [freeze(v) for v in selection])
+            text = cache.get(key)
+            if text is not None:
+                return json.loads(text)
+            fig = build(*selection)
+            cache.set(key, fig.to_json())
+            return fig
+        return wrapper
+    return decorate
+
+
+def figure_cache_stats() -> dict:
+    cache = get_figure_cache()
+    return {"enabled": FIGURE_CACHE_ENABLED, **(cache.stats() if cache is not None else {})}
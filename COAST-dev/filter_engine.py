@@ -0,0 +1,191 @@
+"""
+Memoized filter engine for the Supply Chain Hub selections (db.py).
+
+For every filter dimension of the supply chain model it precomputes one
+packed row bitmap per value:
+
+    vendors  Vendor Name, Part Name, PID
+    po       Month, Vendor, Part ID
+    bom      Part ID (PID), Part Name
+
+A selection (months, parts, BOMs, vendors) is resolved by OR-ing the
+bitmaps of the selected values within a dimension and AND-ing across
+dimensions; the BOM -> PID -> part name resolution is done once per
+selection. The resolved row sets and KPI values are memoized per frozen
+selection tuple in an LRU of DASHBOARD_FILTER_CACHE_SIZE entries, so
+going back and forth between selections costs a dictionary lookup.
+Resolution is single-flight: the dashboard callbacks of one selection run
+in parallel and share one resolution. The vendors with POs in the selected
+months and the KPIs are read from the model's rollup cube (rollup_cube.py)
+instead of the rows.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from config import DASHBOARD_FILTER_CACHE_SIZE
+
+log = logging.getLogger("filter_engine")
+
+
+def freeze(values) -> tuple:
+    """Dropdown value (None, a value or a list) as a hashable, order-independent tuple."""
+    if not values:
+        return ()
+    if isinstance(values, str):
+        values = [values]
+    return tuple(sorted(set(values)))
+
+
+class Bitmaps:
+    """Packed row bitmaps of every value of one categorical column."""
+
+    def __init__(self, column: pd.Series):
+        self.n = len(column)
+        codes = column.cat.codes.to_numpy()
+        self.index = {v: i for i, v in enumerate(column.cat.categories)}
+        self.bits = np.empty((len(self.index), (self.n + 7) // 8), dtype=np.uint8)
+        for i in range(len(self.index)):
+            self.bits[i] = np.packbits(codes == i)
+        self.none = np.zeros((self.n + 7) // 8, dtype=np.uint8)
+        self.all = np.packbits(np.ones(self.n, dtype=bool))
+
+    def any_of(self, values) -> np.ndarray:
+        """Bitmap of the rows holding any of `values`."""
+        idx = [self.index[v] for v in values if v in self.index]
+        if not idx:
+            return self.none
+        return np.bitwise_or.reduce(self.bits[idx], axis=0)
+
+
+def rows(bitmap: np.ndarray, n: int) -> np.ndarray:
+    """Row positions set in `bitmap`."""
+    return np.flatnonzero(np.unpackbits(bitmap, count=n))
+
+
+class Selection:
+    """Resolved rows and KPIs of one dashboard selection."""
+
+    def __init__(self, model, parts: list, vendor_rows, po_rows, bom_rows, kpis: dict, vendor_cells=None):
+        self.model = model
+        self.parts = parts  # selected parts, or the parts of the selected BOMs
+        self.vendor_rows, self.po_rows, self.bom_rows = vendor_rows, po_rows, bom_rows
+        self.vendor_cells = vendor_cells  # rollup cube cells of the vendor rows
+        self.kpis = kpis
+        self.rollups: dict = {}  # aggregates of these rows, memoized by po_rollups.py
+
+    @property
+    def vendors(self) -> pd.DataFrame:
+        return self.model.vendors.iloc[self.vendor_rows]
+
+    @property
+    def po(self) -> pd.DataFrame:
+        return self.model.po.iloc[self.po_rows]
+
+    @property
+    def bom(self) -> pd.DataFrame:
+        return self.model.bom.iloc[self.bom_rows]
+
+
+class FilterEngine:
+    """Per-value bitmaps of a supply_chain.SupplyChainModel and an LRU of resolved selections."""
+
+    def __init__(self, model, cache_size: int = DASHBOARD_FILTER_CACHE_SIZE):
+        self.model = model
+        self.vendor_bits = {c: Bitmaps(model.vendors[c]) for c in ("Vendor Name", "Part Name", "PID")}
+        self.po_bits = {c: Bitmaps(model.po[c]) for c in ("Month", "Vendor", "Part ID")}
+        self.bom_bits = {c: Bitmaps(model.bom[c]) for c in ("Part ID (PID)", "Part Name")}
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._resolving: dict = {}  # key -> lock held while that selection is resolved
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def select(self, months=None, parts=None, boms=None, vendors=None) -> Selection:
+        """Rows and KPIs of a selection of the month, part, BOM and vendor dropdowns (memoized)."""
+        key = (freeze(months), freeze(parts), freeze(boms), freeze(vendors))
+        with self._lock:
+            selection = self._cached(key)
+            if selection is not None:
+                return selection
+            resolve_lock = self._resolving.setdefault(key, threading.Lock())
+
+        with resolve_lock:
+            with self._lock:
+                selection = self._cached(key)  # resolved by a concurrent callback while we waited
+                if selection is not None:
+                    return selection
+            try:
+                selection = self._resolve(*key)
+            except Exception:
+                with self._lock:
+                    self._resolving.pop(key, None)
+                raise
+            with self._lock:
+                self._resolving.pop(key, None)
+                self.misses += 1
+                self._cache[key] = selection
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return selection
+
+    def _cached(self, key: tuple) -> Selection | None:
+        selection = self._cache.get(key)
+        if selection is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+        return selection
+
+    def _resolve(self, months: tuple, parts: tuple, boms: tuple, vendors: tuple) -> Selection:
+        m = self.model
+        parts = m.parts_for_boms(boms) if boms else list(parts)
+
+        # Vendor rows: vendors with POs in the months, then the part and vendor filters
+        po_vendor_names = m.cube.po_vendors(months)
+        vendor_bits = self.vendor_bits["Vendor Name"].any_of(po_vendor_names)
+        if parts:
+            vendor_bits = vendor_bits & self.vendor_bits["Part Name"].any_of(parts)
+        if vendors:
+            vendor_bits = vendor_bits & self.vendor_bits["Vendor Name"].any_of(vendors)
+        vendor_names = [v for v in po_vendor_names if v in vendors] if vendors else po_vendor_names
+        vendor_cells = m.cube.vendor_cells(vendor_names, parts or None)
+
+        # PO rows: months, vendors and the PIDs of the selected parts / BOMs
+        po_month = self.po_bits["Month"].any_of(months) if months else self.po_bits["Month"].all
+        pids = m.pids_for_parts(parts) if parts else None
+        if boms:
+            bom_pids = m.pids_for_boms(boms)
+            pids = bom_pids if pids is None else [p for p in pids if p in bom_pids]
+        po_bits = po_month
+        if vendors:
+            po_bits = po_bits & self.po_bits["Vendor"].any_of(vendors)
+        if pids is not None:
+            po_bits = po_bits & self.po_bits["Part ID"].any_of(pids)
+
+        # BOM rows: PIDs of the selected parts, then the selected BOM names
+        bom_bits = self.bom_bits["Part ID (PID)"].all
+        if parts:
+            bom_bits = bom_bits & self.bom_bits["Part ID (PID)"].any_of(m.pids_for_parts(parts))
+        if boms:
+            bom_bits = bom_bits & self.bom_bits["Part Name"].any_of(boms)
+
+        # KPIs from the rollup cube cells of the vendor rows
+        kpis = m.cube.vendor_kpis(vendor_cells)
+        if boms:
+            kpis["parts"], kpis["bom"] = len(parts), len(boms)
+        elif parts:
+            kpis["parts"], kpis["bom"] = len(parts), len(m.bom_names(parts))
+        else:
+            kpis["bom"] = len(m.bom_part_names)  # every BOM row is selected
+        return Selection(
+            m, parts, rows(vendor_bits, len(m.vendors)), rows(po_bits, len(m.po)), rows(bom_bits, len(m.bom)), kpis,
+            vendor_cells=vendor_cells,
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "selections": len(self._cache)}
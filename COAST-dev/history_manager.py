@@ -0,0 +1,115 @@
+"""
+Token-budgeted conversation history for the chat pipelines.
+
+`fit_history` keeps the most recent turns verbatim and folds older turns
+into a compact running summary once the history exceeds its token budget:
+
+    [system: summary of earlier turns] + [recent turns ...]
+
+The summary is cached per session together with the number of turns it
+covers. It is reused as long as the verbatim tail still fits the budget, and
+when it must grow, only the newly folded turns are summarized on top of the
+previous summary. Folding always shrinks the tail to half the budget, so
+the summary is regenerated every few turns rather than on every request.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from config import HISTORY_TOKEN_BUDGET, HISTORY_SUMMARY_MAX_TOKENS, HISTORY_MAX_SESSIONS
+from llm_client import chat_completion
+from tokens import count_message_tokens, count_tokens
+
+log = logging.getLogger("history_manager")
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+SUMMARIZER_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Merge the previous summary (if any) with the new turns into one compact summary. "
+    "Keep every concrete fact the user may refer back to: names, part numbers, vendors, "
+    "numbers, dates, and what was asked and answered. No preamble; output only the summary."
+)
+
+_summaries: OrderedDict = OrderedDict()  # session key -> (folded turn count, folded fingerprint, summary)
+_summaries_lock = threading.Lock()
+
+
+def _fingerprint(turns: list[dict]) -> str:
+    return hashlib.sha1(json.dumps(turns, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def session_key(conversation_history: list[dict], session_id: str = None) -> str:
+    """Explicit session id, or the fingerprint of the conversation's opening turn."""
+    return session_id or _fingerprint(conversation_history[:1])
+
+
+def _split_point(history: list[dict], start: int, budget: int) -> int:
+    """Smallest index >= start such that history[index:] fits `budget` tokens (keeps at least the last turn)."""
+    i, used = len(history), 0
+    while i > start:
+        cost = count_message_tokens([history[i - 1]])
+        if used + cost > budget and i < len(history):
+            break
+        used += cost
+        i -= 1
+    return i
+
+
+async def _summarize(previous: str | None, turns: list[dict]) -> str:
+    transcript = "\n".join(f"{m.get('role', 'user')}: {m.get('content', '')}" for m in turns)
+    content = (f"Previous summary:\n{previous}\n\n" if previous else "") + f"New turns:\n{transcript}"
+    completion = await chat_completion(
+        [{"role": "system", "content": SUMMARIZER_PROMPT}, {"role": "user", "content": content}],
+        temperature=0.0,
+        max_tokens=HISTORY_SUMMARY_MAX_TOKENS,
+    )
+    return completion.choices[0].message.content.strip()
+
+
+async def fit_history(conversation_history: list[dict], budget: int = HISTORY_TOKEN_BUDGET, session_id: str = None) -> list[dict]:
+    """
+    Returns the history to send to the LLM, at most about `budget` tokens.
+
+    Args:
+        conversation_history (list[dict]): Full history from the request.
+        budget (int): Token budget for the returned history.
+        session_id (str, optional): Key of the summary cache; defaults to a
+            fingerprint of the conversation's first turn.
+
+    Returns:
+        list[dict]: The history unchanged when it fits, otherwise a summary
+        message followed by the most recent turns.
+    """
+    history = conversation_history or []
+    if count_message_tokens(history) <= budget:
+        return history
+
+    key = session_key(history, session_id)
+    with _summaries_lock:
+        cached = _summaries.get(key)
+    folded, summary = 0, None
+    if cached and cached[0] <= len(history) and cached[1] == _fingerprint(history[:cached[0]]):
+        folded, summary = cached[0], cached[2]
+
+    summary_tokens = count_tokens(summary) + 8 if summary else 0
+    if summary is None or count_message_tokens(history[folded:]) + summary_tokens > budget:
+        new_folded = min(max(_split_point(history, folded, budget // 2), folded + 1), len(history) - 1)
+        if new_folded <= folded:  # only the latest turn is left verbatim; nothing more to fold
+            return history if summary is None else [{"role": "system", "content": SUMMARY_PREFIX + summary}, *history[folded:]]
+        try:
+            summary = await _summarize(summary, history[folded:new_folded])
+        except Exception as e:
+            log.warning(f"History summarization failed, dropping older turns instead: {e}")
+            return history[_split_point(history, 0, budget):]
+        folded = new_folded
+        with _summaries_lock:
+            _summaries[key] = (folded, _fingerprint(history[:folded]), summary)
+            _summaries.move_to_end(key)
+            while len(_summaries) > HISTORY_MAX_SESSIONS:
+                _summaries.popitem(last=False)
+
+    return [{"role": "system", "content": SUMMARY_PREFIX + summary}, *history[folded:]]
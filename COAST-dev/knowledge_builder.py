@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Incremental builder for the CAD unified knowledge file (CAD_knowledge_all.txt).
+
+The file holds one `=== PART: <PID> ===` section per BOM part with its
+[BOM], [VENDORS] and [PURCHASE_ORDERS] blocks. A part section contains the
+rows of the part itself plus the rows of its parent assemblies (a PID with
+a trailing `-NN` belongs to the PID without it), so sub-components inherit
+their assembly's vendors and purchase orders.
+
+Next to the file a sidecar index (`CAD_knowledge_all.txt.idx.json`) maps
+every PID to the (offset, length) of its section and a digest of the rows it
+was rendered from. On a rebuild only sections whose rows changed are
+re-rendered; the others are copied byte-for-byte from the previous file.
+A single section is read with `read_part_section`, which memory-maps the
+file and slices it at the indexed offset. The parsed index is kept in
+memory per file version, so a lookup costs one stat, not a JSON parse.
+
+Run:
+  python knowledge_builder.py [--out CAD_knowledge_all.txt]
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pathlib
+import re
+import threading
+
+from catalog_store import BOM, PURCHASE_ORDERS, VENDORS, get_store
+from config import KNOWLEDGE_FILE, CATALOG_BOM_CSV, CATALOG_PO_CSV, CATALOG_VENDOR_CSV
+
+log = logging.getLogger("knowledge_builder")
+
+INDEX_VERSION = 1
+
+_indexes: dict = {}  # absolute path -> parsed index (its "file" stamp is the version it belongs to)
+_indexes_lock = threading.Lock()
+_SECTION_RE = re.compile(rb"^=== PART: (\S+) ===\r?$", re.M)
+
+# (block label, store table, PID column)
+BLOCKS = [
+    ("BOM", BOM, "Part ID (PID)"),
+    ("VENDORS", VENDORS, "PID"),
+    ("PURCHASE_ORDERS", PURCHASE_ORDERS, "Part ID"),
+]
+
+FORMAT_LINES = [
+    "# FORMAT",
+    "=== PART: <PID> ===",
+    "[BOM]",
+    "<all BOM rows and columns>",
+    "[VENDORS]",
+    "<matched vendor rows>",
+    "[PURCHASE_ORDERS]",
+    "<matched PO rows>",
+]
+
+
+def index_path(path) -> pathlib.Path:
+    p = pathlib.Path(path)
+    return p.with_name(p.name + ".idx.json")
+
+
+def _file_stamp(path) -> dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _lineage(pid: str, known: set) -> list[str]:
+    """`pid` followed by every ancestor PID that exists in the BOM (BH-2024-002-01 -> BH-2024-002)."""
+    chain, cur = [pid], pid
+    while "-" in cur:
+        cur = cur.rsplit("-", 1)[0]
+        if cur in known:
+            chain.append(cur)
+    return chain
+
+
+def _group_rows(store):
+    """{block label: (columns, {pid: [row tuple, ...]})} in file order."""
+    grouped = {}
+    for label, table, pid_col in BLOCKS:
+        df = store.table(table).fillna("")
+        cols = list(df.columns)
+        rows = {}
+        for rec in df.itertuples(index=False):
+            row = tuple(str(v).strip() for v in rec)
+            rows.setdefault(row[cols.index(pid_col)], []).append(row)
+        grouped[label] = (cols, rows)
+    return grouped
+
+
+def _section_rows(pid: str, grouped: dict, known: set) -> dict:
+    chain = _lineage(pid, known)[::-1]  # assembly rows first, then the part's own
+    return {label: (cols, [r for p in chain for r in rows.get(p, [])]) for label, (cols, rows) in grouped.items()}
+
+
+def _digest(section: dict) -> str:
+    h = hashlib.sha1()
+    for label, (cols, rows) in section.items():
+        h.update(label.encode())
+        h.update("\x1f".join(cols).encode())
+        for r in rows:
+            h.update(b"\x1e" + "\x1f".join(r).encode())
+    return h.hexdigest()
+
+
+def render_section(pid: str, section: dict) -> str:
+    out = [f"=== PART: {pid} ==="]
+    for label, (cols, rows) in section.items():
+        out.append(f"[{label}]")
+        if not rows:
+            out.append("(no rows)")
+        for i, r in enumerate(rows, start=1):
+            out.append(f"- ROW {i}")
+            out.extend(f"{c}: {v}" for c, v in zip(cols, r))
+    return "\n".join(out) + "\n\n"
+
+
+def _header(n_parts: int, sources) -> str:
+    lines = [
+        "# CAD Unified Knowledge File",
+        f"# Generated: {datetime.datetime.now().replace(microsecond=0).isoformat()}",
+        f"# Source files: {', '.join(os.path.basename(s) for s in sources)}",
+        f"# Parts detected: {n_parts}",
+        "",
+        *FORMAT_LINES,
+        "",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def scan_index(path) -> dict:
+    """Builds the section index of an existing knowledge file by scanning its part headers once."""
+    parts = {}
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        heads = [(m.group(1).decode("utf-8"), m.start()) for m in _SECTION_RE.finditer(mm)]
+        for i, (pid, start) in enumerate(heads):
+            if pid == "<PID>":  # the FORMAT example block
+                continue
+            end = heads[i + 1][1] if i + 1 < len(heads) else len(mm)
+            parts[pid] = {"offset": start, "length": end - start, "digest": None}
+    index = {"version": INDEX_VERSION, "file": _file_stamp(path), "parts": parts}
+    _save_index(path, index)
+    return index
+
+
+def _save_index(path, index: dict) -> None:
+    index_path(path).write_text(json.dumps(index), encoding="utf-8")
+    with _indexes_lock:
+        _indexes[os.path.abspath(path)] = index
+
+
+def load_index(path) -> dict:
+    """Sidecar index of `path` (cached in memory), rescanned if it is missing or was written for another version of the file."""
+    stamp = _file_stamp(path)
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+    if index is not None and index["file"] == stamp:
+        return index
+    try:
+        index = json.loads(index_path(path).read_text(encoding="utf-8"))
+        if index.get("version") == INDEX_VERSION and index.get("file") == stamp:
+            with _indexes_lock:
+                _indexes[key] = index
+            return index
+    except (FileNotFoundError, ValueError):
+        pass
+    return scan_index(path)
+
+
+def read_part_section(pid: str, path=KNOWLEDGE_FILE) -> str | None:
+    """Text of one part section, read through mmap at its indexed offset. None if the PID is unknown."""
+    entry = load_index(path)["parts"].get(pid)
+    if entry is None:
+        return None
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return mm[entry["offset"]:entry["offset"] + entry["length"]].decode("utf-8")
+
+
+def build_knowledge_file(
+    out_path=KNOWLEDGE_FILE,
+    bom_csv=CATALOG_BOM_CSV,
+    po_csv=CATALOG_PO_CSV,
+    vendor_csv=CATALOG_VENDOR_CSV,
+    store=None,
+) -> dict:
+    """
+    (Re)generates the knowledge file from the catalog store.
+
+    Sections whose BOM / vendor / PO rows have the same digest as in the
+    previous build are copied from the old file instead of being re-rendered.
+
+    Returns:
+        dict: {"parts": n, "rendered": n, "reused": n}
+    """
+    store = store or get_store(bom_csv, po_csv, vendor_csv)
+    out_path = pathlib.Path(out_path)
+
+    old_index = load_index(out_path)["parts"] if out_path.exists() else {}
+    grouped = _group_rows(store)
+    pids = sorted(grouped["BOM"][1])
+    known = set(pids)
+
+    header = _header(len(pids), (bom_csv, po_csv, vendor_csv)).encode("utf-8")
+    parts, rendered, reused = {}, 0, 0
+    tmp = out_path.with_name(f".{out_path.name}.{os.getpid()}.tmp")
+
+    old_file = open(out_path, "rb") if old_index else None
+    old_mm = mmap.mmap(old_file.fileno(), 0, access=mmap.ACCESS_READ) if old_file else None
+    try:
+        with open(tmp, "wb") as out:
+            out.write(header)
+            offset = len(header)
+            for pid in pids:
+                section = _section_rows(pid, grouped, known)
+                digest = _digest(section)
+                old = old_index.get(pid)
+                if old_mm is not None and old and old.get("digest") == digest:
+                    data = old_mm[old["offset"]:old["offset"] + old["length"]]
+                    reused += 1
+                else:
+                    data = render_section(pid, section).encode("utf-8")
+                    rendered += 1
+                out.write(data)
+                parts[pid] = {"offset": offset, "length": len(data), "digest": digest}
+                offset += len(data)
+    finally:
+        if old_mm is not None:
+            old_mm.close()
+            old_file.close()
+
+    os.replace(tmp, out_path)
+    index = {"version": INDEX_VERSION, "file": _file_stamp(out_path), "parts": parts}
+    _save_index(out_path, index)
+    log.info(f"Built {out_path}: {len(pids)} parts, {rendered} rendered, {reused} reused")
+    return {"parts": len(pids), "rendered": rendered, "reused": reused}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+    ap = argparse.ArgumentParser(description="Build CAD_knowledge_all.txt from the parts catalog")
+    ap.add_argument("--out", default=KNOWLEDGE_FILE)
+    ap.add_argument("--bom", default=CATALOG_BOM_CSV)
+    ap.add_argument("--po", default=CATALOG_PO_CSV)
+    ap.add_argument("--vendors", default=CATALOG_VENDOR_CSV)
+    args = ap.parse_args()
+    print(build_knowledge_file(args.out, args.bom, args.po, args.vendors))
@@ -0,0 +1,173 @@
+"""
+Shared non-blocking LLM client for the chat endpoints.
+
+One `AsyncOpenAI` client per process over a pooled `httpx.AsyncClient`
+(keep-alive connections, bounded pool, request timeout). Calls go through
+`chat_completion` / `stream_chat_completion`, which
+
+  * limits the number of in-flight completions (LLM_MAX_CONCURRENCY),
+  * retries rate limits, timeouts, connection errors and 5xx responses with
+    full-jitter exponential backoff, honouring `Retry-After` when present,
+  * records the token usage of every completion in the caller's trace
+    (tracing.record_tokens; a shared completion is recorded for each caller),
+  * shares one call between identical concurrent requests (coalesce.py).
+
+The base URL comes from config.LLM_BASE_URL or the OPENAI_BASE_URL env var,
+so the client can be pointed at a local mock server in tests.
+"""
+
+import asyncio
+import logging
+import os
+import random
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from config import (
+    LLM_BASE_URL, LLM_MAX_CONCURRENCY, LLM_MAX_CONNECTIONS, LLM_TIMEOUT_SECONDS,
+    LLM_MAX_RETRIES, LLM_BACKOFF_BASE_SECONDS, LLM_BACKOFF_MAX_SECONDS,
+)
+from coalesce import coalesce, coalesce_stream, content_key
+from tracing import record_tokens
+
+log = logging.getLogger("llm_client")
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+_client: AsyncOpenAI | None = None
+_semaphore: asyncio.Semaphore | None = None
+
+
+def get_client() -> AsyncOpenAI:
+    """The process-wide async client, created on first use."""
+    global _client
+    if _client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY not found in environment variables.")
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS),
+        )
+        _client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=LLM_BASE_URL or os.getenv("OPENAI_BASE_URL") or None,
+            http_client=http_client,
+            max_retries=0,  # retries are handled here, with jitter and the concurrency slot released
+        )
+    return _client
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _semaphore
+
+
+def _retry_delay(attempt: int, error: Exception) -> float:
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_BACKOFF_MAX_SECONDS)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+async def _with_retries(call, acquire_slot: bool = True):
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            if not acquire_slot:
+                return await call()
+            async with _get_semaphore():
+                return await call()
+        except RETRYABLE_ERRORS as e:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            delay = _retry_delay(attempt, e)
+            log.warning(f"LLM call failed ({type(e).__name__}), retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+async def chat_completion(messages: list[dict], model: str = DEFAULT_MODEL, **params):
+    """
+    Creates a chat completion without blocking the event loop.
+
+    Args:
+        messages (list[dict]): Chat messages.
+        model (str): Model name.
+        **params: Extra completion parameters (temperature, max_tokens, ...).
+
+    Returns:
+        The OpenAI `ChatCompletion` object.
+
+    Raises:
+        openai.OpenAIError: When the call fails for a non-retryable reason or
+            retries are exhausted.
+    """
+    client = get_client()
+
+    async def call():
+        return await _with_retries(lambda: client.chat.completions.create(model=model, messages=messages, **params))
+
+    completion = await coalesce("llm", content_key(model, messages, params), call)
+    # Recorded here, in the caller's trace: a shared completion runs in the first caller's context
+    usage = getattr(completion, "usage", None)
+    if usage is not None:
+        record_tokens(usage.prompt_tokens, usage.completion_tokens)
+    return completion
+
+
+async def stream_chat_completion(messages: list[dict], model: str = DEFAULT_MODEL, **params):
+    """
+    Streams a chat completion, yielding content deltas as they arrive.
+
+    The concurrency slot is held for the whole stream. Retries only cover
+    opening the stream; an error after the first token is raised to the caller.
+    Identical concurrent streams share one completion.
+    """
+    client = get_client()
+    key = content_key(model, messages, params)
+    async for chunk in coalesce_stream("llm_stream", key, lambda: _stream(client, messages, model, params)):
+        if isinstance(chunk, str):
+            yield chunk
+        else:  # the usage, recorded in each caller's trace (see chat_completion)
+            record_tokens(chunk.prompt_tokens, chunk.completion_tokens)
+
+
+async def _stream(client: AsyncOpenAI, messages: list[dict], model: str, params: dict):
+    """Content deltas of a streamed completion, then its usage object."""
+    async with _get_semaphore():
+        stream = await _with_retries(
+            lambda: client.chat.completions.create(
+                model=model, messages=messages, stream=True, stream_options={"include_usage": True}, **params
+            ),
+            acquire_slot=False,
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if getattr(chunk, "usage", None) is not None:  # the final chunk (no choices) carries the usage
+                    yield chunk.usage
+        finally:
+            await stream.close()
+
+
+async def aclose() -> None:
+    """Closes the pooled HTTP connections (called on application shutdown)."""
+    global _client, _semaphore
+    if _client is not None:
+        await _client.close()
+    _client, _semaphore = None, None
@@ -161,7 +161,8 @@ def generate_report(
     vendor_csv=None,
     out_path=None,
     log_file=None,
-    log_level="INFO"
+    log_level="INFO",
+    store=None
 ):
     """
     Generates a comprehensive report by matching a descriptor dictionary (from a PDF)
@@ -178,6 +179,9 @@ def generate_report(
         out_path (str, optional): Path to save the generated report.
         log_file (str, optional): Path for the log file.
         log_level (str, optional): Logging level.
+        store (catalog_store.CatalogStore, optional): Embedded catalog store built from
+            the same CSVs. When given, matching runs as indexed SQL lookups instead of
+            loading and scanning the CSVs with pandas.
     
     Returns:
         str: The generated report as a text string.
@@ -191,16 +195,23 @@ def generate_report(
     if not (bom_csv and po_csv and vendor_csv):
         raise ValueError("bom_csv, po_csv, vendor_csv are required")
 
-    bom_df = _load_csv(bom_csv, log)
-    po_df = _load_csv(po_csv, log)
-    vendor_df = _load_csv(vendor_csv, log)
-    sources = [("BOM", bom_df), ("PURCHASE_ORDERS", po_df), ("VENDOR_DATABASE", vendor_df)]
-
     dim_canon = _to_dim_canonical(dm) if dm else ""
 
-    pn_hits_total = sum(_any_exact_in_cols(df, pn, "num") for _, df in sources)
-    nm_hits_total = sum(_any_exact_in_cols(df, nm, "name") for _, df in sources)
-    dm_hits_total = sum(_any_exact_in_cols(df, dm, "dim") for _, df in sources)
+    if store is not None:
+        labels = ["BOM", "PURCHASE_ORDERS", "VENDOR_DATABASE"]
+        pn_hits_total = sum(store.count_exact(label, pn and _norm(pn), "num") for label in labels)
+        nm_hits_total = sum(store.count_exact(label, nm and _norm(nm), "name") for label in labels)
+        dm_hits_total = sum(store.count_exact(label, dim_canon, "dim") for label in labels)
+        sources = [(label, lambda label=label: store.match_rows(label, pn, nm, dim_canon)) for label in labels]
+    else:
+        bom_df = _load_csv(bom_csv, log)
+        po_df = _load_csv(po_csv, log)
+        vendor_df = _load_csv(vendor_csv, log)
+        frames = [("BOM", bom_df), ("PURCHASE_ORDERS", po_df), ("VENDOR_DATABASE", vendor_df)]
+        pn_hits_total = sum(_any_exact_in_cols(df, pn, "num") for _, df in frames)
+        nm_hits_total = sum(_any_exact_in_cols(df, nm, "name") for _, df in frames)
+        dm_hits_total = sum(_any_exact_in_cols(df, dm, "dim") for _, df in frames)
+        sources = [(label, lambda df=df: _match_df(df, pn, nm, dim_canon)) for label, df in frames]
 
     if not pn and not nm and not dim_canon:
         log.error("Error in input file: Missing Part Number, Part Name, and Dimensions.")
@@ -220,8 +231,8 @@ def generate_report(
     out.append(f"Resolved Part Name  : {nm if nm else '(not provided)'}")
     out.append(f"Resolved Dimensions : {dim_canon if dim_canon else '(not provided)'}")
     out.append("")
-    for label, df in sources:
-        matches = _match_df(df, pn, nm, dim_canon)
+    for label, find_matches in sources:
+        matches = find_matches()
         out.append(f"===== MATCHES IN {label} =====")
         if matches.empty:
             out.append("No matches.")
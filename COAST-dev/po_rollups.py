@@ -0,0 +1,133 @@
+"""
+Level-of-detail rollups of the purchase orders for the Supply Chain Hub map
+and timeline (db.py).
+
+Small selections are still plotted one point per PO. Larger ones are
+rolled up before they are plotted:
+
+    map       above DASHBOARD_MAP_DETAIL_ROWS POs, one marker per state and
+              PO status (POs, total amount and quantity, vendors)
+    timeline  above DASHBOARD_TIMELINE_MAX_POINTS POs in view, one point per
+              time bucket and PO status; the bucket (day, week, month,
+              quarter, year) is the finest that keeps the visible date range
+              within DASHBOARD_TIMELINE_MAX_POINTS buckets
+
+The visible date range comes from the timeline's relayoutData, so zooming
+in refines the buckets (down to single POs). POs one range-width either
+side of the view are included so a short pan does not show an empty chart.
+
+Rollups are grouped vectorized over the selection's PO rows and memoized on
+the selection (filter_engine.Selection), i.e. once per filter and level of
+detail.
+"""
+
+import logging
+import threading
+
+import pandas as pd
+
+from config import DASHBOARD_MAP_DETAIL_ROWS, DASHBOARD_TIMELINE_MAX_POINTS
+
+log = logging.getLogger("po_rollups")
+
+BUCKETS = [("D", 1.0), ("W", 7.0), ("M", 30.44), ("Q", 91.31), ("Y", 365.25)]  # period, approximate days
+BUCKET_NAMES = {"D": "daily", "W": "weekly", "M": "monthly", "Q": "quarterly", "Y": "yearly"}
+ROLLUPS_PER_SELECTION = 16
+
+_lock = threading.Lock()
+
+
+def _memo(selection, key, build):
+    """`build()` memoized on the selection (only the last ROLLUPS_PER_SELECTION rollups are kept)."""
+    with _lock:
+        if key in selection.rollups:
+            return selection.rollups[key]
+    value = build()
+    with _lock:
+        selection.rollups[key] = value
+        while len(selection.rollups) > ROLLUPS_PER_SELECTION:
+            del selection.rollups[next(iter(selection.rollups))]
+    return value
+
+
+def _rollup(po: pd.DataFrame, keys: list) -> pd.DataFrame:
+    po = po.assign(**{"Qty Ordered": pd.to_numeric(po["Qty Ordered"], errors="coerce")})
+    return po.groupby(keys, observed=True, sort=True).agg(**{
+        "POs": ("Amount ($)", "size"),
+        "Amount ($)": ("Amount ($)", "sum"),
+        "Avg Amount ($)": ("Amount ($)", "mean"),
+        "Qty Ordered": ("Qty Ordered", "sum"),
+        "Vendors": ("Vendor", "nunique"),
+    }).reset_index()
+
+
+def state_rollup(selection) -> pd.DataFrame | None:
+    """
+    POs of a selection per state and PO status.
+
+    Returns:
+        pd.DataFrame | None: State, PO Status, POs, Amount ($), Avg Amount ($),
+        Qty Ordered, Vendors; None when the selection is small enough to
+        plot one marker per PO.
+    """
+    if len(selection.po_rows) <= DASHBOARD_MAP_DETAIL_ROWS:
+        return None
+    return _memo(selection, ("states",), lambda: _rollup(selection.po, ["State", "PO Status"]))
+
+
+def timeline_range(selection, relayout) -> tuple | None:
+    """
+    Visible date range of the timeline from its relayoutData.
+
+    Args:
+        selection: The plotted filter_engine.Selection.
+        relayout (dict | None): relayoutData of the timeline graph.
+
+    Returns:
+        tuple | None: (start, end) strings; None for the full range, which
+        is also returned for selections that are always plotted per PO.
+    """
+    if not relayout or len(selection.po_rows) <= DASHBOARD_TIMELINE_MAX_POINTS:
+        return None
+    start, end = relayout.get("xaxis.range[0]"), relayout.get("xaxis.range[1]")
+    if start is None and isinstance(relayout.get("xaxis.range"), list):
+        start, end = relayout["xaxis.range"][:2]
+    if start is None or end is None:
+        return None
+    return str(start), str(end)
+
+
+def timeline_rollup(selection, date_range: tuple | None = None) -> tuple[pd.DataFrame, str | None]:
+    """
+    POs of a selection for the timeline at the level of detail of a date range.
+
+    Args:
+        selection: A filter_engine.Selection.
+        date_range (tuple | None): Visible (start, end), see `timeline_range`.
+
+    Returns:
+        tuple[pd.DataFrame, str | None]: The PO rows sorted by date and None,
+        or the rollup per Date (bucket start) and PO Status with the bucket
+        period ("D", "W", "M", "Q" or "Y").
+    """
+    return _memo(selection, ("timeline", date_range), lambda: _timeline(selection.po, date_range))
+
+
+def _timeline(po: pd.DataFrame, date_range: tuple | None) -> tuple[pd.DataFrame, str | None]:
+    if len(po) <= DASHBOARD_TIMELINE_MAX_POINTS:
+        return po.sort_values("Date"), None
+
+    if date_range is None:
+        start, end = po["Date"].min(), po["Date"].max()
+    else:
+        start, end = pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1])
+        width = end - start
+        po = po[po["Date"].between(start - width, end + width)]
+        if len(po) <= DASHBOARD_TIMELINE_MAX_POINTS:
+            return po.sort_values("Date"), None
+
+    days = max((end - start) / pd.Timedelta(days=1), 1.0) if pd.notna(start) and pd.notna(end) else 1.0
+    period = next((p for p, length in BUCKETS if days / length <= DASHBOARD_TIMELINE_MAX_POINTS), BUCKETS[-1][0])
+    bucketed = po.assign(Date=po["Date"].dt.to_period(period).dt.start_time)
+    log.info(f"Timeline: {len(po)} POs in {period} buckets")
+    return _rollup(bucketed, ["Date", "PO Status"]), period
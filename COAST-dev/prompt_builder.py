@@ -0,0 +1,83 @@
+"""
+Prompt assembly for the manufacturing chat.
+
+Prompt files are read through `read_cached`, which keeps their text keyed
+by path + mtime + size, so the template and context files are only read
+again after they change.
+
+Messages are laid out from most to least stable so the provider's
+automatic prefix caching can reuse the longest possible prefix between
+requests:
+
+    1. system: prompt template + answer instructions   (same for every request)
+    2. system: grounding data                           (same for a part / query topic)
+    3. system: precomputed vendor scores                (vendor queries only)
+    4. conversation history
+    5. user:   the current query (sent once, not repeated inside the system prompt)
+
+For vendor queries the scores replace the grounding: only the report's
+header (input descriptor and resolved part) is kept of it, since the score
+table already summarizes the part's matched PO and vendor rows.
+"""
+
+import os
+import re
+import threading
+
+from tokens import count_message_tokens
+
+ANSWER_INSTRUCTIONS = (
+    "Based on your understanding, please respond to the user's query. If a vendor recommendation "
+    "is requested, follow the specified output format. Otherwise, provide a concise and factual answer."
+)
+
+_HEADER_RE = re.compile(r"^===== INPUT DESCRIPTOR =====$.*?(?=^===== MATCHES IN |\Z)", re.M | re.S)
+
+_files: dict = {}
+_files_lock = threading.Lock()
+
+
+def read_cached(path: str) -> str:
+    """Text of `path`, served from memory until the file's mtime or size changes."""
+    st = os.stat(path)
+    key = os.path.abspath(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _files_lock:
+        cached = _files.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    with _files_lock:
+        _files[key] = (stamp, text)
+    return text
+
+
+def part_header(grounding_data: str) -> str:
+    """Input descriptor and resolved part of a new_kb report ("" when the grounding does not include them)."""
+    m = _HEADER_RE.search(grounding_data)
+    return m.group(0).strip() if m else ""
+
+
+def build_manufacturing_messages(template: str, grounding_data: str, conversation_history: list[dict], user_query: str,
+                                 vendor_scores: str = None):
+    """
+    Builds the chat messages for a manufacturing query.
+
+    `vendor_scores` is the table from vendor_scoring.format_scores, added for
+    vendor-selection queries so the LLM only writes up the ranking; the
+    grounding is then cut to the part's header (see `part_header`).
+
+    Returns:
+        tuple[list[dict], int]: The messages and their prompt token count.
+    """
+    if vendor_scores:
+        grounding_data = part_header(grounding_data)
+    messages = [
+        {"role": "system", "content": f"{template.strip()}\n\n{ANSWER_INSTRUCTIONS}"},
+        *([{"role": "system", "content": f"## Provided Context Data:\n{grounding_data}"}] if grounding_data else []),
+        *([{"role": "system", "content": vendor_scores}] if vendor_scores else []),
+        *conversation_history,
+        {"role": "user", "content": user_query},
+    ]
+    return messages, count_message_tokens(messages)
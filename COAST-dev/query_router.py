@@ -0,0 +1,263 @@
+"""
+Query routing for the demo chatbot.
+
+Every table query is classified as
+
+    lookup      about one entity (answered from entity_index)
+    aggregate   a count / average / sum / min / max / median, optionally
+                filtered and grouped ("how many patients per condition",
+                "average progress score for physiotherapy")
+    free-form   anything else (contextualization + TAPAS)
+
+Aggregate questions are turned into a small operation plan built only from
+the table's own column names and values (no generated code):
+
+    {"filters": [(column, op, value), ...],   op in ==, >, >=, <, <=
+     "groupby": column or None,
+     "agg": "count" | "mean" | "sum" | "min" | "max" | "median",
+     "target": numeric column or None (count)}
+
+`run_plan` executes it with vectorized pandas operations over the whole
+table. The planner is conservative: when a query word is not accounted for
+by the plan (an unknown value, a column the plan does not use), no plan is
+built and the query falls back to TAPAS.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from entity_index import AhoCorasick
+from text_search import STOPWORDS, stem, tokenize
+
+LOOKUP, AGGREGATE, FREE_FORM = "lookup", "aggregate", "free-form"
+
+AGG_PATTERNS = [
+    ("count", re.compile(r"\b(how many|count|number of)\b", re.I)),
+    ("mean", re.compile(r"\b(average|avg|mean)\b", re.I)),
+    ("median", re.compile(r"\bmedian\b", re.I)),
+    ("sum", re.compile(r"\b(total|sum)\b", re.I)),
+    ("max", re.compile(r"\b(max|maximum|highest|largest|longest|oldest)\b", re.I)),
+    ("min", re.compile(r"\b(min|minimum|lowest|smallest|shortest|youngest)\b", re.I)),
+]
+GROUP_RE = re.compile(r"\b(?:per|by|for each|each|across)\s+([a-z0-9 /%()-]+)", re.I)
+COMPARE_RE = re.compile(
+    r"\b(older than|younger than|greater than|more than|less than|fewer than|higher than|lower than|"
+    r"at least|at most|over|above|under|below|exceeding)\s+(-?\d+(?:\.\d+)?)|(>=|<=|>|<)\s*(-?\d+(?:\.\d+)?)",
+    re.I,
+)
+COMPARE_OPS = {
+    "older than": ">", "greater than": ">", "more than": ">", "higher than": ">", "over": ">", "above": ">",
+    "exceeding": ">", "at least": ">=", "younger than": "<", "less than": "<", "fewer than": "<", "lower than": "<",
+    "under": "<", "below": "<", "at most": "<=", ">": ">", ">=": ">=", "<": "<", "<=": "<=",
+}
+AGE_WORDS = re.compile(r"\b(older|younger|oldest|youngest)\b", re.I)
+# "patients over 60": a comparison right after a person is about their age
+PERSON_TOKENS = {"patient", "people", "person", "anyone", "those"}
+
+# Tokens that appear in many column names and do not identify one
+GENERIC_TOKENS = {"id", "name", "patient", "per", "of", "type", "flag"}
+
+# Words an aggregate question may contain besides columns, values and numbers
+PLAN_WORDS = {
+    "count", "number", "many", "much", "average", "avg", "mean", "median", "total", "sum", "max", "maximum",
+    "highest", "largest", "longest", "oldest", "min", "minimum", "lowest", "smallest", "shortest", "youngest",
+    "older", "younger", "greater", "more", "less", "fewer", "higher", "lower", "least", "most", "over", "above",
+    "under", "below", "exceeding", "than", "per", "by", "each", "across", "patient", "people", "person", "record",
+    "row", "table", "data", "there", "have", "has", "had", "are", "were", "whose", "find", "get", "value",
+    "overall", "all", "our", "their", "currently", "status", "id", "name",
+}
+
+_OPS = {
+    "==": lambda s, v: s == v,
+    ">": lambda s, v: s > v,
+    ">=": lambda s, v: s >= v,
+    "<": lambda s, v: s < v,
+    "<=": lambda s, v: s <= v,
+}
+AGGS = ("count", "mean", "sum", "min", "max", "median")
+
+
+def _tokens(text: str) -> set:
+    return {stem(t) for t in tokenize(text)}
+
+
+class TableProfile:
+    """Typed columns, column-name tokens and a matcher over categorical values of one table."""
+
+    def __init__(self, df: pd.DataFrame, max_categories: int = 50):
+        self.df = df
+        self.columns = list(df.columns)
+        self.column_tokens = {c: _tokens(str(c)) - GENERIC_TOKENS for c in self.columns}
+        self.numeric = {}
+        self.ranges = {}  # numeric column -> (min, max)
+        self.categories = {}  # lower-cased value -> (column, value)
+        for c in self.columns:
+            values = pd.to_numeric(df[c], errors="coerce")
+            if values.notna().mean() >= 0.9:
+                self.numeric[c] = values
+                self.ranges[c] = (values.min(), values.max())
+                continue
+            uniques = df[c].dropna().astype(str).str.strip().unique()
+            if len(uniques) <= max_categories:
+                for v in uniques:
+                    key = v.lower()
+                    if len(key) >= 3 and key not in STOPWORDS:
+                        self.categories.setdefault(key, (c, v))
+        self.value_matcher = AhoCorasick(list(self.categories))
+        names = [c for c in self.columns if "name" in _tokens(str(c))]
+        self.label_column = names[0] if names else self.columns[0]
+
+    def match_column(self, tokens: set, numeric_only: bool = False, exclude=(), min_share: float = 0.0) -> str | None:
+        """Column whose name best overlaps `tokens` (share of its distinctive tokens present, above `min_share`)."""
+        best, best_score = None, (0, 0)
+        for c in self.columns:
+            if c in exclude or (numeric_only and c not in self.numeric):
+                continue
+            own = self.column_tokens[c]
+            hits = len(own & tokens)
+            if hits and hits / len(own) > min_share:
+                score = (hits / len(own), hits)
+                if score > best_score:
+                    best, best_score = c, score
+        return best
+
+    def columns_in_range(self, number: float, exclude=()) -> list[str]:
+        """Numeric columns whose values range over `number`."""
+        return [c for c, (low, high) in self.ranges.items() if c not in exclude and low <= number <= high]
+
+    def mentioned_values(self, query: str) -> list[tuple[str, str]]:
+        text = query.lower()
+        found = []
+        for start, end, key in self.value_matcher.find(text):
+            if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                if self.categories[key] not in found:
+                    found.append(self.categories[key])
+        return found
+
+
+def classify(query: str, entity_matched: bool = False) -> str:
+    if entity_matched:
+        return LOOKUP
+    if any(p.search(query) for _, p in AGG_PATTERNS):
+        return AGGREGATE
+    return FREE_FORM
+
+
+def build_plan(query: str, profile: TableProfile) -> dict | None:
+    """Operation plan for an aggregate question, or None when it cannot be built safely."""
+    agg = next((name for name, p in AGG_PATTERNS if p.search(query)), None)
+    if agg is None:
+        return None
+    query_tokens = _tokens(query)
+
+    # "per week" in "total sessions per week" is part of the column name, not a group-by
+    text = query.lower()
+    named = [(m.start(), m.end()) for c in profile.columns for m in re.finditer(re.escape(str(c).lower()), text)]
+    groupby = None
+    m = GROUP_RE.search(query)
+    while m and any(start <= m.start() < end for start, end in named):
+        m = GROUP_RE.search(query, m.start() + 1)
+    if m:
+        groupby = profile.match_column(_tokens(" ".join(m.group(1).split()[:4])))
+
+    target = None
+    if agg != "count":
+        target = profile.match_column(query_tokens, numeric_only=True, exclude={groupby})
+        if target is None and AGE_WORDS.search(query):
+            target = profile.match_column({"age"}, numeric_only=True)
+        if target is None:
+            return None
+
+    filters = []
+    for column, value in profile.mentioned_values(query):
+        if column != groupby:
+            filters.append((column, "==", value))
+    for m in COMPARE_RE.finditer(query):
+        phrase = (m.group(1) or m.group(3)).lower()
+        number = float(m.group(2) or m.group(4))
+        before = [stem(t) for t in tokenize(query[:m.start()])[-3:]]
+        if phrase in ("older than", "younger than") or before[-1:] and before[-1] in PERSON_TOKENS:
+            column = profile.match_column({"age"}, numeric_only=True)
+        else:  # the column is named right before the comparison ("progress score above 80")
+            column = profile.match_column(set(before), numeric_only=True, min_share=0.5)
+        if column is None:  # or elsewhere in the query ("more than 4 sessions per week")
+            column = profile.match_column(query_tokens, numeric_only=True, exclude={target, groupby}, min_share=0.5)
+        if column is None:  # the only column whose values reach the number
+            in_range = profile.columns_in_range(number, exclude={target, groupby})
+            column = in_range[0] if len(in_range) == 1 else None
+        if column is None:
+            return None
+        filters.append((column, COMPARE_OPS[phrase], number))
+
+    plan = {"filters": filters, "groupby": groupby, "agg": agg, "target": target}
+    if _unexplained_tokens(query, profile, plan):
+        return None
+    return plan
+
+
+def _unexplained_tokens(query: str, profile: TableProfile, plan: dict) -> set:
+    """Query words not accounted for by the plan's columns and values or by aggregate phrasing."""
+    explained = {stem(w) for w in PLAN_WORDS}
+    for column in [plan["groupby"], plan["target"], *(f[0] for f in plan["filters"])]:
+        if column:
+            explained |= _tokens(str(column))
+    for _, _, value in plan["filters"]:
+        explained |= _tokens(str(value))
+    return {t for t in _tokens(query) if t not in explained and not re.fullmatch(r"-?\d+(?:\.\d+)?", t)}
+
+
+def _fmt(x) -> str:
+    if isinstance(x, (float, np.floating)):
+        return f"{x:.2f}".rstrip("0").rstrip(".")
+    return str(x)
+
+
+def run_plan(plan: dict, profile: TableProfile) -> str:
+    """
+    Executes a plan from `build_plan` over the whole table.
+
+    Returns:
+        str: The result with a one-line description of how it was computed.
+    """
+    df = profile.df
+    if plan["agg"] not in AGGS:
+        raise ValueError(f"Unsupported aggregation: {plan['agg']}")
+    mask = np.ones(len(df), dtype=bool)
+    conditions = []
+    for column, op, value in plan["filters"]:
+        if column not in df.columns or op not in _OPS:
+            raise ValueError(f"Invalid filter: {column} {op} {value}")
+        series = profile.numeric[column] if column in profile.numeric else df[column].astype(str).str.strip().str.lower()
+        mask &= _OPS[op](series, value if column in profile.numeric else str(value).lower()).to_numpy()
+        conditions.append(f"{column} {op} {_fmt(value)}")
+
+    where = f" where {' and '.join(conditions)}" if conditions else ""
+    rows = df[mask]
+    target = plan["target"]
+    values = profile.numeric[target][mask] if target else None
+    label = f"{plan['agg']} of {target}" if target else "number of rows"
+    described = f"{label}{where} (computed over all {len(df)} rows of the table, {len(rows)} matching)"
+
+    if plan["groupby"]:
+        keys = rows[plan["groupby"]].astype(str)
+        result = (values.groupby(keys).agg(plan["agg"]) if target else keys.value_counts()).sort_index()
+        lines = [f"- {k}: {_fmt(v)}" for k, v in result.items()]
+        return f"{described}, per {plan['groupby']}:\n" + ("\n".join(lines) if lines else "- (no matching rows)")
+
+    if not target:
+        return f"{described}: {len(rows)}"
+    if values.notna().sum() == 0:
+        return f"{described}: no values"
+    result = values.agg(plan["agg"])
+    text = f"{described}: {_fmt(result)}"
+    if plan["agg"] in ("max", "min"):
+        who = rows.loc[values == result, profile.label_column].astype(str).tolist()
+        text += f" ({profile.label_column}: {', '.join(who[:10])})"
+    return text
+
+
+def get_table_profile(dataset) -> TableProfile:
+    """Profile of a dataset_cache.Dataset, built once per dataset version."""
+    return dataset.derived("table_profile", lambda: TableProfile(dataset.df))
@@ -0,0 +1,230 @@
+"""
+Response cache for the chat endpoints.
+
+Answers are cached under a key built from
+
+    normalized query + hash of the grounding context + template version + history fingerprint
+
+so a repeated question about the same part, against the same data and prompt,
+in the same conversation state, is answered without an LLM round trip.
+
+Each `ResponseCache` keeps recently used entries in an in-memory LRU in
+front of a local SQLite table (shared by all workers and kept across
+restarts). Entries expire after `ttl_seconds`; the SQLite table is pruned
+to the `max_entries` most recently used rows. The in-memory LRU holds at
+most `memory_entries` entries and, when `memory_bytes` is set, at most that
+many characters of values. Hit / miss counters are kept
+per cache and exposed by `cache_stats` (GET /cache/stats).
+
+Caching is skipped entirely when config.RESPONSE_CACHE_ENABLED is False and
+per request via the `use_cache` flag of the chat functions.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_DB_FILE, RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MEMORY_ENTRIES, RESPONSE_CACHE_TTL_SECONDS,
+)
+from tracing import record_cache
+
+log = logging.getLogger("response_cache")
+
+_WS_RE = re.compile(r"\s+")
+_TRAILING_RE = re.compile(r"[\s?.!]+$")
+
+
+def normalize_query(query: str) -> str:
+    """'  Best vendor for FA-2024-001 ?' -> 'best vendor for fa-2024-001'"""
+    return _TRAILING_RE.sub("", _WS_RE.sub(" ", (query or "").strip().lower()))
+
+
+def _sha(data) -> str:
+    if not isinstance(data, str):
+        data = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def make_key(query: str, context, template, conversation_history: list[dict]) -> str:
+    """
+    Cache key of a chat request.
+
+    Args:
+        query (str): The user's query (normalized here).
+        context: The grounding context, or anything identifying its version.
+        template: The prompt template, or its version.
+        conversation_history (list[dict]): The history sent with the request.
+
+    Returns:
+        str: Hex digest of the four components.
+    """
+    history = [(m.get("role"), m.get("content")) for m in conversation_history or []]
+    return _sha([normalize_query(query), _sha(context), _sha(template), _sha(history)])
+
+
+def file_version(path: str) -> str:
+    """Cheap version stamp of a file (path + mtime + size) for use as a key component."""
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}:{st.st_mtime_ns}:{st.st_size}"
+
+
+class ResponseCache:
+    """LRU + TTL cache of text values, backed by one SQLite table."""
+
+    def __init__(self, name: str, db_path: str = RESPONSE_CACHE_DB_FILE, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS, memory_entries: int = RESPONSE_CACHE_MEMORY_ENTRIES,
+                 memory_bytes: int | None = None):
+        if not re.fullmatch(r"\w+", name):
+            raise ValueError(f"Invalid cache name: {name!r}")
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.memory_bytes = memory_bytes
+        self.hits = self.misses = 0
+        self._memory: OrderedDict = OrderedDict()  # key -> (created, value)
+        self._memory_size = 0  # total length of the values in memory
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+        if db_path:
+            try:
+                os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+                self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {name} "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+                )
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{name}_accessed ON {name}(accessed)")
+                self._conn.commit()
+            except sqlite3.Error as e:
+                log.warning(f"Response cache '{name}' is memory-only, cannot open {db_path}: {e}")
+                self._conn = None
+
+    def _remember(self, key: str, created: float, value: str) -> None:
+        self._forget(key)
+        self._memory[key] = (created, value)
+        self._memory_size += len(value)
+        while self._memory and (
+            len(self._memory) > self.memory_entries
+            or (self.memory_bytes is not None and self._memory_size > self.memory_bytes)
+        ):
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _forget(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_size -= len(entry[1])
+
+    def get(self, key: str) -> str | None:
+        """Cached value of `key`, or None when missing or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] > self.ttl_seconds:
+                self._forget(key)
+                entry = None
+            if entry is None and self._conn is not None:
+                try:
+                    row = self._conn.execute(f"SELECT created, value FROM {self.name} WHERE key = ?", (key,)).fetchone()
+                    if row is not None and now - row[0] > self.ttl_seconds:
+                        self._conn.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+                        row = None
+                    elif row is not None:
+                        self._conn.execute(f"UPDATE {self.name} SET accessed = ? WHERE key = ?", (now, key))
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    log.warning(f"Response cache '{self.name}' read failed: {e}")
+                    row = None
+                if row is not None:
+                    entry = (row[0], row[1])
+            if entry is None:
+                self.misses += 1
+                record_cache(self.name, False)
+                return None
+            self._remember(key, *entry)
+            self.hits += 1
+            record_cache(self.name, True)
+            return entry[1]
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {self.name} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                self._writes += 1
+                if self._writes % 50 == 0:
+                    self._prune(now)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                log.warning(f"Response cache '{self.name}' write failed: {e}")
+
+    def _prune(self, now: float) -> None:
+        self._conn.execute(f"DELETE FROM {self.name} WHERE created < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            f"DELETE FROM {self.name} WHERE key NOT IN "
+            f"(SELECT key FROM {self.name} ORDER BY accessed DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+            self.hits = self.misses = 0
+            if self._conn is not None:
+                self._conn.execute(f"DELETE FROM {self.name}")
+                self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = None
+            if self._conn is not None:
+                entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "memory_entries": len(self._memory),
+                "memory_size": self._memory_size,
+                "stored_entries": entries,
+            }
+
+
+_caches: dict = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str) -> ResponseCache | None:
+    """The process-wide cache called `name`, or None when response caching is disabled."""
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = _caches[name] = ResponseCache(name)
+        return cache
+
+
+def cache_stats() -> dict:
+    """Hit / miss statistics of every cache used so far in this process."""
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {"enabled": RESPONSE_CACHE_ENABLED, "caches": {c.name: c.stats() for c in caches}}
@@ -0,0 +1,153 @@
+"""
+Section-level lexical retrieval over manufacturing context files.
+
+Context files (the unified CAD_knowledge_all.txt or a per-part report from
+new_kb.generate_report) are split into chunks:
+
+  * knowledge file: one chunk per part sub-block, titled
+    `=== PART: <PID> === [BOM|VENDORS|PURCHASE_ORDERS]`
+  * report file:    one chunk per `===== ... =====` section
+
+Blocks larger than `max_chunk_tokens` are split further on their row
+markers (`- ROW n` / `-- Match #n`). A BM25 index over the chunks is built
+once per file version; `retrieve_context` returns the top-ranked chunks
+that fit a token budget, in document order, so the LLM gets only the
+sections relevant to the query.
+"""
+
+import hashlib
+import os
+import re
+import threading
+
+from text_search import BM25Index, tokenize
+from tokens import count_tokens
+
+_PART_RE = re.compile(r"^=== PART: (\S+) ===[ \t]*$", re.M)
+_REPORT_RE = re.compile(r"^===== (.+?) =====[ \t]*$", re.M)
+_BLOCK_RE = re.compile(r"^\[(BOM|VENDORS|PURCHASE_ORDERS)\][ \t]*$", re.M)
+_ROW_RE = re.compile(r"^(?:- ROW \d+|-- Match #\d+)[ \t]*$", re.M)
+
+
+def _split_rows(title: str, body: str, max_chunk_tokens: int) -> list[tuple[str, str]]:
+    if count_tokens(body) <= max_chunk_tokens:
+        return [(title, body)]
+    starts = [m.start() for m in _ROW_RE.finditer(body)]
+    if len(starts) < 2:
+        return [(title, body)]
+    pieces = [body[:starts[0]]] if starts[0] > 0 else []
+    pieces += [body[s:e] for s, e in zip(starts, starts[1:] + [len(body)])]
+    chunks, cur = [], ""
+    for piece in pieces:
+        if cur and count_tokens(cur + piece) > max_chunk_tokens:
+            chunks.append((title, cur))
+            cur = ""
+        cur += piece
+    if cur:
+        chunks.append((title, cur))
+    return chunks
+
+
+def split_chunks(text: str, max_chunk_tokens: int = 600) -> list[tuple[str, str]]:
+    """Splits a context file into (title, body) chunks in document order."""
+    text = text.replace("\r\n", "\n")
+    parts = list(_PART_RE.finditer(text))
+    chunks = []
+    if parts:
+        preamble = text[:parts[0].start()].strip()
+        if preamble:
+            chunks.append(("HEADER", preamble))
+        for i, m in enumerate(parts):
+            pid = m.group(1)
+            if pid == "<PID>":  # FORMAT example
+                continue
+            end = parts[i + 1].start() if i + 1 < len(parts) else len(text)
+            section = text[m.end():end]
+            blocks = list(_BLOCK_RE.finditer(section))
+            for j, bm in enumerate(blocks):
+                bend = blocks[j + 1].start() if j + 1 < len(blocks) else len(section)
+                title = f"=== PART: {pid} === [{bm.group(1)}]"
+                chunks.extend(_split_rows(title, section[bm.end():bend].strip("\n"), max_chunk_tokens))
+        return chunks
+
+    heads = list(_REPORT_RE.finditer(text))
+    if heads:
+        if text[:heads[0].start()].strip():
+            chunks.append(("HEADER", text[:heads[0].start()].strip()))
+        for i, m in enumerate(heads):
+            end = heads[i + 1].start() if i + 1 < len(heads) else len(text)
+            chunks.extend(_split_rows(m.group(0).strip(), text[m.end():end].strip("\n"), max_chunk_tokens))
+        return chunks
+
+    return [("", p.strip()) for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+
+class ContextIndex:
+    """Chunks and BM25 index of one version of a context file."""
+
+    def __init__(self, text: str, max_chunk_tokens: int = 600):
+        self.full_text = text
+        self.total_tokens = count_tokens(text)
+        self.chunks = []
+        for order, (title, body) in enumerate(split_chunks(text, max_chunk_tokens)):
+            rendered = f"{title}\n{body}" if title else body
+            self.chunks.append({
+                "order": order,
+                "title": title,
+                "text": rendered,
+                "tokens": count_tokens(rendered),
+                "body_hash": hashlib.sha1(body.encode("utf-8")).hexdigest(),
+            })
+        self.bm25 = BM25Index([tokenize(c["text"]) for c in self.chunks])
+
+    def select(self, query: str, token_budget: int, top_k: int) -> list[dict]:
+        """Top-k chunks for `query` that fit `token_budget`, in document order."""
+        scores = self.bm25.scores(tokenize(query))
+        ranked = sorted((i for i, s in enumerate(scores) if s > 0), key=lambda i: -scores[i])
+        if not ranked:
+            ranked = list(range(len(self.chunks)))  # nothing matched: lead with the top of the file
+        picked, seen, used = [], set(), 0
+        for i in ranked:
+            c = self.chunks[i]
+            if c["body_hash"] in seen:  # sub-parts repeat their assembly's vendor / PO rows
+                continue
+            if used + c["tokens"] > token_budget:
+                continue
+            picked.append(c)
+            seen.add(c["body_hash"])
+            used += c["tokens"]
+            if len(picked) >= top_k:
+                break
+        return sorted(picked, key=lambda c: c["order"])
+
+
+_indexes: dict = {}
+_indexes_lock = threading.Lock()
+
+
+def get_context_index(path: str) -> ContextIndex:
+    """Index of the file at `path`, rebuilt only when the file changes (path + mtime + size)."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    with _indexes_lock:
+        idx = _indexes.get(key[0])
+        if idx is not None and idx[0] == key:
+            return idx[1]
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        index = ContextIndex(f.read())
+    with _indexes_lock:
+        _indexes[key[0]] = (key, index)
+    return index
+
+
+def retrieve_context(path: str, query: str, token_budget: int, top_k: int = 8) -> str:
+    """
+    Grounding text for `query` from the context file at `path`.
+
+    Small files that already fit the budget are returned whole; otherwise the
+    top-k BM25 chunks that fit `token_budget` are joined in document order.
+    """
+    index = get_context_index(path)
+    if index.total_tokens <= token_budget:
+        return index.full_text
+    return "\n\n".join(c["text"] for c in index.select(query, token_budget, top_k))
@@ -0,0 +1,248 @@
+"""
+Incrementally maintained rollup cube of the supply chain tables for the
+Supply Chain Hub KPIs and vendor bar chart (db.py).
+
+Rows are rolled up into cells of additive statistics, one cell per
+combination of dimension values:
+
+    po        Month x Vendor x Part ID x PO Status
+              rows; count, sum and sum of squares of Amount ($), Qty Ordered
+    vendors   Vendor Name x Part Name
+              rows; count, sum and sum of squares of Orders, DPPM,
+              Quality %, Avg Days, On-Time %
+
+(vendor metrics have no month or PO status; a selection's months reach
+them through the vendors with PO cells in those months). Every dimension
+value has an inverted index of its cells, so a query only touches the
+cells of the selected values - its cost depends on the number of selected
+cells, not on the number of rows. Means and standard deviations are
+derived from the sums.
+
+The cube grows with `ingest`. When the catalog files change,
+supply_chain.get_supply_chain_model carries the previous cube over with
+`updated`: if the old rows are still the first rows of the new tables
+(checked by row hashes), only the appended rows are rolled in; any other
+change rebuilds the cube.
+"""
+
+import hashlib
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger("rollup_cube")
+
+PO_DIMS = ("Month", "Vendor", "Part ID", "PO Status")
+PO_MEASURES = ("Amount ($)", "Qty Ordered")
+VENDOR_DIMS = ("Vendor Name", "Part Name")
+VENDOR_MEASURES = ("Orders", "DPPM", "Quality %", "Avg Days", "On-Time %")
+
+
+def _key(values: tuple) -> tuple:
+    return tuple(None if pd.isna(v) else v for v in values)
+
+
+def _integral(values):
+    """Sums of integer columns back as integers (the cells hold floats)."""
+    if isinstance(values, pd.Series):
+        return values.astype("int64") if np.all(np.isfinite(values)) and np.all(values == np.round(values)) else values
+    return int(values) if float(values).is_integer() else float(values)
+
+
+class Cells:
+    """Additive statistics of one table per combination of its dimension values."""
+
+    def __init__(self, dims: tuple, measures: tuple):
+        self.dims, self.measures = dims, measures
+        self.ids: dict = {}  # dimension values -> cell id
+        self.keys: list = []  # cell id -> dimension values
+        self.index = [{} for _ in dims]  # per dimension: value -> cell ids
+        self.stats = np.zeros((16, 1 + 3 * len(measures)))  # rows, then per measure: count, sum, sum of squares
+        self.size = 0
+
+    def copy(self) -> "Cells":
+        cells = Cells(self.dims, self.measures)
+        cells.ids, cells.keys = dict(self.ids), list(self.keys)
+        cells.index = [{v: list(ids) for v, ids in index.items()} for index in self.index]
+        cells.stats, cells.size = self.stats.copy(), self.size
+        return cells
+
+    def _cell(self, key: tuple) -> int:
+        cell = self.ids.get(key)
+        if cell is None:
+            cell = self.ids[key] = self.size
+            self.keys.append(key)
+            for index, value in zip(self.index, key):
+                index.setdefault(value, []).append(cell)
+            if self.size == len(self.stats):
+                self.stats = np.concatenate([self.stats, np.zeros_like(self.stats)])
+            self.size += 1
+        return cell
+
+    def add(self, frame: pd.DataFrame) -> None:
+        """Rolls the rows of `frame` into the cells (grouped vectorized, then one update per cell touched)."""
+        if frame.empty:
+            return
+        columns = {d: frame[d] for d in self.dims}
+        columns["_rows"] = np.ones(len(frame))
+        for m in self.measures:
+            values = pd.to_numeric(frame[m], errors="coerce").astype(float)
+            columns[f"{m}_n"] = values.notna().astype(float)
+            columns[f"{m}_sum"] = values.fillna(0.0)
+            columns[f"{m}_sq"] = values.fillna(0.0) ** 2
+        grouped = pd.DataFrame(columns).groupby(list(self.dims), observed=True, dropna=False, sort=False).sum()
+        cells = np.array([self._cell(_key(k)) for k in grouped.index], dtype=np.int64)
+        np.add.at(self.stats, cells, grouped.to_numpy())
+
+    def select(self, **filters) -> np.ndarray:
+        """Ids of the cells whose value of every filtered dimension is one of its values (None: not filtered)."""
+        ids = None
+        for dim, values in filters.items():
+            if values is None:
+                continue
+            index = self.index[self.dims.index(dim)]
+            cells = {c for v in values for c in index.get(v, ())}
+            ids = cells if ids is None else ids & cells
+        if ids is None:
+            return np.arange(self.size)
+        return np.fromiter(sorted(ids), dtype=np.int64, count=len(ids))
+
+    def distinct(self, cells: np.ndarray, dim: str) -> list:
+        """Values of `dim` in the given cells (missing values excluded), in cell order."""
+        d = self.dims.index(dim)
+        return list(dict.fromkeys(self.keys[c][d] for c in cells if self.keys[c][d] is not None))
+
+    def total(self, cells: np.ndarray, measure: str) -> float:
+        return float(self.stats[cells, 2 + 3 * self.measures.index(measure)].sum())
+
+    def summary(self, cells: np.ndarray, by: str) -> pd.DataFrame:
+        """
+        Statistics of the given cells per value of dimension `by` (sorted).
+
+        Returns:
+            pd.DataFrame: `by`, rows, and per measure its sum, "<measure> mean"
+            and "<measure> std" (sample standard deviation).
+        """
+        d = self.dims.index(by)
+        cells = [c for c in cells if self.keys[c][d] is not None]
+        groups = sorted({self.keys[c][d] for c in cells})
+        position = {v: i for i, v in enumerate(groups)}
+        grouped = np.zeros((len(groups), self.stats.shape[1]))
+        np.add.at(grouped, [position[self.keys[c][d]] for c in cells], self.stats[cells])
+
+        out = {by: groups, "rows": grouped[:, 0]}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for i, m in enumerate(self.measures):
+                n, total, squares = grouped[:, 1 + 3 * i], grouped[:, 2 + 3 * i], grouped[:, 3 + 3 * i]
+                out[m] = total
+                out[f"{m} mean"] = np.where(n > 0, total / n, np.nan)
+                out[f"{m} std"] = np.where(n > 1, np.sqrt(np.clip((squares - total ** 2 / n) / (n - 1), 0, None)), np.nan)
+        return pd.DataFrame(out)
+
+
+def _row_hashes(frame: pd.DataFrame, cells: Cells) -> np.ndarray:
+    return pd.util.hash_pandas_object(frame[list(cells.dims + cells.measures)], index=False).to_numpy()
+
+
+class RollupCube:
+    """Purchase order and vendor cells of the supply chain model."""
+
+    def __init__(self):
+        self.cells = {"po": Cells(PO_DIMS, PO_MEASURES), "vendors": Cells(VENDOR_DIMS, VENDOR_MEASURES)}
+        self.rows = {"po": 0, "vendors": 0}
+        self._digests = {"po": hashlib.sha1(), "vendors": hashlib.sha1()}  # of the ingested rows' hashes
+        self._lock = threading.RLock()
+
+    @property
+    def po(self) -> Cells:
+        return self.cells["po"]
+
+    @property
+    def vendors(self) -> Cells:
+        return self.cells["vendors"]
+
+    @classmethod
+    def build(cls, po: pd.DataFrame, vendors: pd.DataFrame) -> "RollupCube":
+        cube = cls()
+        cube.ingest(po=po, vendors=vendors)
+        return cube
+
+    def _add(self, table: str, frame: pd.DataFrame, hashes: np.ndarray) -> None:
+        self.cells[table].add(frame)
+        self.rows[table] += len(frame)
+        self._digests[table].update(hashes.tobytes())
+
+    def ingest(self, po: pd.DataFrame | None = None, vendors: pd.DataFrame | None = None) -> None:
+        """
+        Rolls new rows into the cube.
+
+        Args:
+            po (pd.DataFrame | None): New purchase order rows.
+            vendors (pd.DataFrame | None): New vendor rows.
+
+        Both are typed as in supply_chain.SupplyChainModel (po needs Month,
+        Vendor, Part ID, PO Status, Amount ($), Qty Ordered; vendors needs
+        Vendor Name, Part Name and the vendor metrics).
+        """
+        with self._lock:
+            for table, frame in (("po", po), ("vendors", vendors)):
+                if frame is not None and len(frame):
+                    self._add(table, frame, _row_hashes(frame, self.cells[table]))
+
+    def updated(self, po: pd.DataFrame, vendors: pd.DataFrame) -> "RollupCube | None":
+        """
+        A copy of the cube brought up to date with the full new tables.
+
+        Returns:
+            RollupCube | None: The copy with only the appended rows rolled in,
+            or None when the tables do not start with the rows already
+            ingested (the cube must be rebuilt).
+        """
+        with self._lock:
+            cube = RollupCube()
+            cube.rows = dict(self.rows)
+            cube._digests = {t: h.copy() for t, h in self._digests.items()}
+            cube.cells = {t: c.copy() for t, c in self.cells.items()}
+        for table, frame in (("po", po), ("vendors", vendors)):
+            n = self.rows[table]
+            if len(frame) < n:
+                return None
+            hashes = _row_hashes(frame, cube.cells[table])
+            if hashlib.sha1(hashes[:n].tobytes()).hexdigest() != self._digests[table].hexdigest():
+                return None
+            if len(frame) > n:
+                cube._add(table, frame.iloc[n:], hashes[n:])
+        log.info(f"Rollup cube updated: +{len(po) - self.rows['po']} POs, +{len(vendors) - self.rows['vendors']} vendor rows")
+        return cube
+
+    # ------------------------------------------------------------ queries
+    def po_vendors(self, months=None) -> list:
+        """Vendors with purchase orders in the given months (all months when empty)."""
+        with self._lock:
+            return self.po.distinct(self.po.select(Month=list(months) if months else None), "Vendor")
+
+    def vendor_cells(self, vendor_names=None, part_names=None) -> np.ndarray:
+        """Vendor cells of the given vendors and parts (None: all)."""
+        with self._lock:
+            return self.vendors.select(**{"Vendor Name": vendor_names, "Part Name": part_names})
+
+    def vendor_kpis(self, cells: np.ndarray) -> dict:
+        """Distinct vendors and parts and the total orders of the given vendor cells."""
+        with self._lock:
+            return {
+                "vendors": len(self.vendors.distinct(cells, "Vendor Name")),
+                "parts": len(self.vendors.distinct(cells, "Part Name")),
+                "orders": _integral(self.vendors.total(cells, "Orders")),
+            }
+
+    def vendor_summary(self, cells: np.ndarray) -> pd.DataFrame:
+        """Per vendor (sorted): total Orders and the mean DPPM, Quality %, Avg Days, On-Time % of the given cells."""
+        with self._lock:
+            summary = self.vendors.summary(cells, "Vendor Name")
+        return pd.DataFrame({
+            "Vendor Name": summary["Vendor Name"],
+            "Orders": _integral(summary["Orders"]),
+            **{m: summary[f"{m} mean"] for m in ("DPPM", "Quality %", "Avg Days", "On-Time %")},
+        })
@@ -0,0 +1,160 @@
+"""
+Per-session state for the API.
+
+Each client session holds its own
+
+    excel_file                  active dataset of the demo chat (/upload_excel/)
+    manufacturing_context_file  context report of the manufacturing chat (/upload_cad_pdf/)
+    demo_history                conversation history of the demo chat
+    manufacturing_history       conversation history of the manufacturing chat
+    latest_response             last chat response (GET /chat)
+
+instead of sharing process globals, so concurrent users do not overwrite
+each other's context. Sessions are keyed by the `X-Session-Id` header (or
+the `coast_session` cookie); requests without one share the "default"
+session, which keeps single-user clients working unchanged.
+
+Two backends are available (config.SESSION_BACKEND):
+
+  * "memory": a dict in the process (single worker only),
+  * "sqlite": a local SQLite file shared by every worker on the box, so the
+    API can run with several uvicorn workers.
+
+Sessions not updated for SESSION_TTL_SECONDS are dropped.
+"""
+
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import SESSION_BACKEND, SESSION_DB_FILE, SESSION_TTL_SECONDS, SESSION_MAX_IN_MEMORY
+
+DEFAULT_SESSION = "default"
+SESSION_HEADER = "X-Session-Id"
+SESSION_COOKIE = "coast_session"
+
+
+def new_session_state() -> dict:
+    return {
+        "excel_file": None,
+        "manufacturing_context_file": None,
+        "demo_history": [],
+        "manufacturing_history": [],
+        "latest_response": {"response": ""},
+    }
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+class MemorySessionStore:
+    """Sessions in a dict of the current process, least recently used dropped first."""
+
+    def __init__(self, ttl_seconds: float = SESSION_TTL_SECONDS, max_sessions: int = SESSION_MAX_IN_MEMORY):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict = OrderedDict()  # id -> (updated, state)
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> dict:
+        """State of the session (a fresh state when unknown or expired)."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or time.time() - entry[0] > self.ttl_seconds:
+                return new_session_state()
+            return json.loads(json.dumps(entry[1]))
+
+    def update(self, session_id: str, **fields) -> dict:
+        """Sets `fields` on the session and returns its new state."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            state = entry[1] if entry and time.time() - entry[0] <= self.ttl_seconds else new_session_state()
+            state.update(json.loads(json.dumps(fields, default=str)))
+            self._sessions[session_id] = (time.time(), state)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return json.loads(json.dumps(state))
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore:
+    """Sessions in a local SQLite file, shared by all worker processes."""
+
+    def __init__(self, db_path: str = SESSION_DB_FILE, ttl_seconds: float = SESSION_TTL_SECONDS):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_updated ON sessions(updated)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        return conn
+
+    def _load(self, conn: sqlite3.Connection, session_id: str) -> dict:
+        row = conn.execute("SELECT state, updated FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return new_session_state()
+        return {**new_session_state(), **json.loads(row[0])}
+
+    def get(self, session_id: str) -> dict:
+        """State of the session (a fresh state when unknown or expired)."""
+        return self._load(self._conn(), session_id)
+
+    def update(self, session_id: str, **fields) -> dict:
+        """Sets `fields` on the session atomically (across workers) and returns its new state."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            state = self._load(conn, session_id)
+            state.update(json.loads(json.dumps(fields, default=str)))
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, state, updated) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state), now),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                conn.execute("DELETE FROM sessions WHERE updated < ?", (now - self.ttl_seconds,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return state
+
+    def delete(self, session_id: str) -> None:
+        self._conn().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """The session store selected by config.SESSION_BACKEND ("sqlite" or "memory")."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if SESSION_BACKEND == "sqlite":
+                _store = SQLiteSessionStore()
+            elif SESSION_BACKEND == "memory":
+                _store = MemorySessionStore()
+            else:
+                raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND!r}")
+        return _store
@@ -0,0 +1,223 @@
+"""
+Typed data model of the CAD parts catalog for the Supply Chain Hub dashboard (db.py).
+
+Built once per version of the three catalog CSVs (vendor database,
+purchase orders, BOM) so the dashboard callbacks only select from it:
+
+    vendors   original columns (names stripped), numeric metric columns,
+              categorical `Vendor Name`, `Part Name`, `PID`
+    po        original columns with `Amount ($)` as float and `Date` as
+              datetime, plus categorical `Month` (YYYY-MM period), `State`
+              (parsed from `Location`), `Vendor`, `Part ID`
+    bom       original columns with categorical `Part ID (PID)`, `Part Name`
+
+and the PID join keys resolved ahead of time (vendor part name -> PIDs,
+BOM name -> PIDs, BOM name <-> vendor part names). The frames are shared
+by every callback and must not be modified; selections return row subsets.
+`model.cube` (rollup_cube.RollupCube) holds the PO and vendor rollups the
+KPIs are read from, carried over incrementally when rows are appended to
+the catalog files. `model.filters` (filter_engine.FilterEngine) resolves
+dashboard selections;
+`model.snapshot()` is the compact copy shipped to the browser when the
+dashboard filters clientside (config.DASHBOARD_CLIENTSIDE_FILTERING).
+"""
+
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+from columnar_cache import read_table
+from config import (
+    CATALOG_BOM_CSV, CATALOG_PO_CSV, CATALOG_VENDOR_CSV, DASHBOARD_MAP_DETAIL_ROWS, DASHBOARD_TIMELINE_MAX_POINTS,
+)
+from dataset_cache import file_version
+from filter_engine import FilterEngine
+from rollup_cube import RollupCube
+
+log = logging.getLogger("supply_chain")
+
+VENDOR_METRICS = ["On-Time %", "DPPM", "Orders", "Avg Days", "Quality %"]
+
+
+def _stripped(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.rename(columns=lambda c: str(c).strip())
+    df.index = pd.RangeIndex(len(df))
+    return df
+
+
+def _category(values: pd.Series) -> pd.Series:
+    """Categorical of stripped strings (sorted categories, so grouping orders as it does on strings)."""
+    text = values.astype("string").str.strip()
+    return pd.Series(pd.Categorical(text, categories=sorted(text.dropna().unique())), index=values.index)
+
+
+def _names(values: pd.Series) -> list:
+    return list(pd.unique(values.dropna()))
+
+
+def _codes(column: pd.Series, values) -> np.ndarray:
+    """Category codes of `values` in a categorical column (values that do not occur are dropped)."""
+    lookup = {v: i for i, v in enumerate(column.cat.categories)}
+    return np.array([lookup[v] for v in values if v in lookup], dtype=np.int64)
+
+
+def isin(column: pd.Series, values) -> np.ndarray:
+    """Row mask of a categorical column, compared on its integer codes."""
+    return np.isin(column.cat.codes.to_numpy(), _codes(column, values))
+
+
+def _encode(column: pd.Series):
+    """
+    One column of the browser snapshot.
+
+    Numeric columns are a list of numbers (None for missing values); every
+    other column is dictionary-encoded as {"values": [...], "codes": [...]}
+    with code -1 for missing values. Dates are encoded as YYYY-MM-DD strings.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes, values = column.cat.codes.to_numpy(), column.cat.categories
+    elif pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+        return [None if pd.isna(v) else v for v in column.tolist()]
+    else:
+        if pd.api.types.is_datetime64_any_dtype(column):
+            column = column.dt.strftime("%Y-%m-%d")
+        codes, values = pd.factorize(column)
+    return {"values": [str(v) for v in values], "codes": codes.tolist()}
+
+
+class SupplyChainModel:
+    """Typed vendor, purchase order and BOM tables with their PID join keys."""
+
+    def __init__(self, vendor_df: pd.DataFrame, po_df: pd.DataFrame, bom_df: pd.DataFrame, version: str = "",
+                 cube: RollupCube | None = None):
+        """
+        Args:
+            vendor_df, po_df, bom_df (pd.DataFrame): The catalog tables as read from the CSVs.
+            version (str): Identifies the source files' versions (see get_supply_chain_model).
+            cube (RollupCube | None): Rollup cube of an earlier version of the tables; only the
+                rows appended since are rolled into (a copy of) it, see RollupCube.updated.
+        """
+        self.version = version  # identifies the source files' versions (see get_supply_chain_model)
+        vendors = _stripped(vendor_df)
+        for col in VENDOR_METRICS:
+            if col in vendors.columns:
+                vendors[col] = pd.to_numeric(vendors[col], errors="coerce")
+        for col in ("Vendor Name", "Part Name", "PID"):
+            vendors[col] = _category(vendors[col])
+
+        po = _stripped(po_df)
+        po["Amount ($)"] = pd.to_numeric(po["Amount ($)"].astype(str).str.replace(r"[\$,]", "", regex=True), errors="coerce")
+        po["Date"] = pd.to_datetime(po["Date"], errors="coerce")
+        months = po["Date"].dt.to_period("M").astype(str).where(po["Date"].notna())
+        po["Month"] = pd.Categorical(months, categories=sorted(months.dropna().unique()))
+        po["State"] = _category(po["Location"].astype(str).str.split(",").str[1])
+        for col in ("Vendor", "Part ID"):
+            po[col] = _category(po[col])
+
+        bom = _stripped(bom_df)
+        for col in ("Part ID (PID)", "Part Name"):
+            bom[col] = _category(bom[col])
+
+        self.vendors, self.po, self.bom = vendors, po, bom
+
+        # Dropdown values (in order of first appearance, as in the source files)
+        self.months = _names(months)
+        self.part_names = _names(vendors["Part Name"])
+        self.bom_part_names = _names(bom["Part Name"])
+        self.vendor_names = _names(vendors["Vendor Name"])
+
+        # PID join keys
+        self.pids_by_part = {k: _names(g) for k, g in vendors.groupby("Part Name", observed=True, sort=False)["PID"]}
+        self.pids_by_bom = {k: _names(g) for k, g in bom.groupby("Part Name", observed=True, sort=False)["Part ID (PID)"]}
+        parts_by_pid = {k: _names(g) for k, g in vendors.groupby("PID", observed=True, sort=False)["Part Name"]}
+        self.parts_by_bom = {
+            b: list(dict.fromkeys(p for pid in pids for p in parts_by_pid.get(pid, [])))
+            for b, pids in self.pids_by_bom.items()
+        }
+
+        self.cube = cube.updated(po, vendors) if cube is not None else None
+        if self.cube is None:
+            self.cube = RollupCube.build(po, vendors)
+
+        self.filters = FilterEngine(self)
+        self._snapshot = None
+
+    def snapshot(self) -> dict:
+        """
+        Compact columnar copy of the three tables for the browser (see
+        assets/supply_chain_filters.js), built once per model.
+
+        Returns:
+            dict: {"version", "vendors", "po", "bom"} tables as {"rows": n,
+            "columns": {name: encoded column}}, the dropdown values, the PID
+            join keys, the plotly template the server figures use and the
+            rollup thresholds of po_rollups.py.
+        """
+        if self._snapshot is None:
+            tables = {
+                name: {"rows": len(df), "columns": {c: _encode(df[c]) for c in df.columns}}
+                for name, df in (("vendors", self.vendors), ("po", self.po), ("bom", self.bom))
+            }
+            self._snapshot = {
+                "version": self.version,
+                **tables,
+                "bom_part_names": self.bom_part_names,
+                "pids_by_part": self.pids_by_part,
+                "pids_by_bom": self.pids_by_bom,
+                "parts_by_bom": self.parts_by_bom,
+                "template": pio.templates[pio.templates.default].to_plotly_json(),
+                "limits": {
+                    "map_detail_rows": DASHBOARD_MAP_DETAIL_ROWS,
+                    "timeline_max_points": DASHBOARD_TIMELINE_MAX_POINTS,
+                },
+            }
+        return self._snapshot
+
+    # ------------------------------------------------------------ join keys
+    def pids_for_parts(self, part_names) -> list:
+        """Vendor-database PIDs of the given part names."""
+        return list(dict.fromkeys(pid for p in part_names for pid in self.pids_by_part.get(p, [])))
+
+    def pids_for_boms(self, bom_names) -> list:
+        """BOM PIDs of the given BOM part names."""
+        return list(dict.fromkeys(pid for b in bom_names for pid in self.pids_by_bom.get(b, [])))
+
+    def parts_for_boms(self, bom_names) -> list:
+        """Vendor-database part names linked (by PID) to the given BOM part names."""
+        return list(dict.fromkeys(p for b in bom_names for p in self.parts_by_bom.get(b, [])))
+
+    def bom_names(self, part_names=None) -> list:
+        """BOM part names, optionally restricted to the PIDs of the given vendor-database part names."""
+        if not part_names:
+            return list(self.bom_part_names)
+        rows = isin(self.bom["Part ID (PID)"], self.pids_for_parts(part_names))
+        return _names(self.bom["Part Name"][rows])
+
+    def po_vendors(self, months=None) -> list:
+        """Vendors with purchase orders in the given months (all months when empty)."""
+        return self.cube.po_vendors(months)
+
+
+_models: dict = {}
+_models_lock = threading.Lock()
+
+
+def get_supply_chain_model(bom_csv=CATALOG_BOM_CSV, po_csv=CATALOG_PO_CSV, vendor_csv=CATALOG_VENDOR_CSV) -> SupplyChainModel:
+    """The model of the given CSVs, rebuilt only when one of them changed."""
+    key = tuple(file_version(str(p)) for p in (bom_csv, po_csv, vendor_csv))
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                previous = next(iter(_models.values()), None)
+                model = SupplyChainModel(read_table(vendor_csv, build=True), read_table(po_csv, build=True),
+                                         read_table(bom_csv, build=True), version="|".join(map(str, key)),
+                                         cube=previous.cube if previous is not None else None)
+                _models.clear()  # one version at a time
+                _models[key] = model
+                log.info(f"Built supply chain model: {len(model.vendors)} vendor rows, {len(model.po)} POs, {len(model.bom)} BOM rows")
+    return model
@@ -0,0 +1,179 @@
+"""
+Table question answering (TAPAS) engine for the demo chatbot.
+
+One engine per process is shared by all requests (`get_table_qa`). The
+model is loaded lazily on the first question, from TABLE_QA_CACHE_DIR, in
+the variant selected by config.TABLE_QA_VARIANT:
+
+  * "fp32": the original weights.
+  * "int8": Linear layers dynamically quantized to int8 (torch
+    `quantize_dynamic`); about 4x smaller and 2-3x faster on CPU with
+    near-identical answers. The quantized weights are saved to the cache
+    directory, so later loads (and other workers) skip the fp32 checkpoint.
+
+`fits` tells whether a question and table fit in TAPAS's input
+(TABLE_QA_MAX_TOKENS, measured with the model's own tokenizer, which is
+loaded separately from the model); the pipeline silently truncates tables
+that do not.
+
+Inference runs on a dedicated thread pool of TABLE_QA_WORKERS threads; at
+most TABLE_QA_MAX_PENDING questions may be queued or running, further ones
+fail fast with `TableQABusyError` instead of piling up behind the model.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from config import (
+    TABLE_QA_MODEL, TABLE_QA_VARIANT, TABLE_QA_CACHE_DIR, TABLE_QA_WORKERS,
+    TABLE_QA_MAX_PENDING, TABLE_QA_TORCH_THREADS, TABLE_QA_MAX_TOKENS,
+)
+
+log = logging.getLogger("table_qa")
+
+VARIANTS = ("fp32", "int8")
+
+
+class TableQABusyError(RuntimeError):
+    """Raised when the inference queue is full."""
+
+
+class TableQAEngine:
+    """A lazily loaded TAPAS pipeline with a bounded inference queue."""
+
+    def __init__(self, model_name: str = TABLE_QA_MODEL, variant: str = TABLE_QA_VARIANT, cache_dir: str = TABLE_QA_CACHE_DIR,
+                 workers: int = TABLE_QA_WORKERS, max_pending: int = TABLE_QA_MAX_PENDING):
+        if variant not in VARIANTS:
+            raise ValueError(f"Unknown TABLE_QA_VARIANT {variant!r}, expected one of {VARIANTS}")
+        self.model_name = model_name
+        self.variant = variant
+        self.cache_dir = cache_dir
+        self.max_pending = max_pending
+        self._pipeline = None
+        self._tokenizer = None
+        self._load_lock = threading.RLock()  # load() takes it again through tokenizer()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="table-qa")
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+    def _quantized_path(self) -> str:
+        return os.path.join(self.cache_dir, self.model_name.replace("/", "--") + "-int8.pt")
+
+    def _load_model(self):
+        import torch
+        from transformers import AutoConfig, AutoModelForTableQuestionAnswering
+
+        if self.variant == "fp32":
+            return AutoModelForTableQuestionAnswering.from_pretrained(self.model_name, cache_dir=self.cache_dir)
+
+        path = self._quantized_path()
+        if os.path.exists(path):
+            config = AutoConfig.from_pretrained(self.model_name, cache_dir=self.cache_dir)
+            model = torch.quantization.quantize_dynamic(
+                AutoModelForTableQuestionAnswering.from_config(config), {torch.nn.Linear}, dtype=torch.qint8
+            )
+            model.load_state_dict(torch.load(path))
+            return model
+
+        model = AutoModelForTableQuestionAnswering.from_pretrained(self.model_name, cache_dir=self.cache_dir)
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        torch.save(model.state_dict(), tmp)
+        os.replace(tmp, path)
+        return model
+
+    def tokenizer(self):
+        """The model's tokenizer (loaded once, without the model)."""
+        if self._tokenizer is not None:
+            return self._tokenizer
+        with self._load_lock:
+            if self._tokenizer is None:
+                from transformers import AutoTokenizer
+
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._tokenizer = AutoTokenizer.from_pretrained(self.model_name, cache_dir=self.cache_dir)
+        return self._tokenizer
+
+    def fits(self, table: pd.DataFrame, query: str, max_tokens: int = TABLE_QA_MAX_TOKENS) -> bool:
+        """
+        Whether `query` and `table` fit in TAPAS's input without truncation.
+
+        Every cell takes at least one token (empty cells are [EMPTY]), so
+        tables with more cells than `max_tokens` are rejected without
+        tokenizing them.
+        """
+        if table.size > max_tokens:
+            return False
+        encoding = self.tokenizer()(table=table, queries=query, truncation=False, padding=False)
+        return len(encoding["input_ids"]) <= max_tokens
+
+    def load(self):
+        """Loads the model and tokenizer (once) and returns the pipeline."""
+        if self._pipeline is not None:
+            return self._pipeline
+        with self._load_lock:
+            if self._pipeline is None:
+                import torch
+                from transformers import pipeline
+
+                started = time.perf_counter()
+                os.makedirs(self.cache_dir, exist_ok=True)
+                if TABLE_QA_TORCH_THREADS:
+                    torch.set_num_threads(TABLE_QA_TORCH_THREADS)
+                model = self._load_model()
+                model.eval()
+                self._pipeline = pipeline(
+                    "table-question-answering",
+                    model=model,
+                    tokenizer=self.tokenizer(),
+                    device=-1,  # CPU
+                )
+                log.info(f"Loaded {self.model_name} ({self.variant}) in {time.perf_counter() - started:.1f}s")
+        return self._pipeline
+
+    def _run(self, table: pd.DataFrame, query: str) -> dict:
+        import torch
+
+        qa = self.load()
+        with torch.inference_mode():
+            return qa(table=table, query=query)
+
+    async def answer(self, table: pd.DataFrame, query: str) -> dict:
+        """
+        Answers `query` over `table` without blocking the event loop.
+
+        Args:
+            table (pd.DataFrame): The table, all columns as strings.
+            query (str): The question.
+
+        Returns:
+            dict: The pipeline result (`answer`, `coordinates`, `cells`, ...).
+
+        Raises:
+            TableQABusyError: When TABLE_QA_MAX_PENDING questions are already queued or running.
+        """
+        if not self._pending.acquire(blocking=False):
+            raise TableQABusyError(f"Table QA queue is full ({self.max_pending} pending questions).")
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._run, table, query)
+        finally:
+            self._pending.release()
+
+
+_engine: TableQAEngine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_table_qa() -> TableQAEngine:
+    """The process-wide table QA engine (the model itself loads on first use)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = TableQAEngine()
+        return _engine
@@ -0,0 +1,115 @@
+"""
+Row / column pre-filter for table question answering.
+
+TAPAS reads at most TABLE_QA_MAX_TOKENS tokens (question + table), so on
+larger sheets it silently drops rows and its cost grows with the table.
+`TableIndex` is built once per dataset (BM25 over one document per row,
+plus the tokens of every column name and value) and `select` cuts the table
+down to what the query is about, only as far as needed to fit:
+
+  * tables that fit are passed whole;
+  * columns: the identifier columns (the first one and any "... Name") plus
+    the columns the query mentions by name or by one of their values
+    ("physiotherapy" keeps Therapy Type); all columns when none are
+    mentioned;
+  * rows: the top BM25 rows for the query, in table order, as many as fit
+    (at most TABLE_QA_MAX_ROWS).
+
+Table-level questions ("how many patients are over 60", "average age"),
+filter / set questions ("which patients are above 60", "list all patients
+with diabetes") and queries that match no row need every row, so they are
+never row-sliced: when even their columns do not fit, `select` returns None
+and the caller answers them exactly (query_router.py) or passes the full
+table.
+
+Whether a table fits is decided by the caller's `fits` predicate
+(table_qa.TableQAEngine.fits tokenizes it with the model's tokenizer).
+"""
+
+import re
+
+import pandas as pd
+
+from config import TABLE_QA_MAX_ROWS
+from query_router import COMPARE_RE
+from text_search import BM25Index, stem, tokenize
+
+AGGREGATE_RE = re.compile(
+    r"\b(how many|count|number of|average|avg|mean|median|total|sum|max|maximum|min|minimum|highest|lowest|"
+    r"oldest|youngest|most|least)\b", re.I
+)
+SET_RE = re.compile(r"\b(which|who|whose|list|all|every|any|each)\b", re.I)
+_WORD_RE = re.compile(r"[a-z]")
+
+
+def is_table_level(query: str) -> bool:
+    """Whether answering `query` needs every row (aggregates, filters and sets of rows)."""
+    return bool(AGGREGATE_RE.search(query) or SET_RE.search(query) or COMPARE_RE.search(query))
+
+
+class TableIndex:
+    """String view of a table with a BM25 index over its rows and the tokens of its column names."""
+
+    def __init__(self, table: pd.DataFrame):
+        self.table = table
+        self.bm25 = BM25Index([tokenize(" ".join(row)) for row in self.table.itertuples(index=False, name=None)])
+        self.column_tokens = {col: {stem(t) for t in tokenize(str(col))} for col in self.table.columns}
+        # Word tokens of each column's values (numbers and dates would tie a query to most numeric columns)
+        self.value_tokens = {
+            col: {stem(t) for v in self.table[col].unique() for t in tokenize(str(v)) if _WORD_RE.search(t)}
+            for col in self.table.columns
+        }
+
+    def relevant_columns(self, query_tokens: set) -> list:
+        """Identifier columns (the first column and any "... Name" column) plus the columns the query names or quotes a value of."""
+        cols = list(self.table.columns)
+        identifiers = {cols[0], *(c for c in cols if "name" in self.column_tokens[c])}
+        mentioned = [
+            c for c in cols
+            if c not in identifiers and (self.column_tokens[c] & query_tokens or self.value_tokens[c] & query_tokens)
+        ]
+        if not mentioned:
+            return cols
+        keep = identifiers.union(mentioned)
+        return [c for c in cols if c in keep]
+
+    def select(self, query: str, fits, max_rows: int = TABLE_QA_MAX_ROWS) -> pd.DataFrame | None:
+        """
+        Slice of the table relevant to `query`.
+
+        Args:
+            query (str): The (contextualized) question.
+            fits (Callable[[pd.DataFrame], bool]): Whether a table (with the
+                question) fits in the model's input.
+            max_rows (int): Maximum rows kept when rows match the query.
+
+        Returns:
+            pd.DataFrame | None: The selected rows and columns, all values as
+            strings, with a fresh RangeIndex (as TAPAS expects); None when
+            the query needs every row (see `is_table_level`) and even its
+            columns do not fit.
+        """
+        if fits(self.table):
+            return self.table
+        query_tokens = tokenize(query)
+        cols = self.relevant_columns({stem(t) for t in query_tokens})
+
+        matched = []
+        if not is_table_level(query):
+            scores = self.bm25.scores(query_tokens)
+            matched = [i for i, s in enumerate(scores) if s > 0]
+        if not matched:
+            table = self.table[cols]
+            return table if fits(table) else None
+
+        top = sorted(matched, key=lambda i: -scores[i])[:max_rows]
+        while True:  # drop the lowest-scoring rows until the slice fits
+            table = self.table.iloc[sorted(top)][cols].reset_index(drop=True)
+            if len(top) == 1 or fits(table):
+                return table
+            top = top[:max(1, len(top) * 3 // 4)]
+
+
+def get_table_index(dataset) -> TableIndex:
+    """Index of a dataset_cache.Dataset, built once per dataset version."""
+    return dataset.derived("table_index", lambda: TableIndex(dataset.string_view))
@@ -0,0 +1,63 @@
+"""
+Text helpers shared by the lexical retrieval modules (retrieval.py for the
+manufacturing chat, table_retrieval.py and query_router.py for the demo
+chat): word tokenization, light stemming and an Okapi BM25 index.
+"""
+
+import math
+import re
+from collections import Counter
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+_SPLIT_RE = re.compile(r"[-./]")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can could do for from give how i in is it me my of on or please "
+    "show tell that the this to was what when where which who why with would you".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased word tokens; compound IDs (FA-2024-001, 8/9/2025) are kept whole and also split."""
+    out = []
+    for t in _TOKEN_RE.findall(text.lower()):
+        if t in STOPWORDS:
+            continue
+        out.append(t)
+        if _SPLIT_RE.search(t):
+            out.extend(p for p in _SPLIT_RE.split(t) if p)
+    return out
+
+
+def stem(token: str) -> str:
+    """Drops a plural "s" (patients -> patient); short words are kept as they are."""
+    return token[:-1] if len(token) > 3 and token.endswith("s") else token
+
+
+class BM25Index:
+    """Okapi BM25 over pre-tokenized documents."""
+
+    def __init__(self, docs: list[list[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self.n_docs = len(docs)
+        self.doc_len = [len(d) for d in docs]
+        self.avgdl = (sum(self.doc_len) / self.n_docs) if self.n_docs else 0.0
+        self.postings: dict[str, list[tuple[int, int]]] = {}
+        for i, d in enumerate(docs):
+            for term, tf in Counter(d).items():
+                self.postings.setdefault(term, []).append((i, tf))
+        self.idf = {
+            term: math.log(1 + (self.n_docs - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+
+    def scores(self, query_tokens: list[str]) -> list[float]:
+        scores = [0.0] * self.n_docs
+        for term in set(query_tokens):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[i] / (self.avgdl or 1))
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
@@ -0,0 +1,42 @@
+"""
+Token counting for prompt budgets.
+
+Uses tiktoken's `o200k_base` encoding (the gpt-4o family) when it is
+installed and its vocabulary can be loaded; otherwise falls back to the
+usual ~4 characters per token estimate.
+"""
+
+import threading
+
+_encoder = None
+_encoder_loaded = False
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        with _encoder_lock:
+            if not _encoder_loaded:
+                try:
+                    import tiktoken
+                    _encoder = tiktoken.get_encoding("o200k_base")
+                except Exception:
+                    _encoder = None
+                _encoder_loaded = True
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in `text`."""
+    if not text:
+        return 0
+    enc = _get_encoder()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def count_message_tokens(messages: list[dict]) -> int:
+    """Prompt tokens of a chat message list, including the per-message framing overhead."""
+    return sum(count_tokens(m.get("content") or "") + 4 for m in messages) + 2
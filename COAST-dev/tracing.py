@@ -0,0 +1,197 @@
+"""
+Per-request tracing and metrics for the chat pipelines.
+
+A chat request runs inside `trace(pipeline)`; each stage inside it runs
+inside `span(stage)`:
+
+    with trace("manufacturing"):
+        with span("retrieval"):
+            ...
+
+Spans record their duration on the request's trace and in the
+`coast_chat_stage_seconds{pipeline, stage}` summary. LLM token usage
+(`record_tokens`, called by llm_client) and cache lookups (`record_cache`,
+called by the response and dataset caches) are attached to the current
+trace and counted as well.
+
+`render_metrics` renders every metric in the Prometheus text exposition
+format (GET /metrics). Summaries report p50 / p95 / p99 over the last
+METRICS_WINDOW observations of each series. `recent_traces` returns the
+last finished traces (GET /metrics/traces). Metrics are per process.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+from config import METRICS_WINDOW, TRACE_HISTORY
+
+log = logging.getLogger("tracing")
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+HELP = {
+    "coast_chat_request_seconds": ("summary", "End-to-end chat request latency."),
+    "coast_chat_stage_seconds": ("summary", "Latency of each chat pipeline stage."),
+    "coast_chat_ttft_seconds": ("summary", "Time to first streamed token."),
+    "coast_llm_tokens_total": ("counter", "LLM tokens used, by kind (prompt / completion)."),
+    "coast_cache_lookups_total": ("counter", "Cache lookups, by cache and result (hit / miss)."),
+    "coast_coalesce_calls_total": ("counter", "Coalesced calls, by coalescer and role (leader ran the work / waiter shared it)."),
+    "coast_coalesce_waiters": ("summary", "Callers that shared one in-flight call, per coalescer."),
+}
+
+_current: contextvars.ContextVar = contextvars.ContextVar("coast_trace", default=None)
+_lock = threading.Lock()
+_summaries: dict = {}  # (name, labels) -> [count, sum, deque of recent values]
+_counters: dict = {}  # (name, labels) -> value
+_traces: deque = deque(maxlen=TRACE_HISTORY)
+
+
+def _labels(**labels) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """Adds an observation to the summary `name`."""
+    key = (name, _labels(**labels))
+    with _lock:
+        entry = _summaries.get(key)
+        if entry is None:
+            entry = _summaries[key] = [0, 0.0, deque(maxlen=METRICS_WINDOW)]
+        entry[0] += 1
+        entry[1] += value
+        entry[2].append(value)
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    """Increments the counter `name`."""
+    key = (name, _labels(**labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+class Trace:
+    """Stages, token usage and cache lookups of one request."""
+
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self.started = time.time()
+        self.spans: list[tuple[str, float]] = []
+        self.tokens = {"prompt": 0, "completion": 0}
+        self.cache: list[tuple[str, bool]] = []
+        self.total_ms = None
+
+    def as_dict(self) -> dict:
+        return {
+            "pipeline": self.pipeline,
+            "started": self.started,
+            "total_ms": self.total_ms,
+            "spans": [{"stage": s, "ms": round(ms, 1)} for s, ms in self.spans],
+            "tokens": dict(self.tokens),
+            "cache": [{"cache": c, "hit": h} for c, h in self.cache],
+        }
+
+
+def current_trace() -> Trace | None:
+    return _current.get()
+
+
+@contextmanager
+def trace(pipeline: str):
+    """Traces one request of `pipeline` ("demo", "manufacturing")."""
+    t = Trace(pipeline)
+    token = _current.set(t)
+    started = time.perf_counter()
+    try:
+        yield t
+    finally:
+        elapsed = time.perf_counter() - started
+        t.total_ms = round(elapsed * 1000, 1)
+        observe("coast_chat_request_seconds", elapsed, pipeline=pipeline)
+        with _lock:
+            _traces.append(t)
+        log.info(f"{pipeline} request {t.total_ms:.0f} ms: " + ", ".join(f"{s}={ms:.0f}ms" for s, ms in t.spans))
+        try:
+            _current.reset(token)
+        except ValueError:  # finished in another context (e.g. a closed stream)
+            _current.set(None)
+
+
+@contextmanager
+def span(stage: str):
+    """Times one stage of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        t = _current.get()
+        pipeline = t.pipeline if t else "none"
+        if t is not None:
+            t.spans.append((stage, elapsed * 1000))
+        observe("coast_chat_stage_seconds", elapsed, pipeline=pipeline, stage=stage)
+
+
+def record_tokens(prompt_tokens: int | None, completion_tokens: int | None) -> None:
+    t = _current.get()
+    pipeline = t.pipeline if t else "none"
+    for kind, n in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+        if n:
+            inc("coast_llm_tokens_total", n, pipeline=pipeline, kind=kind)
+            if t is not None:
+                t.tokens[kind] += n
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    inc("coast_cache_lookups_total", cache=cache, result="hit" if hit else "miss")
+    t = _current.get()
+    if t is not None:
+        t.cache.append((cache, hit))
+
+
+def record_ttft(pipeline: str, seconds: float) -> None:
+    observe("coast_chat_ttft_seconds", seconds, pipeline=pipeline)
+    log.info(f"{pipeline} time to first token: {seconds * 1000:.0f} ms")
+
+
+def recent_traces() -> list[dict]:
+    with _lock:
+        return [t.as_dict() for t in _traces]
+
+
+def _fmt_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        summaries = {k: (v[0], v[1], list(v[2])) for k, v in _summaries.items()}
+        counters = dict(_counters)
+
+    lines = []
+    names = sorted({k[0] for k in summaries} | {k[0] for k in counters})
+    for name in names:
+        kind, text = HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (n, labels), (count, total, window) in sorted(summaries.items()):
+            if n != name:
+                continue
+            qs = np.quantile(window, QUANTILES) if window else [float("nan")] * len(QUANTILES)
+            for q, v in zip(QUANTILES, qs):
+                lines.append(f"{name}{_fmt_labels(labels, (('quantile', q),))} {v:.6f}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {count}")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_fmt_labels(labels)} {value:g}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,153 @@
+"""
+Deterministic vendor scoring for the manufacturing chat.
+
+Implements the weighted criteria of prompt_template_file.txt locally so
+the LLM only writes up a precomputed ranking instead of deriving scores
+from raw text:
+
+    Quality          40%  Quality % and Rating (A+ > A > B ...)
+    Timeliness       30%  On-Time % and Avg Days (fewer is better)
+    Cost / Lead time 20%  unit cost from purchase orders and PO lead time
+                          against the BOM lead time (lower is better)
+    Experience       10%  number of Orders
+
+Every criterion is scaled to 0-100 within the vendors of the part, and the
+whole table is computed with vectorized pandas / NumPy operations.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+WEIGHTS = {"Quality": 0.40, "Timeliness": 0.30, "Cost/Lead": 0.20, "Experience": 0.10}
+RATING_SCORES = {"A+": 100, "A": 90, "A-": 85, "B+": 80, "B": 70, "B-": 65, "C+": 60, "C": 50, "D": 30}
+
+# Vendor selection / ranking intent: an explicit recommendation or ranking, or a choosing word in the same
+# sentence as "vendor" / "supplier" ("who is the vendor of ..." is a lookup, not a selection)
+_SUPPLIER = r"\b(?:vendors?|suppliers?)\b"
+_CHOOSING = r"\b(?:best|top|cheapest|fastest|preferred|compar\w*|choose|choosing|select\w*|pick|score\w*|should)\b"
+VENDOR_INTENT_RE = re.compile(
+    rf"\b(?:recommend\w*|rank\w*|shortlist\w*)\b|{_CHOOSING}[^.?!]*{_SUPPLIER}|{_SUPPLIER}[^.?!]*{_CHOOSING}", re.I
+)
+PID_RE = re.compile(r"\b[A-Z]{2}-\d{4}-\d{3}(?:-\d{2})?\b", re.I)
+_RESOLVED_PN_RE = re.compile(r"^Resolved Part Number:\s*(\S+)", re.M)
+_LEAD_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:-\s*(\d+(?:\.\d+)?))?\s*(day|week|month)", re.I)
+_UNIT_DAYS = {"day": 1, "week": 7, "month": 30}
+
+
+def is_vendor_query(query: str) -> bool:
+    return bool(VENDOR_INTENT_RE.search(query))
+
+
+def resolve_part_id(*texts: str) -> str | None:
+    """First PID mentioned in the given texts (query, history), or the report's resolved part number."""
+    for text in texts:
+        if not text:
+            continue
+        m = PID_RE.search(text)
+        if m:
+            return m.group(0).upper()
+        m = _RESOLVED_PN_RE.search(text)
+        if m and m.group(1) != "(not":
+            return m.group(1)
+    return None
+
+
+def lead_time_days(values: pd.Series) -> pd.Series:
+    """'3-4 weeks' -> 28.0, '3 days' -> 3.0 (upper bound of a range); NaN when unparseable."""
+    parts = values.astype(str).str.extract(_LEAD_RE)
+    upper = pd.to_numeric(parts[1].fillna(parts[0]), errors="coerce")
+    return upper * parts[2].str.lower().map(_UNIT_DAYS)
+
+
+def _higher_better(x: pd.Series) -> pd.Series:
+    top = x.max()
+    if not top > 0:
+        return pd.Series(100.0, index=x.index)
+    return (x / top * 100).fillna(50.0)
+
+
+def _lower_better(x: pd.Series) -> pd.Series:
+    low = x[x > 0].min()
+    return (low / x * 100).where(x > 0).clip(upper=100).fillna(50.0)
+
+
+def score_vendors(vendors: pd.DataFrame, purchase_orders: pd.DataFrame, bom: pd.DataFrame) -> pd.DataFrame:
+    """
+    Scores and ranks the vendors of one part.
+
+    Args:
+        vendors (pd.DataFrame): Vendor-database rows of the part.
+        purchase_orders (pd.DataFrame): PO rows of the part (`Amount ($)` numeric, as
+            returned by CatalogStore.purchase_orders).
+        bom (pd.DataFrame): BOM rows of the part.
+
+    Returns:
+        pd.DataFrame: One row per vendor, best first, with the four criterion
+        scores, the weighted `Overall` score (0-100 integer) and the inputs used.
+    """
+    v = pd.DataFrame({
+        "Vendor": vendors["Vendor Name"].astype(str).str.strip(),
+        "Quality %": pd.to_numeric(vendors["Quality %"], errors="coerce"),
+        "Rating": vendors["Rating"].astype(str).str.strip(),
+        "On-Time %": pd.to_numeric(vendors["On-Time %"], errors="coerce"),
+        "Avg Days": pd.to_numeric(vendors["Avg Days"], errors="coerce"),
+        "Orders": pd.to_numeric(vendors["Orders"], errors="coerce"),
+    }).groupby("Vendor", as_index=False, sort=False).agg(
+        {"Quality %": "mean", "Rating": "first", "On-Time %": "mean", "Avg Days": "mean", "Orders": "sum"}
+    )
+
+    po = pd.DataFrame({
+        "Vendor": purchase_orders["Vendor"].astype(str).str.strip(),
+        "Amount": pd.to_numeric(purchase_orders["Amount ($)"], errors="coerce"),
+        "Qty": pd.to_numeric(purchase_orders["Qty Ordered"], errors="coerce"),
+        "PO Days": (
+            pd.to_datetime(purchase_orders["Expected Delivery"], errors="coerce")
+            - pd.to_datetime(purchase_orders["Date"], errors="coerce")
+        ).dt.days,
+    })
+    po_stats = po.groupby("Vendor").agg(Amount=("Amount", "sum"), Qty=("Qty", "sum"), PO_Days=("PO Days", "mean"))
+    v = v.join(po_stats, on="Vendor")
+    v["Unit Cost"] = v["Amount"] / v["Qty"].replace(0, np.nan)
+
+    bom_lead = lead_time_days(bom["Lead Time"]).max() if "Lead Time" in bom and len(bom) else np.nan
+    v["BOM Lead Days"] = bom_lead
+    lead_score = (bom_lead / v["PO_Days"] * 100).clip(upper=100) if pd.notna(bom_lead) else _lower_better(v["PO_Days"])
+
+    v["Quality"] = 0.5 * v["Quality %"].fillna(0) + 0.5 * v["Rating"].map(RATING_SCORES).fillna(40)
+    v["Timeliness"] = 0.5 * v["On-Time %"].fillna(0) + 0.5 * _lower_better(v["Avg Days"])
+    v["Cost/Lead"] = 0.5 * _lower_better(v["Unit Cost"]) + 0.5 * lead_score.fillna(50.0)
+    v["Experience"] = _higher_better(v["Orders"].fillna(0))
+
+    v["Overall"] = sum(v[k] * w for k, w in WEIGHTS.items()).round().astype(int)
+    return v.sort_values(["Overall", "Quality"], ascending=False, ignore_index=True)
+
+
+def rank_part_vendors(store, pid: str) -> pd.DataFrame | None:
+    """Vendor ranking for `pid` from the catalog store; sub-components fall back to their assembly's vendors."""
+    cur = pid
+    while True:
+        vendors = store.vendors_for_part(cur)
+        if len(vendors) or "-" not in cur:
+            break
+        cur = cur.rsplit("-", 1)[0]
+    if vendors.empty:
+        return None
+    return score_vendors(vendors, store.purchase_orders(pids=[cur]), store.bom_rows(cur))
+
+
+def format_scores(pid: str, scores: pd.DataFrame) -> str:
+    """Compact Markdown table of a ranking, for the LLM write-up."""
+    cols = ["Vendor", "Overall", "Quality", "Timeliness", "Cost/Lead", "Experience",
+            "Quality %", "Rating", "On-Time %", "Avg Days", "Unit Cost", "Orders"]
+    lines = [
+        f"## Precomputed Vendor Scores for {pid}",
+        "Computed with the scoring criteria (Quality 40%, Timeliness 30%, Cost/Lead time 20%, Experience 10%). "
+        "Use these scores and this order as-is for any vendor ranking; do not recompute them.",
+        "| " + " | ".join(cols) + " |",
+        "|" + "---|" * len(cols),
+    ]
+    for row in scores[cols].itertuples(index=False):
+        lines.append("| " + " | ".join("-" if pd.isna(x) else (f"{x:.1f}" if isinstance(x, float) else str(x)) for x in row) + " |")
+    return "\n".join(lines)